@@ -1,139 +1,48 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import uuid
-from io import BytesIO
-import base64
-import boto3
-import json
-import requests
 from dotenv import load_dotenv
-import threading
-import uvicorn
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from fastapi.middleware.cors import CORSMiddleware
-import boto3
-from botocore.exceptions import ClientError
-from io import BytesIO
-import uuid
+from debug_panel import show_debug_panel
+from session_pipeline import get_run
+from stt_pipeline import Pipeline
+from stt_pipeline.api import create_app, serve_in_background
+from stt_pipeline.client import APIClient
+from stt_pipeline.streamlit_ui import rerun_while, seek_time, show_pipeline, streamlit_settings
 
 # Load environment variables
 load_dotenv()
 
-# Initialize AWS clients
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-    region_name=st.secrets["AWS_REGION"]
-)
-
-transcribe_client = boto3.client('transcribe', region_name=st.secrets["AWS_REGION"])
-bucket_name = st.secrets["AWS_S3_BUCKET_NAME"]
-
-bedrock_client = boto3.client(
-    'bedrock-runtime',
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-    region_name="us-east-1"
-)
-
-model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
-
-# FastAPI app
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["https://stt-poc.streamlit.app/", "*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-class AudioRequest(BaseModel):
-    audio: str
-
-def upload_to_s3(audio_data, file_name):
-    s3_client.upload_fileobj(audio_data, bucket_name, file_name)
-
-def transcribe_audio(file_name):
-    job_name = f"transcribe-job-{uuid.uuid4()}"
-    s3_uri = f"s3://{bucket_name}/{file_name}"
-
-    try:
-        transcribe_client.start_transcription_job(
-            TranscriptionJobName=job_name,
-            Media={'MediaFileUri': s3_uri},
-            MediaFormat='wav',
-            LanguageCode='en-US'
-        )
-
-        while True:
-            result = transcribe_client.get_transcription_job(TranscriptionJobName=job_name)
-            status = result['TranscriptionJob']['TranscriptionJobStatus']
-            if status in ['COMPLETED', 'FAILED']:
-                break
-
-        if status == 'COMPLETED':
-            transcript_file_uri = result['TranscriptionJob']['Transcript']['TranscriptFileUri']
-            transcript = requests.get(transcript_file_uri).json()
-            return transcript['results']['transcripts'][0]['transcript']
-        else:
-            return "Transcription failed."
-
-    except Exception as e:
-        return str(e)
-
-def summarize_text(text):
-    init_sum = "Below provided are some meeting notes. Read through the notes, understand key take aways and summarize the meeting notes: "
-    conversation = [
-        {
-            "role": "user",
-            "content": [{"text": init_sum + text}],
-        }
-    ]
-
-    try:
-        # Send the message to the model, using a basic inference configuration.
-        response = bedrock_client.converse(
-            modelId="amazon.titan-text-express-v1",
-            messages=conversation,
-            inferenceConfig={"maxTokens":4096,"stopSequences":["User:"],"temperature":0,"topP":1},
-            additionalModelRequestFields={}
-        )
-
-        # Extract and print the response text.
-        response_text = response["output"]["message"]["content"][0]["text"]
-        print(response_text)
-        
-        return response_text
-    except (ClientError, Exception) as e:
-        print(f"ERROR: Can't invoke '{model_id}'. Reason: {e}")
-
-
-
-@app.post("/transcribe")
-async def transcribe(request: AudioRequest):
-    audio_base64 = request.audio
-    audio_bytes = BytesIO(base64.b64decode(audio_base64))
-    file_name = f"audio/{uuid.uuid4()}.wav"
-    upload_to_s3(audio_bytes, file_name)
-    
-    transcript = transcribe_audio(file_name)
-    summary = summarize_text(transcript)
-    
-    return JSONResponse(content={
-        "transcript": transcript,
-        "summary": summary
-    })
-
-def run_fastapi():
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-
-# Start FastAPI server in a separate thread
-threading.Thread(target=run_fastapi, daemon=True).start()
+# Shared by every session and the API; its clients, tracker, caches and
+# backends are created on first use.
+# Titan Text Express has an 8k token context, so keep chunks small
+@st.cache_resource
+def get_pipeline():
+    return Pipeline(streamlit_settings(
+        model_id="amazon.titan-text-express-v1",
+        inference_config={"maxTokens":4096,"stopSequences":["User:"],"temperature":0,"topP":1},
+        additional_fields=None,
+        chunk_tokens=3000,
+        summary_prompt="Below provided are some meeting notes. Read through the notes, understand key take aways and summarize the meeting notes: "
+    ))
+
+# FastAPI app, served on API_PORT from a background thread started once per process
+@st.cache_resource
+def get_api():
+    api = create_app(get_pipeline())
+    serve_in_background(api, port=get_pipeline().settings.api_port)
+    return api
+
+# Client for a standalone server (python -m stt_pipeline.server) at API_URL
+@st.cache_resource
+def get_api_client(base_url):
+    return APIClient(base_url, workers=get_pipeline().settings.pipeline_workers)
+
+# With API_URL set the UI only talks to that server and nothing else runs
+# here; otherwise the pipeline and its API run in this process
+if get_pipeline().settings.api_url:
+    pipeline = get_api_client(get_pipeline().settings.api_url)
+else:
+    pipeline = get_pipeline()
+    app = get_api()
 
 # Streamlit UI
 st.markdown(
@@ -173,63 +82,132 @@ html_code = """
 <div></div>
 <audio id="audioPlayback" controls></audio>
 <div></div>
+<div id="liveTranscript"></div>
 <div id="transcript"></div>
 
 <script>
+    const API_BASE = '__API_BASE_URL__';
     let mediaRecorder;
     let audioChunks = [];
+    let liveSocket, audioContext, processor;
+    let liveSegments = {};
+    let uploadId = null;
+    let uploadChain = Promise.resolve();
+
+    // Chunks are sent one at a time and in order; any failure drops back to a
+    // single POST of the whole recording when it stops
+    function startUpload(mimeType) {
+        uploadId = null;
+        uploadChain = fetch(API_BASE + '/uploads?content_type=' + encodeURIComponent(mimeType), { method: 'POST' })
+            .then(response => response.ok ? response.json() : {})
+            .then(data => { uploadId = data.upload_id || null; })
+            .catch(() => { uploadId = null; });
+    }
+
+    function uploadChunk(chunk) {
+        uploadChain = uploadChain
+            .then(() => uploadId && fetch(API_BASE + '/uploads/' + uploadId, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: chunk
+            }))
+            .then(response => { if (response && !response.ok) uploadId = null; })
+            .catch(() => { uploadId = null; });
+    }
+
+    // Stream 16-bit PCM to the server while recording and show segments as they arrive
+    function startLiveTranscription(stream) {
+        audioContext = new AudioContext({ sampleRate: 16000 });
+        const source = audioContext.createMediaStreamSource(stream);
+        processor = audioContext.createScriptProcessor(4096, 1, 1);
+        liveSegments = {};
+        liveSocket = new WebSocket(API_BASE.replace(/^http/, 'ws') + '/ws/transcribe?sample_rate=' + audioContext.sampleRate);
+        liveSocket.onmessage = event => {
+            const segment = JSON.parse(event.data);
+            liveSegments[segment.start] = segment.text;
+            document.getElementById('liveTranscript').innerText = Object.keys(liveSegments)
+                .sort((a, b) => a - b)
+                .map(start => liveSegments[start])
+                .join(' ');
+        };
+        processor.onaudioprocess = event => {
+            if (liveSocket.readyState !== WebSocket.OPEN) return;
+            const input = event.inputBuffer.getChannelData(0);
+            const pcm = new Int16Array(input.length);
+            for (let i = 0; i < input.length; i++) {
+                const sample = Math.max(-1, Math.min(1, input[i]));
+                pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7FFF;
+            }
+            liveSocket.send(pcm.buffer);
+        };
+        source.connect(processor);
+        processor.connect(audioContext.destination);
+    }
+
+    function stopLiveTranscription() {
+        if (processor) processor.disconnect();
+        if (audioContext) audioContext.close();
+        if (liveSocket && liveSocket.readyState === WebSocket.OPEN) liveSocket.send('stop');
+    }
 
     document.getElementById('recordButton').addEventListener('click', () => {
         navigator.mediaDevices.getUserMedia({ audio: true })
             .then(stream => {
                 console.log("Microphone access granted");
                 mediaRecorder = new MediaRecorder(stream);
-                mediaRecorder.start();
-                console.log("Recording started");
                 audioChunks = [];
+                startUpload(mediaRecorder.mimeType);
+                // A chunk every second so the upload keeps pace with the recording
+                mediaRecorder.start(1000);
+                startLiveTranscription(stream);
+                console.log("Recording started");
 
                 mediaRecorder.addEventListener('dataavailable', event => {
                     audioChunks.push(event.data);
+                    uploadChunk(event.data);
                     console.log("Audio chunk received");
                 });
 
                 mediaRecorder.addEventListener('stop', () => {
                     console.log("Recording stopped");
-                    const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
+                    const audioBlob = new Blob(audioChunks, { type: mediaRecorder.mimeType });
                     const audioUrl = URL.createObjectURL(audioBlob);
                     document.getElementById('audioPlayback').src = audioUrl;
                     console.log("Audio URL created");
 
-                    const reader = new FileReader();
-                    reader.readAsDataURL(audioBlob);
-                    reader.onloadend = function() {
-                        const base64data = reader.result.split(',')[1];
-                        console.log("Audio Base64 data prepared");
-                        fetch('https://stt-poc.streamlit.app/transcribe', {
+                    // Finish the upload, or send the whole recording if it didn't go through
+                    uploadChain
+                    .then(() => uploadId
+                        ? fetch(API_BASE + '/uploads/' + uploadId + '/complete', { method: 'POST' })
+                        : fetch(API_BASE + '/transcribe', {
                             method: 'POST',
                             headers: {
-                                'Content-Type': 'application/json'
+                                'Content-Type': 'application/octet-stream'
                             },
-                            body: JSON.stringify({ audio: base64data })
-                        })
-                        .then(response => response.json())
-                        .then(data => {
-                            console.log("Received transcript and summary", data);
-                            const transcriptElement = document.getElementById('transcript');
-                            transcriptElement.innerHTML = "<h3>Transcript:</h3><p>" + data.transcript + "</p>";
-
-                            if (data.transcript) {
-                                const summaryElement = document.createElement('div');
-                                summaryElement.innerHTML = "<h3>Summary:</h3><p>" + data.summary + "</p>";
-                                document.body.appendChild(summaryElement);
-                            }
-                        })
-                        .catch(error => {
-                            console.error('Error:', error);
-                            const transcriptElement = document.getElementById('transcript');
-                            # transcriptElement.innerHTML = "Error sending audio.";
-                        });
-                    };
+                            body: audioBlob
+                        }))
+                    .then(response => response.json())
+                    .then(data => {
+                        console.log("Received transcript and summary", data);
+                        const transcriptElement = document.getElementById('transcript');
+                        if (data.transcript === undefined) {
+                            transcriptElement.innerText = "Transcription failed: " + data.error;
+                            return;
+                        }
+                        transcriptElement.innerHTML = "<h3>Transcript:</h3><p>" + data.transcript + "</p>";
+
+                        if (data.transcript) {
+                            const summaryElement = document.createElement('div');
+                            const summary = data.summary === null ? "Summarization failed: " + data.error : data.summary;
+                            summaryElement.innerHTML = "<h3>Summary:</h3><p>" + summary + "</p>";
+                            document.body.appendChild(summaryElement);
+                        }
+                    })
+                    .catch(error => {
+                        console.error('Error:', error);
+                        const transcriptElement = document.getElementById('transcript');
+                        transcriptElement.innerHTML = "Error sending audio.";
+                    });
                 });
 
                 document.getElementById('stopButton').disabled = false;
@@ -245,6 +223,7 @@ html_code = """
     document.getElementById('stopButton').addEventListener('click', () => {
         if (mediaRecorder) {
             mediaRecorder.stop();
+            stopLiveTranscription();
             document.getElementById('stopButton').disabled = true;
             document.getElementById('recordButton').disabled = false;
         }
@@ -252,10 +231,13 @@ html_code = """
 </script>
 """
 
-st.components.v1.html(html_code, height=150)
+# The recorder posts to the standalone server when there is one
+settings = get_pipeline().settings
+api_base_url = (settings.api_url or settings.api_base_url).rstrip("/")
+components.html(html_code.replace("__API_BASE_URL__", api_base_url), height=150)
 
 # Update Streamlit UI with results from JavaScript
-st.components.v1.html("""
+components.html("""
 <script>
     window.addEventListener('message', function(event) {
         if (event.data.type === 'audioResult') {
@@ -284,39 +266,11 @@ st.markdown("## And Upload a Recorded Audio File for Transcription and Summariza
 # File uploader
 uploaded_file = st.file_uploader("", type=["wav"])
 
-if uploaded_file:
-    st.audio(uploaded_file, format='audio/wav')
-
-    # Save audio to a BytesIO object
-    audio_bytes = BytesIO(uploaded_file.read())
-    file_name = f"audio/{uuid.uuid4()}.wav"
-    upload_to_s3(audio_bytes, file_name)
-
-    # Transcribe the audio when it's uploaded
-    with st.spinner("Transcribing audio..."):
-        transcript = transcribe_audio(file_name)
-
-    if transcript:  # Ensure the transcript is valid
-        st.subheader("Transcript")
-        
-        # Display transcript in a textarea for editing/viewing
-        transcript_area = st.text_area("Transcript", transcript, height=300)
-        
-        # Button to trigger the summary process
-        if st.button("Summarize Transcript"):
-            with st.spinner("Summarizing text..."):
-                summary = summarize_text(transcript_area)
+show_debug_panel()
 
-            st.subheader("Summary")
-            st.write(summary)
-
-            # Copy text button using Streamlit's built-in functionality
-            if summary:
-                st.download_button(
-                    label="Copy Summary",
-                    data=summary,
-                    file_name="summary.txt",
-                    mime="text/plain"
-                )
-    else:
-        st.error("No transcript available.")
+if uploaded_file:
+    # One pipeline run per upload, so clicking a button doesn't transcribe again
+    run = get_run(st.session_state, uploaded_file.file_id)
+    st.audio(uploaded_file, format='audio/wav', start_time=seek_time(run))
+    # Poll the background stage until it finishes
+    rerun_while(show_pipeline(pipeline, run, pipeline.transcribe_bytes, uploaded_file.getvalue()))
@@ -1,85 +1,29 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import uuid
-from io import BytesIO
-import base64
-import boto3
-import requests
-from botocore.exceptions import ClientError
-
-# Initialize AWS clients
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-    region_name=st.secrets["AWS_REGION"]
-)
-
-transcribe_client = boto3.client('transcribe', region_name=st.secrets["AWS_REGION"])
-bucket_name = st.secrets["AWS_S3_BUCKET_NAME"]
-
-bedrock_client = boto3.client(
-    'bedrock-runtime',
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-    region_name="us-east-1"
-)
-
-# Function to upload audio file to S3
-def upload_to_s3(audio_data, file_name):
-    s3_client.upload_fileobj(audio_data, bucket_name, file_name)
-
-# Function to transcribe audio
-def transcribe_audio(file_name):
-    job_name = f"transcribe-job-{uuid.uuid4()}"
-    s3_uri = f"s3://{bucket_name}/{file_name}"
-
-    try:
-        transcribe_client.start_transcription_job(
-            TranscriptionJobName=job_name,
-            Media={'MediaFileUri': s3_uri},
-            MediaFormat='wav',
-            LanguageCode='en-US'
-        )
-
-        while True:
-            result = transcribe_client.get_transcription_job(TranscriptionJobName=job_name)
-            status = result['TranscriptionJob']['TranscriptionJobStatus']
-            if status in ['COMPLETED', 'FAILED']:
-                break
-
-        if status == 'COMPLETED':
-            transcript_file_uri = result['TranscriptionJob']['Transcript']['TranscriptFileUri']
-            transcript = requests.get(transcript_file_uri).json()
-            return transcript['results']['transcripts'][0]['transcript']
-        else:
-            return "Transcription failed."
-
-    except Exception as e:
-        return str(e)
-
-# Function to summarize transcript text
-def summarize_text(text):
-    init_sum = "Understand context, key takeaways and summarize the sentences: "
-    conversation = [
-        {
-            "role": "user",
-            "content": [{"text": init_sum + text}],
-        }
-    ]
-
-    try:
-        response = bedrock_client.converse(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            messages=conversation,
-            inferenceConfig={"maxTokens":4096,"temperature":0},
-            additionalModelRequestFields={"top_k":250}
-        )
- 
-        response_text = response["output"]["message"]["content"][0]["text"]
-        return response_text
-    except (ClientError, Exception) as e:
-        return str(e)
+from debug_panel import show_debug_panel
+from session_pipeline import get_run
+from stt_pipeline import Pipeline
+from stt_pipeline.client import APIClient
+from stt_pipeline.streamlit_ui import rerun_while, seek_time, show_pipeline, streamlit_settings
+
+# Shared by every session; its clients, tracker, caches and backends are
+# created on first use
+@st.cache_resource
+def get_pipeline():
+    return Pipeline(streamlit_settings())
+
+# Client for a standalone server (python -m stt_pipeline.server) at API_URL
+@st.cache_resource
+def get_api_client(base_url):
+    return APIClient(base_url, workers=get_pipeline().settings.pipeline_workers)
+
+# With API_URL set the UI only talks to that server; otherwise the pipeline
+# runs in this process
+settings = get_pipeline().settings
+if settings.api_url:
+    pipeline = get_api_client(settings.api_url)
+else:
+    pipeline = get_pipeline()
 
 st.markdown("""
     <style>
@@ -165,18 +109,23 @@ html_code = """
                 });
 
                 mediaRecorder.addEventListener('stop', () => {
-                    const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
+                    const audioBlob = new Blob(audioChunks, { type: mediaRecorder.mimeType });
                     const audioUrl = URL.createObjectURL(audioBlob);
                     document.getElementById('audioPlayback').src = audioUrl;
 
-                    // Convert audioBlob to Base64
-                    const reader = new FileReader();
-                    reader.readAsDataURL(audioBlob);
-                    reader.onloadend = function() {
-                        const base64data = reader.result.split(',')[1];
-                        // Send the Base64 data to Streamlit
-                        window.parent.postMessage({ type: 'audioRecorded', base64Audio: base64data }, '*');
-                    };
+                    // Upload the raw recording to the pipeline API and hand Streamlit only its content hash
+                    fetch('__API_BASE_URL__/audio', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/octet-stream' },
+                        body: audioBlob
+                    })
+                    .then(response => response.json())
+                    .then(data => {
+                        window.parent.postMessage({ type: 'audioRecorded', audioKey: data.sha256 }, '*');
+                    })
+                    .catch(error => {
+                        console.error('Error uploading audio:', error);
+                    });
                 });
 
                 document.getElementById('stopButton').disabled = false;
@@ -197,64 +146,30 @@ html_code = """
 </script>
 """
 
-components.html(html_code, height=150)
-
-# JavaScript that listens for the Base64 audio data sent to Streamlit
-audio_base64 = st.experimental_get_query_params().get("audioRecorded", None)
-
-if audio_base64:
-    audio_bytes = BytesIO(base64.b64decode(audio_base64[0]))
-    file_name = f"audio/{uuid.uuid4()}.wav"
-
-    # Upload to S3
-    upload_to_s3(audio_bytes, file_name)
+api_base_url = (settings.api_url or settings.api_base_url).rstrip("/")
+components.html(html_code.replace("__API_BASE_URL__", api_base_url), height=150)
 
-    # Transcribe the audio
-    with st.spinner("Transcribing recorded audio..."):
-        transcript = transcribe_audio(file_name)
+# The recorder uploads the audio itself; only its SHA-256 comes back through the URL
+audio_key = st.experimental_get_query_params().get("audioKey", None)
 
-    if transcript:
-        st.subheader("Transcript")
-        transcript_area = st.text_area("Transcript", transcript, height=300)
+# Each input has its own pipeline run in the session, so clicking a button
+# doesn't upload or transcribe again
+running = False
 
-        if st.button("Summarize Transcript"):
-            with st.spinner("Summarizing text..."):
-                summary = summarize_text(transcript_area)
-
-            st.subheader("Summary")
-            st.write(summary)
-
-            if summary:
-                st.download_button("Download Summary", summary, file_name="summary.txt", mime="text/plain")
-    else:
-        st.error("No transcript available.")
+if audio_key:
+    # The audio is already in S3 under its content hash; transcribe it unless cached
+    running |= show_pipeline(pipeline, get_run(st.session_state, audio_key[0]), pipeline.transcribe_stored, audio_key[0])
 
 st.markdown("## And Upload a Recorded Audio File for Transcription and Summarization")
 # Fallback file uploader for manual uploads
 uploaded_file = st.file_uploader("", type=["wav"])
 
 if uploaded_file:
-    st.audio(uploaded_file, format='audio/wav')
-    audio_bytes = BytesIO(uploaded_file.read())
-    file_name = f"audio/{uuid.uuid4()}.wav"
-    upload_to_s3(audio_bytes, file_name)
-
-    # Transcribe the uploaded file
-    with st.spinner("Transcribing uploaded audio..."):
-        transcript = transcribe_audio(file_name)
-
-    if transcript:
-        st.subheader("Transcript")
-        transcript_area = st.text_area("Transcript", transcript, height=300)
-
-        if st.button("Summarize Transcript"):
-            with st.spinner("Summarizing text..."):
-                summary = summarize_text(transcript_area)
+    run = get_run(st.session_state, uploaded_file.file_id)
+    st.audio(uploaded_file, format='audio/wav', start_time=seek_time(run))
+    running |= show_pipeline(pipeline, run, pipeline.transcribe_bytes, uploaded_file.getvalue())
 
-            st.subheader("Summary")
-            st.write(summary)
+show_debug_panel()
 
-            if summary:
-                st.download_button("Download Summary", summary, file_name="summary.txt", mime="text/plain")
-    else:
-        st.error("No transcript available.")
+# Poll background stages until they finish
+rerun_while(running)
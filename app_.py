@@ -1,196 +1,177 @@
-import os
 from dotenv import load_dotenv
-import json 
-import boto3
 import streamlit as st
-import sounddevice as sd
-import numpy as np
-import wavio
-from io import BytesIO
 import uuid
-import requests
-from transformers import pipeline
-import subprocess
-from botocore.exceptions import ClientError
-import streamlit.components.v1 as components
-
-# client = boto3.client("bedrock-runtime", region_name="ap-southeast-1")
-
-# Set the model ID, e.g., Titan Text Premier.
-model_id = "anthropic.claude-v2"
+from transcript_result import tagged_transcript
+from session_pipeline import get_run
+from chunked_summary import describe_stats
+from debug_panel import show_debug_panel
+from errors import PipelineError, UploadError, reraise_as
+from metrics import registry as metrics
+from stt_pipeline import Pipeline
+from stt_pipeline.client import APIClient
+from stt_pipeline.streamlit_ui import rerun_while, seek_time, show_pipeline, streamlit_settings
 
 # Load environment variables
 load_dotenv()
-subprocess.run(["pip", "install", "--upgrade", "pip"])
-
-
-# # Initialize AWS clients
-# s3_client = boto3.client(
-#     's3',
-#     aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-#     aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-#     region_name=os.getenv('AWS_REGION')
-# )
-
-# transcribe_client = boto3.client('transcribe', region_name=os.getenv('AWS_REGION'))
-# bucket_name = os.getenv('AWS_S3_BUCKET_NAME')
-
-# # Initialize SageMaker runtime client
-# sagemaker_runtime = boto3.client(
-#     'sagemaker-runtime',
-#     aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-#     aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-#     region_name=os.getenv('AWS_REGION')
-# )
-
-# sagemaker_endpoint_name = os.getenv('SAGEMAKER_ENDPOINT_NAME')
-
-
-# Initialize AWS clients
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-    region_name=st.secrets["AWS_REGION"]
-)
-
-transcribe_client = boto3.client('transcribe', region_name=st.secrets["AWS_REGION"])
-bucket_name = st.secrets["AWS_S3_BUCKET_NAME"]
-
-bedrock_client = boto3.client(
-    'bedrock-runtime',
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-    region_name=st.secrets["AWS_REGION"]
-)
-
-
-# Function to upload audio to S3
-def upload_to_s3(audio_data, file_name):
-    s3_client.upload_fileobj(audio_data, bucket_name, file_name)
-
-# Function to transcribe audio
-def transcribe_audio(file_name):
-    job_name = f"transcribe-job-{uuid.uuid4()}"
-    s3_uri = f"s3://{bucket_name}/{file_name}"
-
-    transcribe_client.start_transcription_job(
-        TranscriptionJobName=job_name,
-        Media={'MediaFileUri': s3_uri},
-        MediaFormat='wav',
-        LanguageCode='en-US'
-    )
-
-    while True:
-        result = transcribe_client.get_transcription_job(TranscriptionJobName=job_name)
-        status = result['TranscriptionJob']['TranscriptionJobStatus']
-        if status in ['COMPLETED', 'FAILED']:
-            break
-
-    if status == 'COMPLETED':
-        transcript_file_uri = result['TranscriptionJob']['Transcript']['TranscriptFileUri']
-        transcript = requests.get(transcript_file_uri).json()
-        return transcript['results']['transcripts'][0]['transcript']
-    else:
-        return "Transcription failed."
-
-def summarize_text(text):
-    conversation = [
-        {
-            "role": "user",
-            "content": [{"text": text}],
-        }
-    ]
 
-    try:
-        # Send the message to the model, using a basic inference configuration.
-        response = bedrock_client.converse(
-            modelId="anthropic.claude-v2",
-            messages=conversation,
-            inferenceConfig={"maxTokens":2048,"stopSequences":["\n\nHuman:"],"temperature":0.5,"topP":1},
-            additionalModelRequestFields={"top_k":250}
-        )
-
-        # Extract and print the response text.
-        response_text = response["output"]["message"]["content"][0]["text"]
-        print(response_text)
-        return response_text
-
-    except (ClientError, Exception) as e:
-        print(f"ERROR: Can't invoke '{model_id}'. Reason: {e}")
-        return f"ERROR: Can't invoke '{model_id}'. Reason: {e}"
-        # exit(1)
-    
+# Shared by every session; its clients, tracker, caches and backends are
+# created on first use. Claude v2 on Bedrock in the app's own region.
+@st.cache_resource
+def get_pipeline():
+    return Pipeline(streamlit_settings(
+        bedrock_region=None,
+        model_id="anthropic.claude-v2",
+        inference_config={"maxTokens":2048,"stopSequences":["\n\nHuman:"],"temperature":0.5,"topP":1},
+        chunk_tokens=4000,
+        summary_prompt=""
+    ))
+
+# Client for a standalone server (python -m stt_pipeline.server) at API_URL
+@st.cache_resource
+def get_api_client(base_url):
+    return APIClient(base_url, workers=get_pipeline().settings.pipeline_workers)
+
+# With API_URL set recordings are transcribed and summarized by that server,
+# without live transcription or upload-while-recording; otherwise the
+# pipeline runs in this process
+settings = get_pipeline().settings
+if settings.api_url:
+    pipeline = get_api_client(settings.api_url)
+else:
+    pipeline = get_pipeline()
 
 # Function to record audio using sounddevice
-def record_audio(duration=30, fs=44100):
+# Frames go into a preallocated CaptureBuffer from the audio callback (see
+# capture.record); everything below runs on this thread as blocks arrive.
+# If a streaming session is given, frames are also fed to it while recording and
+# on_segments is called with each batch of partial/final transcript segments.
+# If an uploader is given, frames are written to it so the S3 upload finishes
+# with the recording instead of starting after it; a silence gate, if given,
+# decides which frames go to the uploader. Audio is captured at 16 kHz mono,
+# which is all Transcribe uses for speech. The capture modules (numpy,
+# sounddevice) are only imported once something is recorded.
+def record_audio(duration, fs, session=None, on_segments=None, uploader=None, gate=None):
+    from capture import pcm_bytes, record
+
+    def consume(block):
+        if uploader is not None:
+            uploader.write(pcm_bytes(gate.process(block[:, 0]) if gate is not None else block))
+        if session is not None:
+            segments = session.feed(block.tobytes())
+            if segments:
+                on_segments(segments)
+
     try:
         st.write("Recording...")
         device_index = None  # Set to None to use the default device
-        with sd.InputStream(samplerate=fs, channels=1, dtype='int16', device=device_index) as stream:
-            frames = []
-            for _ in range(int(duration * fs / 1024)):
-                data, overflowed = stream.read(1024)
-                frames.append(data)
-        
-        audio_data = np.concatenate(frames, axis=0)
+        capture = record(duration, fs, consume, device=device_index)
+
+        if session is not None:
+            on_segments(session.finish())
+
         st.write("Recording finished.")
-        return audio_data, fs
+        if capture.overflows:
+            st.warning(f"The audio device overflowed {capture.overflows} time(s); some audio may be missing.")
+        return capture
 
     except Exception as e:
+        if uploader is not None:
+            uploader.abort()
         st.error(f"An error occurred while recording audio: {e}")
-        return None, None
+        return None
+
+# Multipart upload of a WAV recording; the header is written when it completes
+def start_recording_upload(fs):
+    from audio_io import media_key, wav_header
+
+    return pipeline.open_uploader(media_key(f"audio/recording-{uuid.uuid4()}", "wav", fs),
+                                  header=lambda size: wav_header(size, fs), content_type="audio/wav")
 
 # Streamlit UI
 st.title("Speech-to-Text and Summarization App")
 
+live_transcription = not settings.api_url and st.checkbox("Transcribe live while recording")
+
 # Record audio
 if st.button("Record Audio"):
-    duration = st.slider("Select duration (seconds)", 1, 30, 30)
-    audio, fs = record_audio(duration)
-
-    if audio is not None:
-        # Convert the numpy array to bytes
-        audio_bytes = BytesIO()
-        wavio.write(audio_bytes, audio, fs, sampwidth=2)  # sampwidth=2 for 16-bit PCM
-        audio_bytes.seek(0)
+    from audio_io import SPEECH_SAMPLE_RATE
+    from streaming_stt import LiveTranscript, ThreadedSession
+    from vad import SilenceGate
 
-        st.audio(audio_bytes, format='audio/wav')
-
-        file_name = f"audio/{uuid.uuid4()}.wav"
-        upload_to_s3(audio_bytes, file_name)
-
-        with st.spinner("Transcribing audio..."):
-            transcript = transcribe_audio(file_name)
-
-        st.subheader("Transcript")
-        st.write(transcript)
-
-        with st.spinner("Summarizing text..."):
-            summary = summarize_text(transcript)
-
-        st.subheader("Summary")
-        st.write(summary)
+    duration = st.slider("Select duration (seconds)", 1, 30, 30)
+    session, on_segments = None, None
+    if live_transcription:
+        try:
+            session = ThreadedSession(pipeline.streaming_backend.open_session(SPEECH_SAMPLE_RATE))
+        except ImportError as e:
+            # Record and transcribe afterwards instead
+            st.error(f"Live transcription is unavailable: {e}")
+            live_transcription = False
+        else:
+            live_transcript = LiveTranscript()
+            live_placeholder = st.empty()
+            on_segments = lambda segments: live_placeholder.markdown(live_transcript.update(segments))
+    uploader, gate = None, None
+    if not live_transcription and not settings.api_url and settings.transcription_backend == "aws":
+        uploader = start_recording_upload(SPEECH_SAMPLE_RATE)
+        if settings.trim_silence:
+            gate = SilenceGate(SPEECH_SAMPLE_RATE)
+    capture = record_audio(duration, SPEECH_SAMPLE_RATE, session=session, on_segments=on_segments, uploader=uploader, gate=gate)
+
+    if capture is not None:
+        st.audio(capture.view()[:, 0], sample_rate=capture.sample_rate)
+
+        try:
+            segments = None
+            if live_transcription:
+                # The streaming transcript is already final; no batch job needed
+                transcript = live_transcript.text()
+            elif uploader is not None:
+                with st.spinner("Transcribing audio..."):
+                    digest = capture.sha256()
+                    metrics.record_audio("upload", uploader.size, capture.frames / capture.sample_rate)
+                    with metrics.span("upload"), reraise_as(UploadError):
+                        file_name = uploader.complete()
+                    if gate is not None:
+                        # Silence was never uploaded; keep the map back to recording time
+                        pipeline.transcript_cache.remember_upload(digest, {
+                            's3_key': file_name,
+                            'speech_map': gate.timestamps().to_dict(),
+                            'silence_removed': gate.seconds_removed
+                        })
+                        metrics.observe("stt_silence_removed_seconds", gate.seconds_removed, stage="upload")
+                        st.caption(f"Skipped {gate.seconds_removed:.1f}s of silence")
+                    transcript, segments = pipeline.transcribe_uploaded(digest, file_name)
+            else:
+                with st.spinner("Transcribing audio..."):
+                    transcript, segments = pipeline.transcribe_bytes(capture.wav_bytes())
+            # With speaker labels: one "Speaker N: ..." line per turn, shown and summarized
+            transcript = tagged_transcript(transcript, segments)
+
+            st.subheader("Transcript")
+            st.write("  \n".join(transcript.splitlines()))
+            if segments is not None and len(segments):
+                with st.expander(f"Segments ({len(segments)})"):
+                    st.dataframe(segments.records())
+
+            st.subheader("Summary")
+            stream_stats = {}
+            summary = st.write_stream(pipeline.summarize_text_stream(transcript, stream_stats))
+            if stream_stats:
+                st.caption(describe_stats(stream_stats))
+        except PipelineError as e:
+            st.error(f"The {e.stage} stage failed: {e}")
+        finally:
+            capture.close()
+
+show_debug_panel()
 
 # Upload audio file
 uploaded_file = st.file_uploader("Or upload an audio file", type=["mp3", "wav", "m4a"])
 
 if uploaded_file:
-    st.audio(uploaded_file, format='audio/wav')
-
-    # Save audio to a BytesIO object
-    audio_bytes = BytesIO(uploaded_file.read())
-    file_name = f"audio/{uuid.uuid4()}.wav"
-    upload_to_s3(audio_bytes, file_name)
-
-    with st.spinner("Transcribing audio..."):
-        transcript = transcribe_audio(file_name)
-
-    st.subheader("Transcript")
-    st.write(transcript)
-
-    with st.spinner("Summarizing text..."):
-        summary = summarize_text(transcript)
-
-    st.subheader("Summary")
-    st.write(summary)
+    # One pipeline run per upload, so reruns don't transcribe again
+    run = get_run(st.session_state, uploaded_file.file_id)
+    st.audio(uploaded_file, format='audio/wav', start_time=seek_time(run))
+    # Poll the background stage until it finishes
+    rerun_while(show_pipeline(pipeline, run, pipeline.transcribe_bytes, uploaded_file.getvalue()))
@@ -0,0 +1,252 @@
+import io
+import math
+import struct
+import wave
+from collections import namedtuple
+
+import numpy as np
+
+# Speech models and Transcribe don't gain anything above 16 kHz
+SPEECH_SAMPLE_RATE = 16000
+
+# MediaFormat values Transcribe accepts
+MEDIA_FORMATS = {"mp3", "mp4", "wav", "flac", "ogg", "amr", "webm", "m4a"}
+
+# codec -> (soundfile container, subtype, MediaFormat)
+SOUNDFILE_CODECS = {"flac": ("FLAC", "PCM_16", "flac"), "opus": ("OGG", "OPUS", "ogg")}
+
+# Audio ready for upload: `data` is bytes or a file object; sample_rate is
+# None when the audio was passed through untouched. timestamps (a
+# vad.TimestampMap) is set when silence was cut out.
+NormalizedAudio = namedtuple("NormalizedAudio", ["data", "media_format", "sample_rate", "timestamps", "seconds_removed"],
+                             defaults=(None, 0.0))
+
+
+def pcm16_to_float(samples):
+    return samples.astype(np.float32) / 32768.0
+
+
+# Windowed-sinc (Blackman) FIR low-pass; cutoff is a fraction of the sample rate
+def lowpass_kernel(cutoff, taps):
+    offsets = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * offsets) * np.blackman(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+# Linear-interpolation resampler. When downsampling, everything above 90% of
+# the new Nyquist frequency is filtered out first, so it doesn't alias into
+# the speech band (44.1 kHz -> 16 kHz would fold 8-22 kHz back below 8 kHz).
+def resample(samples, from_rate, to_rate):
+    if from_rate == to_rate or len(samples) == 0:
+        return samples
+    dtype = samples.dtype
+    if to_rate < from_rate:
+        ratio = from_rate / to_rate
+        kernel = lowpass_kernel(0.45 / ratio, 32 * math.ceil(ratio) + 1)
+        # The centred len(samples) of the full convolution; "same" would return
+        # len(kernel) samples for clips shorter than the kernel
+        offset = (len(kernel) - 1) // 2
+        samples = np.convolve(samples.astype(np.float32), kernel)[offset:offset + len(samples)]
+    length = int(round(len(samples) * to_rate / from_rate))
+    positions = np.linspace(0, len(samples) - 1, num=length)
+    resampled = np.interp(positions, np.arange(len(samples)), samples)
+    if np.issubdtype(dtype, np.integer):
+        limits = np.iinfo(dtype)
+        resampled = np.clip(np.rint(resampled), limits.min, limits.max)
+    return resampled.astype(dtype)
+
+
+def is_wav(audio_data):
+    return audio_data[:4] == b"RIFF" and audio_data[8:12] == b"WAVE"
+
+
+# First `size` bytes of bytes or a seekable file object, leaving it rewound
+def peek(audio, size=12):
+    if isinstance(audio, (bytes, bytearray)):
+        return bytes(audio[:size])
+    audio.seek(0)
+    header = audio.read(size)
+    audio.seek(0)
+    return header
+
+
+# Container from the leading bytes rather than the file name or Content-Type,
+# which browsers get wrong (MediaRecorder output labelled audio/wav). Returns
+# a Transcribe MediaFormat, or None if unrecognised.
+def detect_format(header):
+    if is_wav(header):
+        return "wav"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"\x1aE\xdf\xa3":
+        return "webm"
+    if header[4:8] == b"ftyp":
+        return "m4a" if header[8:11] == b"M4A" else "mp4"
+    if header[:5] == b"#!AMR":
+        return "amr"
+    if header[:3] == b"ID3" or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+# 44-byte PCM WAV header for data_size bytes of samples
+def wav_header(data_size, sample_rate, channels=1, sample_width=2):
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+# Decode 16-bit PCM WAV bytes into mono int16 samples and the sample rate
+def decode_wav(audio_data):
+    with wave.open(io.BytesIO(audio_data)) as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"Unsupported WAV sample width: {wav.getsampwidth() * 8} bits")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+# Mono int16 samples -> (bytes, MediaFormat). "wav" needs nothing extra;
+# "flac" (lossless, about half the size) and "opus" (lossy, around a tenth)
+# need the soundfile package.
+def encode_audio(samples, sample_rate, codec="flac"):
+    if codec == "wav":
+        return wav_header(len(samples) * 2, sample_rate) + samples.astype("<i2").tobytes(), "wav"
+    if codec not in SOUNDFILE_CODECS:
+        raise ValueError(f"Unknown audio codec: {codec}")
+    import soundfile
+
+    container, subtype, media_format = SOUNDFILE_CODECS[codec]
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, sample_rate, format=container, subtype=subtype)
+    return buffer.getvalue(), media_format
+
+
+# Prepares audio for upload. PCM WAV is downmixed, resampled to sample_rate,
+# optionally stripped of silence (trim) and re-encoded with `codec`;
+# compressed containers (the browser's webm/opus, mp3, m4a) are already
+# small and pass through with their detected format.
+def normalize_audio(audio, sample_rate=SPEECH_SAMPLE_RATE, codec="flac", trim=False):
+    media_format = detect_format(peek(audio))
+    if media_format != "wav":
+        return NormalizedAudio(audio, media_format, None)
+    try:
+        samples, rate = decode_wav(read_all(audio))
+    except (ValueError, wave.Error, EOFError):
+        # Not 16-bit PCM; let Transcribe deal with it as is
+        return NormalizedAudio(audio, media_format, None)
+    samples = resample(samples, rate, sample_rate)
+    timestamps, seconds_removed = None, 0.0
+    if trim:
+        from vad import trim_silence
+
+        samples, timestamps, seconds_removed = trim_silence(samples, sample_rate)
+    data, media_format = encode_audio(samples, sample_rate, codec)
+    return NormalizedAudio(data, media_format, sample_rate, timestamps, seconds_removed)
+
+
+# S3 keys carry the format and, when known, the sample rate
+# (audio/<name>.16000.flac) so a transcription job can be started from the
+# key alone
+def media_key(stem, media_format, sample_rate=None):
+    if media_format is None:
+        return stem
+    if sample_rate is None:
+        return f"{stem}.{media_format}"
+    return f"{stem}.{sample_rate}.{media_format}"
+
+
+# Media settings for start_transcription_job from a key made by media_key.
+# Transcribe detects whatever is left out.
+def media_settings(file_name):
+    parts = file_name.rsplit("/", 1)[-1].split(".")
+    settings = {}
+    if len(parts) > 1 and parts[-1] in MEDIA_FORMATS:
+        settings["MediaFormat"] = parts[-1]
+        if len(parts) > 2 and parts[-2].isdigit():
+            settings["MediaSampleRateHertz"] = int(parts[-2])
+    return settings
+
+
+# Mono int16 samples and the sample rate for 16-bit WAV, or anything the
+# soundfile package can read (FLAC, OGG, MP3 with libsndfile 1.1+)
+def decode_audio(audio_data):
+    if is_wav(audio_data[:12]):
+        return decode_wav(audio_data)
+    import soundfile
+
+    try:
+        samples, rate = soundfile.read(io.BytesIO(audio_data), dtype="int16", always_2d=True)
+    except RuntimeError as e:
+        raise ValueError(f"Can't decode audio: {e}")
+    if samples.shape[1] > 1:
+        return samples.mean(axis=1).astype(np.int16), rate
+    return samples[:, 0], rate
+
+
+# Raw bytes from either bytes or a file object (rewound first)
+def read_all(audio):
+    if isinstance(audio, (bytes, bytearray)):
+        return bytes(audio)
+    audio.seek(0)
+    return audio.read()
+
+
+# Size in bytes of raw bytes or a seekable file object (left where it was)
+def audio_size(audio):
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return len(audio)
+    position = audio.tell()
+    size = audio.seek(0, io.SEEK_END)
+    audio.seek(position)
+    return size
+
+
+# Duration from the WAV header without decoding the samples; None for other
+# formats. Accepts bytes or a seekable file object.
+def wav_duration(audio):
+    if isinstance(audio, (bytes, bytearray)):
+        header, source = audio[:12], io.BytesIO(audio)
+    else:
+        audio.seek(0)
+        header, source = audio.read(12), audio
+        audio.seek(0)
+    if not is_wav(header):
+        return None
+    try:
+        with wave.open(source) as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError):
+        return None
+    finally:
+        if source is audio:
+            audio.seek(0)
+
+
+if __name__ == "__main__":
+    # Offline check of resample(): python audio_io.py
+    rates = ((44100, 16000), (48000, 16000), (22050, 16000), (8000, 16000))
+    # Lengths follow the rate ratio, also for clips shorter than the filter
+    for length in (1, 2, 10, 96, 97, 200, 4410):
+        for from_rate, to_rate in rates:
+            resampled = resample(np.ones(length, dtype=np.int16), from_rate, to_rate)
+            assert len(resampled) == round(length * to_rate / from_rate), (length, from_rate, to_rate, len(resampled))
+
+    # The speech band passes and what is above the new Nyquist frequency doesn't alias into it
+    times = np.arange(44100 * 2) / 44100
+    for frequency, low, high in ((1000, -0.1, 0.1), (5000, -0.5, 0.1), (12000, -200, -60), (15000, -200, -60)):
+        tone = np.sin(2 * np.pi * frequency * times) * 16000
+        out = resample(tone.astype(np.int16), 44100, 16000).astype(np.float64)[1000:-1000]
+        gain = 20 * np.log10(max(out.std(), 1e-9) / tone.std())
+        assert low <= gain <= high, (frequency, gain)
+        print(f"{frequency:>6} Hz  {gain:7.1f} dB")
+    print("resample ok")
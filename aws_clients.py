@@ -0,0 +1,66 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+# (connect, read) timeouts in seconds. Bedrock generations can run for
+# minutes; Transcribe control-plane calls are small and should fail fast.
+SERVICE_TIMEOUTS = {
+    "s3": (5, 60),
+    "transcribe": (5, 15),
+    "bedrock-runtime": (5, 300),
+}
+DEFAULT_TIMEOUTS = (5, 60)
+
+
+# One boto3 session and one client per service, created on first use and
+# shared by every thread. Each client gets a connection pool of
+# max_pool_connections, adaptive retries (client-side rate limiting when AWS
+# throttles) and the timeouts from SERVICE_TIMEOUTS. service_regions
+# overrides region_name per service, e.g. Bedrock in us-east-1.
+class AWSClients:
+    def __init__(self, region_name, aws_access_key_id=None, aws_secret_access_key=None, service_regions=None,
+                 max_pool_connections=50, max_attempts=5):
+        self.region_name = region_name
+        self.service_regions = service_regions or {}
+        self.max_pool_connections = max_pool_connections
+        self.max_attempts = max_attempts
+        self._session = boto3.session.Session(aws_access_key_id=aws_access_key_id,
+                                              aws_secret_access_key=aws_secret_access_key)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, service):
+        with self._lock:
+            if service not in self._clients:
+                connect_timeout, read_timeout = SERVICE_TIMEOUTS.get(service, DEFAULT_TIMEOUTS)
+                config = Config(
+                    max_pool_connections=self.max_pool_connections,
+                    retries={"mode": "adaptive", "max_attempts": self.max_attempts},
+                    connect_timeout=connect_timeout,
+                    read_timeout=read_timeout,
+                    tcp_keepalive=True,
+                )
+                # boto3 sessions aren't thread-safe, so clients are only created under the lock
+                self._clients[service] = self._session.client(
+                    service, region_name=self.service_regions.get(service, self.region_name), config=config)
+            return self._clients[service]
+
+    # Use an existing client for `service` instead of creating one, such as
+    # the fakes in fake_aws for offline runs
+    def register(self, service, client):
+        with self._lock:
+            self._clients[service] = client
+
+    @property
+    def s3(self):
+        return self.client("s3")
+
+    @property
+    def transcribe(self):
+        return self.client("transcribe")
+
+    @property
+    def bedrock(self):
+        return self.client("bedrock-runtime")
+
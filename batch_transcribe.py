@@ -0,0 +1,166 @@
+# Headless batch transcription for backfilling archived recordings.
+#
+#   python batch_transcribe.py recordings/ --output results.jsonl --concurrency 8
+#   python batch_transcribe.py s3://archive-bucket/2023/ --output results.parquet
+#
+# Settings come from .streamlit/secrets.toml, overridden by environment
+# variables of the same name. Every finished file is appended to a checkpoint
+# (<output>.checkpoint.jsonl); rerunning the same command skips the files that
+# already succeeded and retries the ones that failed.
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from errors import error_details
+from metrics import registry as metrics
+from stt_pipeline import Pipeline, load_settings
+from transcript_result import tagged_transcript
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".mp4", ".flac", ".ogg", ".webm", ".amr"}
+
+
+# The same upload -> Transcribe -> summarize steps as the Streamlit apps,
+# without Streamlit. Clients can be passed in (e.g. the fakes in fake_aws).
+class BatchPipeline(Pipeline):
+    def __init__(self, settings, concurrency=4, summarize=True,
+                 s3_client=None, transcribe_client=None, bedrock_client=None):
+        # One connection per worker, plus the part uploads and the poller
+        super().__init__(settings._replace(max_pool_connections=max(10, concurrency * 2)))
+        self.summarize = summarize
+        for service, client in (("s3", s3_client), ("transcribe", transcribe_client),
+                                ("bedrock-runtime", bedrock_client)):
+            if client is not None:
+                self.clients.register(service, client)
+
+    def read_source(self, source):
+        if source.startswith("s3://"):
+            bucket, key = parse_s3_uri(source)
+            return self.clients.s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        return Path(source).read_bytes()
+
+    # One output record; failures are recorded rather than raised
+    def process(self, source):
+        started = time.monotonic()
+        record = {"source": source, "transcript": None, "segments": None, "summary": None, "error": None}
+        try:
+            transcript, segments = self.transcribe_bytes(self.read_source(source))
+            record["transcript"] = transcript
+            if segments is not None:
+                record["segments"] = segments.records()
+            if self.summarize and transcript:
+                record["summary"] = self.summarize_text(tagged_transcript(transcript, segments))
+        except Exception as e:
+            details = error_details(e)
+            record["error"] = f"{details['stage'] or 'pipeline'} {details['code']}: {details['message']}"
+        record["seconds"] = round(time.monotonic() - started, 3)
+        return record
+
+
+def parse_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def list_sources(source, s3_client):
+    if source.startswith("s3://"):
+        bucket, prefix = parse_s3_uri(source)
+        sources = []
+        for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            sources += [f"s3://{bucket}/{item['Key']}" for item in page.get('Contents', [])
+                        if Path(item['Key']).suffix.lower() in AUDIO_EXTENSIONS]
+        return sources
+    return sorted(str(path) for path in Path(source).rglob("*") if path.suffix.lower() in AUDIO_EXTENSIONS)
+
+
+# Latest record per source from a previous run
+def load_checkpoint(path):
+    records = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["source"]] = record
+    return records
+
+
+# Single-line progress on stderr: count, rate, ETA and failures
+class Progress:
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def update(self, record):
+        self.done += 1
+        self.failed += record["error"] is not None
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate else 0.0
+        self.stream.write(f"\r{self.done}/{self.total} ({100 * self.done / max(self.total, 1):.1f}%)  "
+                          f"{rate:.2f} files/s  ETA {time.strftime('%H:%M:%S', time.gmtime(eta))}  "
+                          f"failed {self.failed}")
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.write("\n")
+
+
+def run_batch(pipeline, sources, checkpoint_path, concurrency=4):
+    records = load_checkpoint(checkpoint_path)
+    pending = [source for source in sources if source not in records or records[source]["error"] is not None]
+    print(f"{len(sources)} files, {len(sources) - len(pending)} already done", file=sys.stderr)
+
+    progress = Progress(len(pending))
+    with open(checkpoint_path, "a") as checkpoint, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in as_completed([pool.submit(pipeline.process, source) for source in pending]):
+            record = future.result()
+            checkpoint.write(json.dumps(record) + "\n")
+            checkpoint.flush()
+            records[record["source"]] = record
+            progress.update(record)
+    progress.finish()
+    return [records[source] for source in sources if source in records]
+
+
+def write_output(records, path):
+    frame = pd.DataFrame(records, columns=["source", "transcript", "segments", "summary", "error", "seconds"])
+    if path.endswith(".parquet"):
+        # Needs pyarrow or fastparquet
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_json(path, orient="records", lines=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe and summarize every recording in a directory or S3 prefix.")
+    parser.add_argument("source", help="local directory or s3://bucket/prefix")
+    parser.add_argument("--output", default="transcripts.jsonl", help=".jsonl or .parquet")
+    parser.add_argument("--checkpoint", help="defaults to <output>.checkpoint.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4, help="files processed at once")
+    parser.add_argument("--no-summary", action="store_true", help="only transcribe")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    args = parser.parse_args(argv)
+
+    pipeline = BatchPipeline(load_settings(args.secrets), concurrency=args.concurrency, summarize=not args.no_summary)
+    sources = list_sources(args.source, pipeline.clients.s3)
+    records = run_batch(pipeline, sources, args.checkpoint or args.output + ".checkpoint.jsonl", args.concurrency)
+    write_output(records, args.output)
+    failed = sum(record["error"] is not None for record in records)
+    print(f"Wrote {len(records)} records to {args.output} ({failed} failed)", file=sys.stderr)
+    for row in metrics.stage_summary():
+        print(f"  {row['stage']:<16} {row['calls']:>5} calls  {row['total']:>9.1f}s total  "
+              f"p50 {row['p50']:.2f}s  p95 {row['p95']:.2f}s  {row['errors']} errors", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+# Offline benchmark of the transcription and summarization pipeline against
+# the fakes in fake_aws, so changes can be measured without touching AWS.
+#
+#   python benchmark.py --concurrency 1,8 --audio-seconds 30,300 --output bench.json
+#   python benchmark.py --targets api --requests 50 --compare bench.json
+#   python benchmark.py --imports
+#
+# Targets:
+#   pipeline  BatchPipeline.transcribe_bytes + summarize_text (upload, job,
+#             polling, transcript fetch and summary), one thread per request
+#   api       POST /transcribe on the FastAPI app in app-tested.py, driven in
+#             process over ASGI (needs httpx)
+#
+# Every combination of concurrency and audio length is one run. Each request
+# gets its own synthetic recording (speech-like bursts between pauses) and its
+# own transcript, so neither cache short-circuits the work. The report is JSON
+# with throughput, latency percentiles, CPU time, peak RSS and the per-stage
+# timings from metrics.py; --compare prints the change against an earlier report.
+#
+# --imports instead times a cold import of each entry module in a fresh
+# interpreter and fails if one goes over its budget in IMPORT_BUDGETS or
+# loads a backend that should only be imported when used.
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from audio_io import wav_header
+from fake_aws import FakeBedrockClient, FakeS3Client, FakeTranscribeClient
+from metrics import quantile, registry as metrics
+
+ROOT = Path(__file__).resolve().parent
+BUCKET = "benchmark-bucket"
+WORDS_PER_SECOND = 2.5
+# Cold-import budget per entry module: (milliseconds, modules it must not load)
+HEAVY_MODULES = ("boto3", "botocore", "numpy", "pandas", "torch", "transformers", "sounddevice", "soundfile")
+IMPORT_BUDGETS = {
+    "stt_pipeline": (150, HEAVY_MODULES),
+    "stt_pipeline.streamlit_ui": (600, HEAVY_MODULES),
+    "stt_pipeline.api": (600, HEAVY_MODULES),
+    "batch_transcribe": (1000, ("boto3", "botocore", "torch", "transformers", "sounddevice")),
+}
+VOCABULARY = ("the budget team review plan launch customer quarter update design issue timeline release "
+              "meeting action item owner risk estimate feedback priority deadline follow").split()
+
+
+# Mono 16-bit PCM that looks like speech to the silence trimmer: bursts of a
+# few harmonics on a drifting pitch, pulsing at syllable rate, separated by
+# pauses, over a low noise floor. speech_ratio is the share of bursts.
+def synthetic_speech(seconds, sample_rate=16000, speech_ratio=0.7, seed=0):
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    signal = np.zeros(total, dtype=np.float32)
+    position = 0
+    while position < total:
+        burst = min(int(rng.uniform(0.8, 3.0) * sample_rate), total - position)
+        t = np.arange(burst) / sample_rate
+        pitch = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * 0.5 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        voice = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+        syllables = 0.5 * (1 - np.cos(2 * np.pi * rng.uniform(3, 5) * t))
+        signal[position:position + burst] = 0.3 * voice * syllables
+        pause = burst * (1 - speech_ratio) / speech_ratio * rng.uniform(0.5, 1.5)
+        position += burst + int(pause)
+    signal += rng.normal(0, 0.002, total).astype(np.float32)
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def synthetic_wav(seconds, sample_rate=16000, speech_ratio=0.7, seed=0):
+    pcm = synthetic_speech(seconds, sample_rate, speech_ratio, seed).tobytes()
+    return wav_header(len(pcm), sample_rate) + pcm
+
+
+# Deterministic transcript text for a job, about WORDS_PER_SECOND words per
+# second of audio, in sentences of 6-14 words
+def synthetic_transcript(seconds, seed):
+    rng = random.Random(seed)
+    words, sentences = int(seconds * WORDS_PER_SECOND) or 1, []
+    while words > 0:
+        length = min(words, rng.randint(6, 14))
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+def fake_clients(args, audio_seconds):
+    s3 = FakeS3Client(latency=args.s3_latency)
+    transcribe = FakeTranscribeClient(
+        latency=args.job_latency, seed=args.seed, s3_client=s3, word_seconds=1 / WORDS_PER_SECOND,
+        transcript=lambda job_name: synthetic_transcript(audio_seconds, job_name),
+    )
+    bedrock = FakeBedrockClient(latency=args.bedrock_latency, tokens_per_second=args.token_rate)
+    return {"s3": s3, "transcribe": transcribe, "bedrock-runtime": bedrock}
+
+
+def settings(args):
+    return {
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_REGION": "us-east-1",
+        "AWS_S3_BUCKET_NAME": BUCKET,
+        "API_PORT": 0,
+        "TRANSCRIPTION_BACKEND": "aws",
+        "SUMMARIZATION_BACKEND": "bedrock",
+        "SEGMENT_SECONDS": args.segment_seconds,
+        "TRIM_SILENCE": not args.no_trim,
+        "AUDIO_CODEC": args.codec,
+    }
+
+
+# Peak resident set size in MiB. On Linux the peak can be reset between runs
+# through /proc/self/clear_refs; elsewhere it only grows.
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+class PipelineTarget:
+    name = "pipeline"
+
+    def __init__(self, args, audio_seconds):
+        from batch_transcribe import BatchPipeline
+        from stt_pipeline import from_mapping
+        from transcript_result import tagged_transcript
+
+        self.tagged_transcript = tagged_transcript
+        clients = fake_clients(args, audio_seconds)
+        self.pipeline = BatchPipeline(from_mapping(settings(args)), concurrency=args.concurrency_max, s3_client=clients["s3"],
+                                      transcribe_client=clients["transcribe"],
+                                      bedrock_client=clients["bedrock-runtime"])
+        self.pipeline.tracker.initial_delay = args.poll_interval
+
+    def run(self, audios, concurrency):
+        def request(audio):
+            started = time.perf_counter()
+            try:
+                transcript, segments = self.pipeline.transcribe_bytes(audio)
+                self.pipeline.summarize_text(self.tagged_transcript(transcript, segments))
+            except Exception:
+                return time.perf_counter() - started, False
+            return time.perf_counter() - started, True
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(request, audios))
+
+    def close(self):
+        self.pipeline.close()
+
+
+# app-tested.py is a Streamlit script, so it is loaded with its secrets in a
+# temporary .streamlit/secrets.toml and the fakes registered as its AWS
+# clients before anything uses them. It is loaded once and every run shares
+# its caches and job tracker; only the transcript length changes per run.
+class APITarget:
+    name = "api"
+    _app = None
+    _fakes = None
+
+    def __init__(self, args, audio_seconds):
+        if APITarget._app is None:
+            APITarget._app = self._load(args)
+            APITarget._fakes = fake_clients(args, audio_seconds)
+            for service, client in APITarget._fakes.items():
+                APITarget._app.pipeline.clients.register(service, client)
+            APITarget._app.pipeline.tracker.initial_delay = args.poll_interval
+        APITarget._fakes["transcribe"].transcript = lambda job_name: synthetic_transcript(audio_seconds, job_name)
+
+    @staticmethod
+    def _load(args):
+        workdir = Path(tempfile.mkdtemp(prefix="stt-benchmark-"))
+        (workdir / ".streamlit").mkdir()
+        (workdir / ".streamlit" / "secrets.toml").write_text(
+            "".join(f"{name} = {json.dumps(value)}\n" for name, value in settings(args).items()))
+        os.chdir(workdir)
+        # Outside `streamlit run` every element call warns about the missing script context
+        logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+        spec = importlib.util.spec_from_file_location("app_tested", ROOT / "app-tested.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def run(self, audios, concurrency):
+        return asyncio.run(self._run(audios, concurrency))
+
+    async def _run(self, audios, concurrency):
+        import httpx
+
+        semaphore = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=APITarget._app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def request(audio):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post("/transcribe", content=audio,
+                                                 headers={"content-type": "application/octet-stream"})
+                    ok = response.status_code == 200 and response.json().get("summary") is not None
+                    return time.perf_counter() - started, ok
+
+            return await asyncio.gather(*(request(audio) for audio in audios))
+
+    def close(self):
+        pass
+
+
+TARGETS = {"pipeline": PipelineTarget, "api": APITarget}
+
+
+def run_one(target_class, args, concurrency, audio_seconds, run_index):
+    target = target_class(args, audio_seconds)
+    first_seed = args.seed + run_index * 1_000_000
+    audios = [synthetic_wav(audio_seconds, args.sample_rate, args.speech_ratio, first_seed + i)
+              for i in range(args.requests)]
+
+    metrics.reset()
+    reset_peak_rss()
+    cpu_started, started = time.process_time(), time.perf_counter()
+    results = target.run(audios, concurrency)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    target.close()
+
+    latencies = [latency for latency, ok in results if ok]
+    completed = len(latencies)
+    return {
+        "target": target_class.name,
+        "concurrency": concurrency,
+        "audio_seconds": audio_seconds,
+        "requests": len(results),
+        "errors": len(results) - completed,
+        "wall_seconds": wall,
+        "throughput_rps": completed / wall if wall else None,
+        "audio_seconds_per_second": completed * audio_seconds / wall if wall else None,
+        "latency_seconds": {
+            "mean": sum(latencies) / completed if completed else None,
+            "p50": quantile(latencies, 0.5),
+            "p95": quantile(latencies, 0.95),
+            "p99": quantile(latencies, 0.99),
+            "max": max(latencies, default=None),
+        },
+        "cpu_seconds": cpu,
+        "cpu_seconds_per_request": cpu / len(results) if results else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": metrics.stage_summary(),
+        "errors_by_code": metrics.error_summary(),
+    }
+
+
+# Fastest of `repeat` cold imports of `module`, each in a fresh interpreter,
+# in milliseconds, and which of `heavy` it loaded
+def import_time(module, heavy, repeat=3):
+    script = ("import json, sys, time\n"
+              "started = time.perf_counter()\n"
+              f"import {module}\n"
+              "elapsed = (time.perf_counter() - started) * 1000\n"
+              f"print(json.dumps([elapsed, [name for name in {list(heavy)!r} if name in sys.modules]]))")
+    best, loaded = None, []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+        elapsed, loaded = json.loads(result.stdout.splitlines()[-1])
+        best = elapsed if best is None else min(best, elapsed)
+    return best, loaded
+
+
+def check_imports(repeat=3):
+    rows = []
+    for module, (budget, heavy) in IMPORT_BUDGETS.items():
+        elapsed, loaded = import_time(module, heavy, repeat)
+        rows.append({"module": module, "milliseconds": elapsed, "budget_milliseconds": budget,
+                     "heavy_modules": loaded, "ok": elapsed <= budget and not loaded})
+    return rows
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+# Relative change of each headline number against the matching run in an
+# earlier report; negative is faster or smaller except for throughput
+def compare(report, baseline):
+    def key(run):
+        return run["target"], run["concurrency"], run["audio_seconds"]
+
+    def change(new, old):
+        return (new - old) / old if new is not None and old else None
+
+    earlier = {key(run): run for run in baseline["runs"]}
+    rows = []
+    for run in report["runs"]:
+        old = earlier.get(key(run))
+        if old is None:
+            continue
+        rows.append({
+            "target": run["target"], "concurrency": run["concurrency"], "audio_seconds": run["audio_seconds"],
+            "throughput_rps": change(run["throughput_rps"], old["throughput_rps"]),
+            "p50": change(run["latency_seconds"]["p50"], old["latency_seconds"]["p50"]),
+            "p95": change(run["latency_seconds"]["p95"], old["latency_seconds"]["p95"]),
+            "p99": change(run["latency_seconds"]["p99"], old["latency_seconds"]["p99"]),
+            "cpu_seconds_per_request": change(run["cpu_seconds_per_request"], old["cpu_seconds_per_request"]),
+            "peak_rss_mb": change(run["peak_rss_mb"], old["peak_rss_mb"]),
+        })
+    return rows
+
+
+def describe(run):
+    latency = run["latency_seconds"]
+    if latency["p50"] is None:
+        return (f"{run['target']:<8} c={run['concurrency']:<3} {run['audio_seconds']:>6.0f}s audio  "
+                f"all {run['requests']} requests failed")
+    return (f"{run['target']:<8} c={run['concurrency']:<3} {run['audio_seconds']:>6.0f}s audio  "
+            f"{run['throughput_rps']:7.2f} req/s  p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  "
+            f"p99 {latency['p99']:.3f}s  cpu {run['cpu_seconds_per_request'] * 1000:.1f} ms/req  "
+            f"rss {run['peak_rss_mb']:.0f} MiB  {run['errors']} errors")
+
+
+def number_list(kind):
+    return lambda value: [kind(part) for part in value.split(",") if part]
+
+
+def latency_range(value):
+    low, _, high = value.partition(":")
+    return float(low), float(high or low)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline and /transcribe against local AWS fakes.")
+    parser.add_argument("--targets", type=number_list(str), default=["pipeline", "api"], help="pipeline,api")
+    parser.add_argument("--concurrency", type=number_list(int), default=[1, 8], help="comma-separated")
+    parser.add_argument("--audio-seconds", type=number_list(float), default=[30.0], help="comma-separated")
+    parser.add_argument("--requests", type=int, default=20, help="requests per run")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="of the uploaded WAV")
+    parser.add_argument("--speech-ratio", type=float, default=0.7, help="share of the audio that is speech")
+    parser.add_argument("--job-latency", type=latency_range, default=(0.5, 2.0),
+                        help="Transcribe job duration in seconds, MIN:MAX")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="first job poll after this many seconds")
+    parser.add_argument("--s3-latency", type=float, default=0.01, help="seconds per S3 request")
+    parser.add_argument("--bedrock-latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=80.0, help="Bedrock output tokens per second")
+    parser.add_argument("--segment-seconds", type=float, default=0, help="split long audio (0 = off)")
+    parser.add_argument("--codec", default="flac", help="upload codec: flac, opus or wav")
+    parser.add_argument("--no-trim", action="store_true", help="upload silence too")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--imports", action="store_true", help="only check cold import times against their budgets")
+    args = parser.parse_args(argv)
+    args.concurrency_max = max(args.concurrency)
+
+    if args.imports:
+        rows = check_imports()
+        for row in rows:
+            heavy = f"  loads {', '.join(row['heavy_modules'])}" if row["heavy_modules"] else ""
+            print(f"{row['module']:<28} {row['milliseconds']:7.0f} ms  budget {row['budget_milliseconds']:>5} ms  "
+                  f"{'ok' if row['ok'] else 'OVER'}{heavy}", file=sys.stderr)
+        output = json.dumps({"environment": environment(), "imports": rows}, indent=2)
+        if args.output:
+            Path(args.output).write_text(output + "\n")
+        else:
+            print(output)
+        return 0 if all(row["ok"] for row in rows) else 1
+
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    # Keep the benchmark's caches away from the real ones
+    os.environ["STT_CACHE_DIR"] = tempfile.mkdtemp(prefix="stt-benchmark-cache-")
+
+    report = {"environment": environment(), "config": {name: value for name, value in vars(args).items()
+                                                       if name not in ("output", "compare")}, "runs": []}
+    for name in args.targets:
+        for audio_seconds in args.audio_seconds:
+            for concurrency in args.concurrency:
+                run = run_one(TARGETS[name], args, concurrency, audio_seconds, len(report["runs"]))
+                report["runs"].append(run)
+                print(describe(run), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+        for row in report["comparison"]:
+            print(f"{row['target']:<8} c={row['concurrency']:<3} {row['audio_seconds']:>6.0f}s audio  " + "  ".join(
+                f"{name} {value:+.1%}" for name, value in row.items()
+                if name not in ("target", "concurrency", "audio_seconds") and value is not None), file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    return 1 if any(run["errors"] for run in report["runs"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
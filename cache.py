@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stt-poc")
+
+
+# SHA-256 of raw bytes, or of a file object read in chunks (rewound afterwards)
+def audio_hash(audio):
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(audio).hexdigest()
+    digest = hashlib.sha256()
+    audio.seek(0)
+    for chunk in iter(lambda: audio.read(1024 * 1024), b""):
+        digest.update(chunk)
+    audio.seek(0)
+    return digest.hexdigest()
+
+
+# Key for a summary request. Dicts are serialised with sorted keys and line
+# endings are normalised, so only a real change to the prompt, transcript,
+# model or inference settings produces a new key.
+def summary_key(prompt, text, model_id, inference_config=None, additional_fields=None):
+    payload = json.dumps({
+        'prompt': prompt.replace("\r\n", "\n").strip(),
+        'text': text.replace("\r\n", "\n").strip(),
+        'model_id': model_id,
+        'inference_config': inference_config or {},
+        'additional_fields': additional_fields or {},
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Short, stable hash of a dict of settings, for namespacing cache keys
+def settings_fingerprint(settings):
+    payload = json.dumps(settings, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_path(file_name):
+    cache_dir = os.getenv("STT_CACHE_DIR", DEFAULT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, file_name)
+
+
+# In-process LRU tier. Values are kept as-is; expired entries are dropped on read.
+class MemoryCache:
+    def __init__(self, max_entries=256, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Persistent SQLite tier. Values must be JSON-serialisable. Entries older than
+# ttl are purged lazily, and the least recently used rows are evicted once the
+# stored payload grows past max_bytes.
+class DiskCache:
+    def __init__(self, path, ttl=None, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl is not None and now - stored_at > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._evict(now)
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _evict(self, now):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM entries WHERE stored_at < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+# Memory tier in front of an optional disk tier; disk hits are promoted.
+class TieredCache:
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.stats['disk_hits'] += 1
+                self.memory.set(key, value)
+        self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+
+# upload() returns the S3 key, or a dict with 's3_key' and other fields to
+# keep with the transcript (such as the map left by silence trimming)
+def upload_entry(stored):
+    return dict(stored) if isinstance(stored, dict) else {'s3_key': stored}
+
+
+# Maps the SHA-256 of the audio bytes to its S3 key, Transcribe job and
+# transcript, so resubmitting identical audio skips the upload and the job.
+# Entries are stored under `namespace` (a settings_fingerprint of whatever
+# changes the upload or the transcript), so a cache shared by differently
+# configured pipelines never answers with another configuration's result.
+# Callers still look entries up by digest.
+class TranscriptCache(TieredCache):
+    def __init__(self, max_entries=256, ttl=7 * 24 * 3600, path=None, max_bytes=256 * 1024 * 1024, namespace=None):
+        disk = DiskCache(path, ttl=ttl, max_bytes=max_bytes) if path else None
+        super().__init__(MemoryCache(max_entries=max_entries, ttl=ttl), disk)
+        self.namespace = namespace
+
+    def _key(self, digest):
+        return f"{self.namespace}:{digest}" if self.namespace else digest
+
+    def get(self, digest):
+        return super().get(self._key(digest))
+
+    def set(self, digest, value):
+        super().set(self._key(digest), value)
+
+    def delete(self, digest):
+        super().delete(self._key(digest))
+
+    # `audio` is raw bytes or a readable file object; pass `digest` when the
+    # hash was computed while receiving a file. upload(audio, digest) stores
+    # it (see upload_entry for what it returns); transcribe(file_name) returns
+    # (job_name, transcript, segments) and raises when the job fails, where
+    # segments is a JSON-serialisable dict or None. Returns the cache entry,
+    # with 'transcript' and, when there are any, 'segments'.
+    def get_or_transcribe(self, audio, upload, transcribe, digest=None):
+        digest, entry = self._prepare(audio, upload, digest)
+        if 'transcript' in entry:
+            return entry
+        return self._remember(digest, entry, *transcribe(entry['s3_key']))
+
+    # Same as get_or_transcribe, for an awaitable transcribe(file_name)
+    async def get_or_transcribe_async(self, audio, upload, transcribe, digest=None):
+        # Hashing and the upload are blocking, so keep them off the event loop
+        digest, entry = await asyncio.to_thread(self._prepare, audio, upload, digest)
+        if 'transcript' in entry:
+            return entry
+        return await asyncio.to_thread(self._remember, digest, entry, *await transcribe(entry['s3_key']))
+
+    # For audio that is already stored in S3 under file_name
+    def get_or_transcribe_stored(self, digest, file_name, transcribe):
+        entry = self.get(digest) or {'s3_key': file_name}
+        if 'transcript' in entry:
+            return entry
+        return self._remember(digest, entry, *transcribe(entry['s3_key']))
+
+    # Record where the audio with this hash is stored; `stored` is what
+    # upload() returned
+    def remember_upload(self, digest, stored):
+        if self.get(digest) is None:
+            self.set(digest, upload_entry(stored))
+
+    def _prepare(self, audio, upload, digest=None):
+        digest = digest or audio_hash(audio)
+        entry = self.get(digest) or {}
+        if 'transcript' not in entry and 's3_key' not in entry:
+            # Remember the upload on its own so a failed job doesn't re-upload
+            entry = upload_entry(upload(audio, digest))
+            self.set(digest, entry)
+        return digest, entry
+
+    def _remember(self, digest, entry, job_name, transcript, segments=None):
+        entry = dict(entry, job_name=job_name, transcript=transcript)
+        if segments is not None:
+            entry['segments'] = segments
+        self.set(digest, entry)
+        return entry
+
+
+# Bedrock summaries keyed by summary_key(). Editing the transcript changes the
+# key, so only that entry is recomputed; other summaries stay cached.
+class SummaryCache(TieredCache):
+    def __init__(self, max_entries=512, ttl=30 * 24 * 3600, path=None, max_bytes=64 * 1024 * 1024):
+        disk = DiskCache(path, ttl=ttl, max_bytes=max_bytes) if path else None
+        super().__init__(MemoryCache(max_entries=max_entries, ttl=ttl), disk)
+
+    # summarize() is only called on a miss; it should raise on failure so
+    # errors are never cached as summaries.
+    def get_or_summarize(self, key, summarize):
+        summary = self.get(key)
+        if summary is None:
+            summary = summarize()
+            self.set(key, summary)
+        return summary
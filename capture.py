@@ -0,0 +1,125 @@
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+from audio_io import encode_audio, wav_header
+
+# Recordings longer than this go to a memory-mapped spool file instead of RAM
+SPOOL_SECONDS = 300
+
+
+# Little-endian int16 samples as a flat byte view, without copying when they
+# are already contiguous
+def pcm_bytes(samples):
+    return memoryview(np.ascontiguousarray(samples, dtype="<i2")).cast("B")
+
+
+# Preallocated int16 storage for a whole recording, filled from the audio
+# callback. Recordings over spool_seconds are backed by a temporary
+# memory-mapped file so long sessions don't pin RAM. Input overflows the
+# device reports (samples lost before they reached us) are counted.
+class CaptureBuffer:
+    def __init__(self, capacity, sample_rate, channels=1, spool_seconds=SPOOL_SECONDS, spool_dir=None):
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = 0
+        self.overflows = 0
+        self._spool = None
+        if capacity > spool_seconds * sample_rate:
+            self._spool = tempfile.TemporaryFile(dir=spool_dir, prefix="capture-")
+            self.samples = np.memmap(self._spool, dtype="<i2", mode="w+", shape=(capacity, channels))
+        else:
+            self.samples = np.zeros((capacity, channels), dtype="<i2")
+        self._ready = threading.Condition()
+
+    @property
+    def full(self):
+        return self.frames >= self.capacity
+
+    @property
+    def spooled(self):
+        return self._spool is not None
+
+    # Called from the audio thread with each block; copies it in and nothing else
+    def put(self, block, overflowed=False):
+        count = min(len(block), self.capacity - self.frames)
+        self.samples[self.frames:self.frames + count] = block[:count]
+        with self._ready:
+            self.frames += count
+            self.overflows += bool(overflowed)
+            self._ready.notify_all()
+
+    # Frames captured so far, once there are more than `position` or after timeout
+    def wait(self, position, timeout=None):
+        with self._ready:
+            self._ready.wait_for(lambda: self.frames > position, timeout)
+            return self.frames
+
+    # int16 (frames, channels) view of the captured audio; no copy
+    def view(self, start=0, end=None):
+        return self.samples[start:self.frames if end is None else end]
+
+    # WAV header and a byte view of the samples; write them in order to get the file
+    def wav_chunks(self):
+        pcm = pcm_bytes(self.view())
+        return [wav_header(len(pcm), self.sample_rate, self.channels), pcm]
+
+    def write_wav(self, fileobj):
+        for chunk in self.wav_chunks():
+            fileobj.write(chunk)
+
+    # The WAV file in one bytes object, for APIs that need one; this is the only copy
+    def wav_bytes(self):
+        return b"".join(self.wav_chunks())
+
+    # SHA-256 of the WAV file, hashed from the buffer in place
+    def sha256(self):
+        digest = hashlib.sha256()
+        for chunk in self.wav_chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    # (bytes, media_format) in another codec, e.g. "flac" (see audio_io.encode_audio)
+    def encode(self, codec="flac"):
+        return encode_audio(self.view()[:, 0] if self.channels == 1 else self.view(), self.sample_rate, codec)
+
+    # Removes the spool file; views already handed out stay readable until released
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+
+# Records `duration` seconds with the sounddevice callback API into a
+# CaptureBuffer. The callback only copies; consume(block) runs on the calling
+# thread with each newly captured int16 (frames, channels) view, so slow
+# consumers (uploads, live transcription) never make the device overflow.
+def record(duration, sample_rate, consume=None, device=None, channels=1, blocksize=1024, **buffer_options):
+    import sounddevice as sd
+
+    buffer = CaptureBuffer(int(duration * sample_rate), sample_rate, channels, **buffer_options)
+
+    def callback(indata, frames, time_info, status):
+        buffer.put(indata, status.input_overflow)
+        if buffer.full:
+            raise sd.CallbackStop
+
+    try:
+        with sd.InputStream(samplerate=sample_rate, channels=channels, dtype="int16", device=device,
+                            blocksize=blocksize, callback=callback) as stream:
+            position = 0
+            while True:
+                frames = buffer.wait(position, timeout=0.5)
+                if frames > position:
+                    if consume is not None:
+                        consume(buffer.view(position, frames))
+                    position = frames
+                elif buffer.full or not stream.active:
+                    break
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
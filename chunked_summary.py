@@ -0,0 +1,334 @@
+import hashlib
+import re
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import summary_key
+from prompt_builder import PromptBuilder, estimate_tokens
+
+MAP_PROMPT = "Summarize this part of a longer transcript. Keep names, decisions, numbers and action items: "
+REDUCE_PROMPT = "These are summaries of consecutive parts of one transcript. Merge them into a single summary: "
+
+SPEAKER_LINE = re.compile(r"^\s*(?:spk_\d+|speaker\s*\d+|[A-Z][\w .'-]{0,40}):", re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _units(text):
+    # Speaker turns when the transcript is line-per-speaker, otherwise sentences
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) > 1 and sum(1 for line in lines if SPEAKER_LINE.match(line)) * 2 >= len(lines):
+        return lines
+    return [s for s in SENTENCE_END.split(text) if s.strip()]
+
+
+def _split_oversized(unit, max_tokens, model_id=None):
+    if estimate_tokens(unit, model_id) <= max_tokens:
+        return [unit]
+    sentences = SENTENCE_END.split(unit)
+    if len(sentences) > 1:
+        return [piece for s in sentences for piece in _split_oversized(s, max_tokens, model_id)]
+    # A single run-on "sentence": fall back to word windows
+    words = unit.split()
+    per_piece = max(1, max_tokens * 4 // 6)
+    return [" ".join(words[i:i + per_piece]) for i in range(0, len(words), per_piece)]
+
+
+# True for about `probability` of all units, decided by the unit's text alone
+def _is_boundary(unit, probability):
+    digest = hashlib.blake2b(unit.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < probability * 2 ** 64
+
+
+# Split on speaker or sentence boundaries into chunks of at most max_tokens
+# (as estimated for model_id). Boundaries are content-defined: once a chunk
+# holds half the budget it ends after any unit whose hash picks it, with odds
+# proportional to the unit's tokens, so chunks average three quarters of the
+# budget. An edit only moves the boundaries next to it; the other chunks keep
+# their text, and so their summary cache keys.
+def split_transcript(text, max_tokens, model_id=None):
+    min_tokens, spread = max(1, max_tokens // 2), max(1, max_tokens // 4)
+    chunks, current, current_tokens = [], [], 0
+    for unit in _units(text):
+        for piece in _split_oversized(unit, max_tokens, model_id):
+            tokens = estimate_tokens(piece, model_id)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+            if current_tokens >= min_tokens and _is_boundary(piece, tokens / spread):
+                chunks.append(current)
+                current, current_tokens = [], 0
+    if current:
+        chunks.append(current)
+    separator = "\n" if "\n" in text else " "
+    return [separator.join(chunk) for chunk in chunks]
+
+
+# Map-reduce summarization over Bedrock's converse API. Transcripts that fit
+# in chunk_tokens go out as one request; longer ones are split, the chunks are
+# summarized concurrently on a bounded pool, and the partial summaries are
+# merged, recursively if they are still over budget. Every call goes through
+# the summary cache, so editing the transcript only re-summarizes the chunks
+# that actually changed. Other models plug in by overriding _generate.
+# Transcripts are compacted by the prompt builder first, chunks never exceed
+# its input budget, and the token counts Bedrock reports for every request go
+# to `usage`.
+class ChunkedSummarizer:
+    def __init__(self, bedrock_client, model_id, inference_config, additional_fields=None, cache=None,
+                 chunk_tokens=4000, max_workers=4, max_depth=4,
+                 map_prompt=MAP_PROMPT, reduce_prompt=REDUCE_PROMPT, prompt_builder=None, usage=None):
+        self.client = bedrock_client
+        self.model_id = model_id
+        self.inference_config = inference_config
+        self.additional_fields = additional_fields or {}
+        self.cache = cache
+        self.chunk_tokens = chunk_tokens
+        self.max_depth = max_depth
+        self.map_prompt = map_prompt
+        self.reduce_prompt = reduce_prompt
+        self.prompt_builder = prompt_builder or PromptBuilder(
+            model_id, max_output_tokens=(inference_config or {}).get("maxTokens", 4096))
+        self.usage = usage if usage is not None else UsageLog()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarize")
+
+    def summarize(self, text, prompt):
+        return self._cached(prompt, text,
+                            lambda: self._generate(prompt, self._condense(self.prompt_builder.prepare(text))))
+
+    # Streaming variant: the map phase (if any) runs as usual and the final
+    # pass is streamed through converse_stream. The finished text is cached.
+    def summarize_stream(self, text, prompt):
+        started = time.monotonic()
+        key = self._key(prompt, text)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            return SummaryStream([{"contentBlockDelta": {"delta": {"text": cached}}}], started)
+
+        request = self._request(prompt, self._condense(self.prompt_builder.prepare(text)))
+        response = self.client.converse_stream(**request)
+        stream = SummaryStream(response["stream"], started)
+
+        def on_complete(summary):
+            self._record(request, stream.usage, stream.latency_ms, streamed=True)
+            if self.cache is not None:
+                self.cache.set(key, summary)
+
+        stream.on_complete = on_complete
+        return stream
+
+    # Shrink text until it fits in one request by summarizing its chunks
+    def _condense(self, text):
+        depth = 0
+        longest_prompt = max(self.map_prompt, self.reduce_prompt, key=len)
+        chunk_tokens = min(self.chunk_tokens, self.prompt_builder.budget(longest_prompt))
+        while self.prompt_builder.estimate(text) > chunk_tokens and depth < self.max_depth:
+            chunks = split_transcript(text, chunk_tokens, self.model_id)
+            map_prompt = self.map_prompt if depth == 0 else self.reduce_prompt
+            partials = list(self.pool.map(lambda chunk: self.summarize_chunk(chunk, map_prompt), chunks))
+            text = "\n\n".join(partials)
+            depth += 1
+        return text
+
+    # Stops the map-phase worker threads
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+    def summarize_chunk(self, chunk, prompt):
+        return self._cached(prompt, chunk, lambda: self._generate(prompt, chunk))
+
+    def _key(self, prompt, text):
+        return summary_key(prompt, text, self.model_id, self.inference_config, self.additional_fields)
+
+    def _cached(self, prompt, text, compute):
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_summarize(self._key(prompt, text), compute)
+
+    # Anything still over the input budget (after max_depth rounds) is truncated
+    def _request(self, prompt, text):
+        return {
+            "modelId": self.model_id,
+            "messages": [{"role": "user", "content": [{"text": prompt + self.prompt_builder.fit(prompt, text)}]}],
+            "inferenceConfig": self.inference_config,
+            "additionalModelRequestFields": self.additional_fields,
+        }
+
+    def _generate(self, prompt, text):
+        request = self._request(prompt, text)
+        response = self.client.converse(**request)
+        self._record(request, response.get("usage"), response.get("metrics", {}).get("latencyMs"))
+        return response["output"]["message"]["content"][0]["text"]
+
+    def _record(self, request, usage, latency_ms, streamed=False):
+        prompt_text = request["messages"][0]["content"][0]["text"]
+        self.usage.record(self.model_id, usage, latency_ms, self.prompt_builder.estimate(prompt_text), streamed)
+
+
+# Token counts and latency Bedrock reported for each request (the `usage` and
+# `metrics` fields of converse/converse_stream), next to our own input
+# estimate. Keeps the most recent max_entries requests and running totals.
+class UsageLog:
+    def __init__(self, max_entries=1000):
+        self.entries = deque(maxlen=max_entries)
+        self.totals = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, model_id, usage, latency_ms=None, estimated_input_tokens=None, streamed=False):
+        usage = usage or {}
+        entry = {
+            "time": time.time(),
+            "model_id": model_id,
+            "input_tokens": usage.get("inputTokens"),
+            "output_tokens": usage.get("outputTokens"),
+            "estimated_input_tokens": estimated_input_tokens,
+            "latency_ms": latency_ms,
+            "streamed": streamed,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            self.totals["requests"] += 1
+            for name in ("input_tokens", "output_tokens", "estimated_input_tokens", "latency_ms"):
+                self.totals[name] += entry[name] or 0
+
+    def summary(self):
+        with self._lock:
+            return dict(self.totals)
+
+
+# Iterates the text deltas of a converse_stream response and records
+# time-to-first-token and output tokens/sec once the stream is consumed.
+class SummaryStream:
+    def __init__(self, events, started, on_complete=None):
+        self.events = events
+        self.started = started
+        self.on_complete = on_complete
+        self.text = None
+        self.time_to_first_token = None
+        self.elapsed = None
+        self.output_tokens = None
+        self.input_tokens = None
+        self.usage = None
+        self.latency_ms = None
+        self.stop_reason = None
+
+    def __iter__(self):
+        parts = []
+        for event in self.events:
+            if "contentBlockDelta" in event:
+                delta = event["contentBlockDelta"]["delta"].get("text", "")
+                if not delta:
+                    continue
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.monotonic() - self.started
+                parts.append(delta)
+                yield delta
+            elif "messageStop" in event:
+                self.stop_reason = event["messageStop"].get("stopReason")
+            elif "metadata" in event:
+                self.usage = event["metadata"].get("usage", {})
+                self.output_tokens = self.usage.get("outputTokens")
+                self.input_tokens = self.usage.get("inputTokens")
+                self.latency_ms = event["metadata"].get("metrics", {}).get("latencyMs")
+
+        self.elapsed = time.monotonic() - self.started
+        self.text = "".join(parts)
+        if self.output_tokens is None:
+            self.output_tokens = estimate_tokens(self.text)
+        if self.on_complete is not None:
+            self.on_complete(self.text)
+
+    @property
+    def tokens_per_second(self):
+        if self.elapsed is None or self.time_to_first_token is None:
+            return None
+        generation_time = self.elapsed - self.time_to_first_token
+        return self.output_tokens / generation_time if generation_time > 0 else None
+
+    def stats(self):
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "elapsed": self.elapsed,
+            "output_tokens": self.output_tokens,
+            "input_tokens": self.input_tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "stop_reason": self.stop_reason,
+        }
+
+
+def describe_stats(stats):
+    if stats.get("time_to_first_token") is None:
+        return "No output"
+    line = f"First token after {stats['time_to_first_token']:.2f}s"
+    if stats.get("tokens_per_second") is not None:
+        line += f", {stats['output_tokens']} tokens at {stats['tokens_per_second']:.0f} tokens/s"
+    if stats.get("input_tokens") is not None:
+        line += f" from {stats['input_tokens']} input tokens"
+    return line
+
+
+if __name__ == "__main__":
+    # Offline check against a stub Bedrock client: python chunked_summary.py
+    import argparse
+    import random
+
+    from cache import SummaryCache
+    from fake_aws import FakeBedrockClient
+
+    parser = argparse.ArgumentParser(description="Check map-reduce summaries and cache reuse against a fake Bedrock")
+    parser.add_argument("--model-id", default="amazon.titan-text-express-v1")
+    parser.add_argument("--chunk-tokens", type=int, default=800)
+    parser.add_argument("--sentences", type=int, default=300)
+    parser.add_argument("--edits", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = "budget team review plan launch customer quarter update design issue timeline release".split()
+    sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(6, 14))).capitalize() + "."
+                 for _ in range(args.sentences)]
+    text = " ".join(sentences)
+
+    client = FakeBedrockClient(latency=0, tokens_per_second=float("inf"))
+    summarizer = ChunkedSummarizer(client, args.model_id, {"maxTokens": 512}, cache=SummaryCache(),
+                                   chunk_tokens=args.chunk_tokens)
+
+    def map_requests(start):
+        return [request["messages"][0]["content"][0]["text"][len(MAP_PROMPT):]
+                for request in client.requests[start:]
+                if request["messages"][0]["content"][0]["text"].startswith(MAP_PROMPT)]
+
+    # The chunks _condense sees: the transcript after the prompt builder compacts it
+    def chunks_of(transcript):
+        return split_transcript(summarizer.prompt_builder.prepare(transcript), args.chunk_tokens, args.model_id)
+
+    chunks = chunks_of(text)
+    summary = summarizer.summarize(text, "Summarize: ")
+    # One map request per chunk, and the summary is what the final request returned
+    assert sorted(map_requests(0)) == sorted(chunks), "map requests differ from the chunks"
+    assert len(chunks) > 1 and all(estimate_tokens(c, args.model_id) <= args.chunk_tokens for c in chunks)
+    final = client.requests[-1]["messages"][0]["content"][0]["text"].split()
+    assert summary == " ".join(final[:max(1, int(len(final) * client.summary_ratio))]), "summary is not the reduce output"
+
+    calls = client.calls["converse"]
+    assert summarizer.summarize(text, "Summarize: ") == summary and client.calls["converse"] == calls, \
+        "an unchanged transcript was summarized again"
+
+    # Inserting a sentence anywhere re-runs only the chunks not summarized before
+    rerun, seen = [], set(chunks)
+    for _ in range(args.edits):
+        position = rng.randrange(len(sentences))
+        edited = " ".join(sentences[:position] + ["The customer asked about the launch date again."]
+                          + sentences[position:])
+        start = len(client.requests)
+        summarizer.summarize(edited, "Summarize: ")
+        changed = set(chunks_of(edited)) - seen
+        assert sorted(map_requests(start)) == sorted(changed), "a chunk that did not change was summarized again"
+        rerun.append(len(changed))
+        seen |= changed
+    summarizer.pool.shutdown()
+
+    print(f"{len(chunks)} chunks, {calls} requests for the first summary, none for a repeat; "
+          f"an edit re-summarized {sum(rerun) / len(rerun):.1f} chunks on average (at most {max(rerun)})")
@@ -0,0 +1,22 @@
+import streamlit as st
+
+from metrics import registry
+
+
+# Sidebar view of the metrics this process has recorded: time per pipeline
+# stage, failures by error code and the gauges exported on /metrics
+def show_debug_panel(metrics=registry):
+    with st.sidebar.expander("Pipeline metrics"):
+        stages = metrics.stage_summary()
+        if not stages:
+            st.caption("Nothing recorded yet")
+            return
+        st.dataframe(stages, column_config={name: st.column_config.NumberColumn(format="%.3f s")
+                                            for name in ("total", "mean", "p50", "p95", "p99")})
+        errors = metrics.error_summary()
+        if errors:
+            st.markdown("**Errors**")
+            st.dataframe(errors)
+        for prefix, values in metrics.source_values().items():
+            st.markdown(f"**{prefix}**")
+            st.json(values, expanded=False)
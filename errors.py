@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+
+from job_tracker import error_code as service_error_code
+
+
+# A failed pipeline stage. `stage` says where (upload, transcribe, summarize)
+# and `code` is a short reason: the AWS error code, the Transcribe failure
+# reason or the exception type. API responses send to_dict() instead of
+# putting the message where a transcript or summary would go.
+class PipelineError(Exception):
+    stage = "pipeline"
+
+    def __init__(self, message, code=None, stage=None):
+        super().__init__(message)
+        self.code = code or "Error"
+        if stage is not None:
+            self.stage = stage
+
+    def to_dict(self):
+        return {"stage": self.stage, "code": self.code, "message": str(self)}
+
+
+class UploadError(PipelineError):
+    stage = "upload"
+
+
+class TranscriptionError(PipelineError):
+    stage = "transcribe"
+
+
+class SummarizationError(PipelineError):
+    stage = "summarize"
+
+
+def error_code(exc):
+    if isinstance(exc, PipelineError):
+        return exc.code
+    return service_error_code(exc) or type(exc).__name__
+
+
+# {"stage", "code", "message"} for any exception, for job records and API errors
+def error_details(exc):
+    if isinstance(exc, PipelineError):
+        return exc.to_dict()
+    return {"stage": None, "code": error_code(exc), "message": str(exc)}
+
+
+# Re-raises anything that isn't a PipelineError yet as error_class, keeping
+# the original as __cause__ and its code
+@contextmanager
+def reraise_as(error_class):
+    try:
+        yield
+    except PipelineError:
+        raise
+    except Exception as e:
+        raise error_class(str(e), code=error_code(e)) from e
@@ -0,0 +1,291 @@
+import io
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+
+class FakeClientError(Exception):
+    # Shaped like botocore.exceptions.ClientError so callers can read .response
+    def __init__(self, code, message, operation_name):
+        super().__init__(f"An error occurred ({code}) when calling the {operation_name} operation: {message}")
+        self.response = {'Error': {'Code': code, 'Message': message}}
+        self.operation_name = operation_name
+
+
+# In-memory stand-in for boto3.client('transcribe'). Jobs finish after a
+# random latency drawn from `latency`; a fraction of polls can be throttled.
+# `transcript` is the text of every job, or a function of the job name.
+# Jobs started with OutputBucketName have their result JSON put into
+# `s3_client` (e.g. a FakeS3Client) when they complete.
+class FakeTranscribeClient:
+    def __init__(self, latency=(0.5, 5.0), failure_rate=0.0, throttle_rate=0.0,
+                 transcript="This is a fake transcript.", seed=None, s3_client=None, word_seconds=0.4):
+        self.latency = latency
+        self.s3_client = s3_client
+        self.word_seconds = word_seconds
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.transcript = transcript
+        self.random = random.Random(seed)
+        self.jobs = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def start_transcription_job(self, TranscriptionJobName, Media, LanguageCode=None, **kwargs):
+        with self._lock:
+            self.calls['start_transcription_job'] += 1
+            if TranscriptionJobName in self.jobs:
+                raise FakeClientError('ConflictException', "The requested job name already exists.",
+                                      'StartTranscriptionJob')
+            self.jobs[TranscriptionJobName] = {
+                'media': Media,
+                'settings': dict(kwargs, LanguageCode=LanguageCode),
+                'ready_at': time.monotonic() + self.random.uniform(*self.latency),
+                'created': datetime.now(timezone.utc),
+                'failed': self.random.random() < self.failure_rate,
+            }
+        return {'TranscriptionJob': self._describe(TranscriptionJobName, 'IN_PROGRESS')}
+
+    def get_transcription_job(self, TranscriptionJobName):
+        with self._lock:
+            self.calls['get_transcription_job'] += 1
+            if self.throttle_rate and self.random.random() < self.throttle_rate:
+                raise FakeClientError('ThrottlingException', "Rate exceeded", 'GetTranscriptionJob')
+            job = self.jobs.get(TranscriptionJobName)
+            if job is None:
+                raise FakeClientError('BadRequestException', "The requested job couldn't be found.",
+                                      'GetTranscriptionJob')
+            if time.monotonic() < job['ready_at']:
+                status = 'IN_PROGRESS'
+            else:
+                status = 'FAILED' if job['failed'] else 'COMPLETED'
+            write_output = status == 'COMPLETED' and not job.get('written') and self._output(TranscriptionJobName)
+            job['written'] = job.get('written') or bool(write_output)
+        if write_output:
+            bucket, key = write_output
+            self.s3_client.put_object(Bucket=bucket, Key=key,
+                                      Body=json.dumps(self.transcript_json(TranscriptionJobName)).encode())
+        return {'TranscriptionJob': self._describe(TranscriptionJobName, status)}
+
+    def _output(self, job_name):
+        settings = self.jobs[job_name]['settings']
+        if self.s3_client is None or 'OutputBucketName' not in settings:
+            return None
+        return settings['OutputBucketName'], settings.get('OutputKey', f"{job_name}.json")
+
+    def _describe(self, job_name, status):
+        description = {
+            'TranscriptionJobName': job_name,
+            'TranscriptionJobStatus': status,
+            'Media': self.jobs[job_name]['media'],
+            # Fake jobs start as soon as they are created
+            'CreationTime': self.jobs[job_name]['created'],
+            'StartTime': self.jobs[job_name]['created'],
+        }
+        if status in ('COMPLETED', 'FAILED'):
+            ready_in = self.jobs[job_name]['ready_at'] - time.monotonic()
+            description['CompletionTime'] = datetime.now(timezone.utc) + timedelta(seconds=ready_in)
+        if status == 'COMPLETED':
+            output = self._output(job_name)
+            uri = f"https://s3.fake.local/{output[0]}/{output[1]}" if output else f"https://fake-transcribe.local/{job_name}.json"
+            description['Transcript'] = {'TranscriptFileUri': uri}
+        elif status == 'FAILED':
+            description['FailureReason'] = "Fake failure"
+        return description
+
+    # Output in Transcribe's format, one word every word_seconds. With
+    # ShowSpeakerLabels the speaker changes after every sentence.
+    def transcript_json(self, job_name):
+        settings = self.jobs.get(job_name, {}).get('settings', {}).get('Settings', {})
+        speaker_count = min(2, settings.get('MaxSpeakerLabels', 2)) if settings.get('ShowSpeakerLabels') else 0
+        items, words, sentences = [], 0, 0
+        transcript = self.transcript(job_name) if callable(self.transcript) else self.transcript
+        for token in re.findall(r"[\w']+|[^\w\s]", transcript):
+            if re.match(r"[\w']", token):
+                start = words * self.word_seconds
+                words += 1
+                item = {'type': 'pronunciation', 'start_time': f"{start:.3f}",
+                        'end_time': f"{start + self.word_seconds * 0.9:.3f}",
+                        'alternatives': [{'content': token, 'confidence': "0.99"}]}
+                if speaker_count:
+                    item['speaker_label'] = f"spk_{sentences % speaker_count}"
+                items.append(item)
+            else:
+                items.append({'type': 'punctuation', 'alternatives': [{'content': token, 'confidence': "0.0"}]})
+                sentences += token in ".?!"
+        return {
+            'jobName': job_name,
+            'results': {'transcripts': [{'transcript': transcript}], 'items': items},
+            'status': 'COMPLETED',
+        }
+
+
+# In-memory stand-in for boto3.client('s3') covering plain puts and multipart
+# uploads. Parts are checked against S3's 5 MiB minimum (all but the last) and
+# `latency` is slept per request so overlap with the producer is visible.
+class FakeS3Client:
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.objects = {}
+        self.uploads = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._next_upload = 0
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        time.sleep(self.latency)
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self.calls['put_object'] += 1
+            self.objects[(Bucket, Key)] = data
+        return {'ETag': f'"{hash(data) & 0xffffffff:08x}"'}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read())
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.calls['get_object'] += 1
+            if (Bucket, Key) not in self.objects:
+                raise FakeClientError('NoSuchKey', "The specified key does not exist.", 'GetObject')
+            data = self.objects[(Bucket, Key)]
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, **kwargs):
+        with self._lock:
+            self.calls['list_objects_v2'] += 1
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+            contents = [{'Key': key, 'Size': len(self.objects[(Bucket, key)])} for key in keys[:MaxKeys]]
+        response = {'KeyCount': len(contents), 'IsTruncated': len(keys) > MaxKeys}
+        if contents:
+            response['Contents'] = contents
+        return response
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.calls['create_multipart_upload'] += 1
+            self._next_upload += 1
+            upload_id = f"upload-{self._next_upload}"
+            self.uploads[upload_id] = {'bucket': Bucket, 'key': Key, 'parts': {}}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls['upload_part'] += 1
+            upload = self._upload(UploadId, 'UploadPart')
+            etag = f'"{PartNumber}-{len(Body)}"'
+            upload['parts'][PartNumber] = (etag, bytes(Body))
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        with self._lock:
+            self.calls['complete_multipart_upload'] += 1
+            upload = self._upload(UploadId, 'CompleteMultipartUpload')
+            parts = MultipartUpload['Parts']
+            numbers = [part['PartNumber'] for part in parts]
+            if numbers != sorted(numbers):
+                raise FakeClientError('InvalidPartOrder', "The list of parts was not in ascending order.",
+                                      'CompleteMultipartUpload')
+            chunks = []
+            for i, part in enumerate(parts):
+                etag, data = upload['parts'].get(part['PartNumber'], (None, b""))
+                if etag != part['ETag']:
+                    raise FakeClientError('InvalidPart', "One or more of the specified parts could not be found.",
+                                          'CompleteMultipartUpload')
+                if i < len(parts) - 1 and len(data) < self.MIN_PART_SIZE:
+                    raise FakeClientError('EntityTooSmall', "Your proposed upload is smaller than the minimum "
+                                          "allowed object size.", 'CompleteMultipartUpload')
+                chunks.append(data)
+            del self.uploads[UploadId]
+            self.objects[(Bucket, Key)] = b"".join(chunks)
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self._lock:
+            self.calls['abort_multipart_upload'] += 1
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def _upload(self, upload_id, operation_name):
+        if upload_id not in self.uploads:
+            raise FakeClientError('NoSuchUpload', "The specified upload does not exist.", operation_name)
+        return self.uploads[upload_id]
+
+
+# Stand-in for boto3.client('bedrock-runtime'). The "summary" is the first
+# words of the prompt, so results are deterministic; latency grows with the
+# number of generated tokens.
+class FakeBedrockClient:
+    def __init__(self, latency=0.05, tokens_per_second=200.0, summary_ratio=0.2, recorded_events=None):
+        self.recorded_events = recorded_events
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.summary_ratio = summary_ratio
+        self.calls = Counter()
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def _generate(self, modelId, messages, inferenceConfig=None, **kwargs):
+        with self._lock:
+            self.calls['converse'] += 1
+            self.requests.append({'modelId': modelId, 'messages': messages, 'inferenceConfig': inferenceConfig})
+        text = " ".join(block['text'] for message in messages for block in message['content'])
+        words = text.split()
+        max_tokens = (inferenceConfig or {}).get('maxTokens', 4096)
+        output_words = max(1, min(max_tokens, int(len(words) * self.summary_ratio)))
+        return words[:output_words], len(words)
+
+    def converse(self, modelId, messages, inferenceConfig=None, **kwargs):
+        output, input_tokens = self._generate(modelId, messages, inferenceConfig, **kwargs)
+        time.sleep(self.latency + len(output) / self.tokens_per_second)
+        return {
+            'output': {'message': {'role': 'assistant', 'content': [{'text': " ".join(output)}]}},
+            'stopReason': 'end_turn',
+            'usage': {'inputTokens': input_tokens, 'outputTokens': len(output),
+                      'totalTokens': input_tokens + len(output)},
+            'metrics': {'latencyMs': int((self.latency + len(output) / self.tokens_per_second) * 1000)},
+        }
+
+    # Replays recorded_events when given, otherwise streams the same output
+    # converse() would return. Deltas are paced at tokens_per_second.
+    def converse_stream(self, modelId, messages, inferenceConfig=None, **kwargs):
+        output, input_tokens = self._generate(modelId, messages, inferenceConfig, **kwargs)
+        events = self.recorded_events or recorded_stream_events(" ".join(output), input_tokens=input_tokens)
+
+        def stream():
+            time.sleep(self.latency)
+            for event in events:
+                if 'contentBlockDelta' in event:
+                    delta = event['contentBlockDelta']['delta'].get('text', '')
+                    time.sleep(len(delta.split()) / self.tokens_per_second)
+                yield event
+
+        return {'stream': stream()}
+
+
+# Builds the event sequence of a converse_stream response for `text`
+def recorded_stream_events(text, words_per_delta=3, input_tokens=0):
+    words = text.split(" ")
+    events = [{'messageStart': {'role': 'assistant'}}]
+    for i in range(0, len(words), words_per_delta):
+        delta = " ".join(words[i:i + words_per_delta])
+        if i + words_per_delta < len(words):
+            delta += " "
+        events.append({'contentBlockDelta': {'delta': {'text': delta}, 'contentBlockIndex': 0}})
+    events += [
+        {'contentBlockStop': {'contentBlockIndex': 0}},
+        {'messageStop': {'stopReason': 'end_turn'}},
+        {'metadata': {
+            'usage': {'inputTokens': input_tokens, 'outputTokens': len(words),
+                      'totalTokens': input_tokens + len(words)},
+            'metrics': {'latencyMs': 0},
+        }},
+    ]
+    return events
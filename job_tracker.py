@@ -0,0 +1,233 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+RETRYABLE_ERROR_CODES = (
+    'ThrottlingException',
+    'LimitExceededException',
+    'TooManyRequestsException',
+    'InternalFailureException',
+    'ServiceUnavailable',
+)
+
+
+class TranscriptionTimeout(Exception):
+    pass
+
+
+def error_code(exc):
+    # botocore ClientError (and the fakes) carry the service code in .response
+    return getattr(exc, 'response', {}).get('Error', {}).get('Code')
+
+
+# Seconds a job waited in Transcribe's queue and then ran, from the
+# timestamps in a get_transcription_job description; None where missing
+def job_timings(job):
+    created, started, completed = (job.get(name) for name in ('CreationTime', 'StartTime', 'CompletionTime'))
+    queued = (started - created).total_seconds() if created and started else None
+    running = (completed - started).total_seconds() if started and completed else None
+    return queued, running
+
+
+class _TrackedJob:
+    def __init__(self, job_name, deadline):
+        self.job_name = job_name
+        self.deadline = deadline
+        self.delay = None
+        self.polls = 0
+        self.future = Future()
+
+    # The caller may cancel the future (e.g. asyncio cancellation through
+    # track_async) while a poll is in flight, so settling it can lose that race
+    def settle(self, result=None, exception=None):
+        if self.future.done():
+            return
+        try:
+            if exception is not None:
+                self.future.set_exception(exception)
+            else:
+                self.future.set_result(result)
+        except InvalidStateError:
+            pass
+
+
+class TranscriptionJobTracker:
+    # One poller thread watches every outstanding Transcribe job in the process.
+    # Each job is polled on its own jittered exponential backoff and the thread
+    # never issues more than max_requests_per_second get_transcription_job calls,
+    # so many concurrent sessions share one polling budget instead of each
+    # spinning on the API.
+    def __init__(self, transcribe_client, initial_delay=1.0, max_delay=15.0,
+                 multiplier=1.5, jitter=0.3, deadline=1800.0,
+                 max_requests_per_second=10.0):
+        self.client = transcribe_client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.min_interval = 1.0 / max_requests_per_second if max_requests_per_second else 0.0
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._cancelling = False
+        self._thread = None
+        self.stats = {'tracked': 0, 'polls': 0, 'throttled': 0, 'completed': 0, 'failed': 0, 'timed_out': 0}
+
+    def track(self, job_name, deadline=None):
+        job = _TrackedJob(job_name, time.monotonic() + (deadline or self.deadline))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("tracker is shut down")
+            self._ensure_thread()
+            self.stats['tracked'] += 1
+            self._schedule(job, self.initial_delay)
+            self._cond.notify()
+        return job.future
+
+    async def track_async(self, job_name, deadline=None):
+        return await asyncio.wrap_future(self.track(job_name, deadline))
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    # Stops tracking new jobs. Outstanding futures are cancelled, or with
+    # cancel_pending=False polled until they finish or reach their deadline,
+    # so none is left unsettled.
+    def shutdown(self, cancel_pending=True):
+        with self._cond:
+            self._closed = True
+            if cancel_pending:
+                self._cancelling = True
+                for _, _, job in self._heap:
+                    job.future.cancel()
+                self._heap.clear()
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="transcribe-job-tracker", daemon=True)
+            self._thread.start()
+
+    def _next_delay(self, job, throttled=False):
+        if job.delay is None:
+            job.delay = self.initial_delay
+        else:
+            factor = self.multiplier * (2 if throttled else 1)
+            job.delay = min(self.max_delay, job.delay * factor)
+        spread = job.delay * self.jitter
+        return max(0.0, job.delay + random.uniform(-spread, spread))
+
+    def _schedule(self, job, delay):
+        due = min(time.monotonic() + delay, job.deadline)
+        heapq.heappush(self._heap, (due, next(self._seq), job))
+
+    def _run(self):
+        last_call = 0.0
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        if self._closed:
+                            return
+                        self._cond.wait()
+                        continue
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                _, _, job = heapq.heappop(self._heap)
+
+            if job.future.cancelled():
+                continue
+
+            # Spread calls out so a burst of due jobs stays under the rate limit
+            gap = self.min_interval - (time.monotonic() - last_call)
+            if gap > 0:
+                time.sleep(gap)
+            last_call = time.monotonic()
+            # One bad job must not end the loop every other job is waiting on
+            try:
+                self._poll(job)
+            except Exception as e:
+                job.settle(exception=e)
+
+    def _poll(self, job):
+        job.polls += 1
+        throttled = False
+        try:
+            result = self.client.get_transcription_job(TranscriptionJobName=job.job_name)
+        except Exception as e:
+            if error_code(e) not in RETRYABLE_ERROR_CODES:
+                self.stats['failed'] += 1
+                job.settle(exception=e)
+                return
+            throttled = True
+            self.stats['throttled'] += 1
+        else:
+            self.stats['polls'] += 1
+            status = result['TranscriptionJob']['TranscriptionJobStatus']
+            if status in TERMINAL_STATUSES:
+                self.stats['completed' if status == 'COMPLETED' else 'failed'] += 1
+                job.settle(result)
+                return
+
+        if time.monotonic() >= job.deadline:
+            self.stats['timed_out'] += 1
+            job.settle(exception=TranscriptionTimeout(
+                f"Transcription job {job.job_name} did not finish after {job.polls} polls"))
+            return
+
+        with self._cond:
+            if self._cancelling:
+                job.future.cancel()
+                return
+            self._schedule(job, self._next_delay(job, throttled))
+
+
+if __name__ == "__main__":
+    # Offline load test: python job_tracker.py --jobs 500
+    import argparse
+    import uuid
+    from concurrent.futures import wait
+
+    from fake_aws import FakeTranscribeClient
+
+    parser = argparse.ArgumentParser(description="Load-test the job tracker against a fake Transcribe client")
+    parser.add_argument("--jobs", type=int, default=300)
+    parser.add_argument("--min-latency", type=float, default=0.5)
+    parser.add_argument("--max-latency", type=float, default=5.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.05)
+    parser.add_argument("--rps", type=float, default=200.0)
+    args = parser.parse_args()
+
+    client = FakeTranscribeClient(latency=(args.min_latency, args.max_latency), throttle_rate=args.throttle_rate)
+    tracker = TranscriptionJobTracker(client, initial_delay=0.2, max_delay=2.0, max_requests_per_second=args.rps)
+
+    started = time.monotonic()
+    futures = []
+    for _ in range(args.jobs):
+        job_name = f"transcribe-job-{uuid.uuid4()}"
+        client.start_transcription_job(
+            TranscriptionJobName=job_name,
+            Media={'MediaFileUri': 's3://fake-bucket/audio.wav'},
+            MediaFormat='wav',
+            LanguageCode='en-US'
+        )
+        futures.append(tracker.track(job_name))
+    wait(futures)
+    elapsed = time.monotonic() - started
+    tracker.shutdown()
+
+    print(f"{args.jobs} jobs in {elapsed:.2f}s, {client.calls['get_transcription_job']} polls "
+          f"({client.calls['get_transcription_job'] / args.jobs:.1f} per job), stats={tracker.stats}")
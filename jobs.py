@@ -0,0 +1,222 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from errors import error_details
+from metrics import registry as metrics
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ShuttingDown(Exception):
+    pass
+
+
+FINISHED = ('completed', 'failed')
+
+
+def new_job(job_id, now):
+    return {'id': job_id, 'status': 'queued', 'stage': 'queued', 'version': 0,
+            'created_at': now, 'updated_at': now, 'result': None, 'error': None}
+
+
+# Job records live here while they are queued, running and for `ttl` seconds
+# after they finish. Each update bumps `version` so pollers can tell when
+# something changed.
+class MemoryJobStore:
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id):
+        now = time.time()
+        job = new_job(job_id, now)
+        with self._lock:
+            self._purge(now)
+            self._jobs[job_id] = job
+        return dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job['version'] += 1
+            job['updated_at'] = time.time()
+            return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _purge(self, now):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['status'] in FINISHED and now - job['updated_at'] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# The same records in SQLite, for API servers with several worker processes:
+# a job queued by one process can be polled through any other. Fields must
+# be JSON-serialisable. Updates read and write the record in one IMMEDIATE
+# transaction, so `version` still goes up by one per change.
+class SQLiteJobStore:
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, job TEXT NOT NULL, finished INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished, updated_at)")
+
+    def create(self, job_id):
+        now = time.time()
+        job = new_job(job_id, now)
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE finished = 1 AND updated_at < ?", (now - self.ttl,))
+            self._conn.execute("INSERT INTO jobs (id, job, finished, updated_at) VALUES (?, ?, 0, ?)",
+                               (job_id, json.dumps(job), now))
+        return job
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    raise KeyError(job_id)
+                job = json.loads(row[0])
+                job.update(fields)
+                job['version'] += 1
+                job['updated_at'] = time.time()
+                self._conn.execute("UPDATE jobs SET job = ?, finished = ?, updated_at = ? WHERE id = ?",
+                                   (json.dumps(job), job['status'] in FINISHED, job['updated_at'], job_id))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def delete(self, job_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+# A bounded queue in front of a fixed pool of worker threads. submit() never
+# blocks: when max_queued jobs are already waiting it raises QueueFull so the
+# API can answer 429 instead of buffering audio without limit, and after
+# shutdown() it raises ShuttingDown. Either way the payload stays the caller's.
+#
+# process(payload, report) does the work and returns a JSON-serialisable
+# result; report(stage, **fields) publishes progress on the job record.
+# discard(payload) releases the payload of a job that never ran, such as one
+# failed on shutdown.
+class JobQueue:
+    def __init__(self, process, workers=4, max_queued=32, store=None, discard=None):
+        self.process = process
+        self.discard = discard
+        self.workers = workers
+        self.store = store or MemoryJobStore()
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._threads = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, payload):
+        if self._closed:
+            raise ShuttingDown("The server is shutting down")
+        self._start()
+        job_id = str(uuid.uuid4())
+        self.store.create(job_id)
+        try:
+            self._queue.put_nowait((job_id, payload))
+        except queue.Full:
+            self.store.delete(job_id)
+            raise QueueFull(f"{self._queue.maxsize} jobs are already waiting")
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, payload = item
+            job = self.store.update(job_id, status='running', stage='started', started_at=time.time())
+            metrics.record("job_queue", job['started_at'] - job['created_at'])
+
+            def report(stage, **fields):
+                self.store.update(job_id, stage=stage, **fields)
+
+            try:
+                result = self.process(payload, report)
+            except Exception as e:
+                self.store.update(job_id, status='failed', stage='failed', error=error_details(e))
+            else:
+                self.store.update(job_id, status='completed', stage='completed', result=result)
+            finally:
+                self._queue.task_done()
+
+    # Stop accepting work, let queued jobs finish, then stop the workers. With
+    # a timeout, jobs that haven't started by then are marked failed instead,
+    # so no record is left queued; running jobs still finish.
+    def shutdown(self, wait=True, timeout=None):
+        with self._lock:
+            self._closed = True
+            threads, self._threads = self._threads, []
+        if wait and threads and timeout is not None:
+            with self._queue.all_tasks_done:
+                self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+            self._fail_queued()
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _fail_queued(self):
+        while True:
+            try:
+                job_id, payload = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if self.discard is not None:
+                    self.discard(payload)
+                self.store.update(job_id, status='failed', stage='failed', error={
+                    'stage': None, 'code': 'ShuttingDown', 'message': "The server shut down before the job started"})
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,213 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+from errors import error_code
+
+# Seconds, from a cache hit to a long Transcribe job
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+BYTE_BUCKETS = tuple(2 ** power for power in range(10, 31, 2))
+AUDIO_SECONDS_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "stt_stage_duration_seconds": ("histogram", "Time spent in each pipeline stage", LATENCY_BUCKETS),
+    "stt_stage_errors_total": ("counter", "Pipeline stage failures by error code", None),
+    "stt_audio_bytes": ("histogram", "Audio bytes per request", BYTE_BUCKETS),
+    "stt_audio_duration_seconds": ("histogram", "Audio duration per request", AUDIO_SECONDS_BUCKETS),
+    "stt_silence_removed_seconds": ("histogram", "Silence trimmed before upload per request", AUDIO_SECONDS_BUCKETS),
+}
+
+# Durations kept per series for the percentiles shown in the debug panel
+RECENT_SAMPLES = 512
+
+# Set on an exception once a span has counted it
+_RECORDED = "_stt_error_recorded"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    # Over the recent samples; None before the first
+    def quantile(self, q):
+        return quantile(self.recent, q)
+
+
+# Nearest-rank quantile of a sequence of numbers; None when it's empty
+def quantile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+# True if a span already counted exc, or an error it was raised from
+def _recorded(exc):
+    while exc is not None:
+        if getattr(exc, _RECORDED, False):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Process-wide counters and histograms for the pipeline, rendered in the
+# Prometheus text format by render(). span() times a stage and counts its
+# failures by error code. Sources added with add_source() are read at render
+# time and exported as gauges, for stats other objects already keep (the job
+# tracker, caches, Bedrock usage).
+class MetricsRegistry:
+    def __init__(self, definitions=METRICS):
+        self.definitions = dict(definitions)
+        self._series = {}
+        self._sources = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if value is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = Histogram(self.definitions[name][2])
+            histogram.observe(value)
+
+    # Times the block as `stage`; failures are counted and re-raised. A failure
+    # is counted once, by the innermost span it passes through, not again by
+    # the spans around it.
+    @contextmanager
+    def span(self, stage, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            if not _recorded(e):
+                self.inc("stt_stage_errors_total", stage=stage, code=error_code(e), **labels)
+                try:
+                    setattr(e, _RECORDED, True)
+                except AttributeError:
+                    pass
+            raise
+        finally:
+            self.observe("stt_stage_duration_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+    # A duration measured elsewhere, such as the queue time Transcribe reports
+    def record(self, stage, seconds, **labels):
+        self.observe("stt_stage_duration_seconds", seconds, stage=stage, **labels)
+
+    # Bytes and, when known, the duration of the audio in one request
+    def record_audio(self, stage, size=None, seconds=None):
+        self.observe("stt_audio_bytes", size, stage=stage)
+        self.observe("stt_audio_duration_seconds", seconds, stage=stage)
+
+    # Drops everything recorded so far; sources stay registered
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    # read() returns a dict of numbers, exported as `<prefix>_<key>` gauges
+    def add_source(self, prefix, read, help=""):
+        with self._lock:
+            self._sources = [source for source in self._sources if source[0] != prefix]
+            self._sources.append((prefix, read, help))
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0])
+            snapshot = [(key, value if not isinstance(value, Histogram) else
+                         (list(value.counts), value.sum, value.count)) for key, value in series]
+            sources = list(self._sources)
+
+        lines, described = [], set()
+        for (name, labels), value in snapshot:
+            kind, help, buckets = self.definitions[name]
+            if name not in described:
+                described.add(name)
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            if kind != "histogram":
+                lines.append(f"{name}{_label_text(labels)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+
+        for prefix, read, help in sources:
+            for key, value in sorted(read().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"{prefix}_{key}"
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+        return "\n".join(lines) + "\n"
+
+    # One row per stage for the debug panel: calls, errors and latency in
+    # seconds, the stages that took the most time in total first
+    def stage_summary(self):
+        rows, errors = {}, {}
+        with self._lock:
+            for (name, labels), value in self._series.items():
+                if name == "stt_stage_errors_total":
+                    key = tuple(label for label in labels if label[0] != "code")
+                    errors[key] = errors.get(key, 0) + value
+                elif name == "stt_stage_duration_seconds":
+                    rows[labels] = dict(labels, calls=value.count, errors=0, total=value.sum,
+                                        mean=value.sum / value.count, p50=value.quantile(0.5),
+                                        p95=value.quantile(0.95), p99=value.quantile(0.99))
+        for key, count in errors.items():
+            if key in rows:
+                rows[key]["errors"] = count
+        return sorted(rows.values(), key=lambda row: -row["total"])
+
+    # Error counts by (stage, code)
+    def error_summary(self):
+        with self._lock:
+            return [dict(labels, count=value) for (name, labels), value in sorted(self._series.items())
+                    if name == "stt_stage_errors_total"]
+
+    def source_values(self):
+        with self._lock:
+            sources = list(self._sources)
+        return {prefix: read() for prefix, read, _ in sources}
+
+
+# The registry every module records into; one per process
+registry = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
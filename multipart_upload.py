@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.s3.transfer import TransferConfig
+
+MB = 1024 * 1024
+# S3 rejects multipart parts below 5 MiB, except the last one
+MIN_PART_SIZE = 5 * MB
+
+
+def transfer_config(part_size_mb=8, concurrency=4):
+    return TransferConfig(multipart_chunksize=int(part_size_mb * MB), max_concurrency=concurrency)
+
+
+# Uploads a stream to S3 while it is still being produced. The multipart
+# upload is created up front; write() buffers bytes and ships every full
+# part in the background (at most max_concurrency in flight, so memory stays
+# bounded), and complete() sends the tail and finalizes the object.
+#
+# Written data is copied once, into the part it lands in; a full part is
+# handed to upload_part as it is. botocore only takes bytes, bytearray or
+# file objects as a Body, so parts can't be views of the caller's memory.
+#
+# `header(total_size)` is for formats whose header needs the final length,
+# such as WAV: the first part is held back and uploaded last with the header
+# in front of it (part numbers fix the order, not upload time).
+class IncrementalUploader:
+    def __init__(self, s3_client, bucket, key, config=None, header=None, content_type=None):
+        self.client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.config = config or transfer_config()
+        self.header = header
+        self.part_size = max(MIN_PART_SIZE, self.config.multipart_chunksize)
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+        self._buffer = bytearray()
+        self._first_part = None
+        self._next_part = 2 if header is not None else 1
+        self._futures = []
+        self._slots = threading.BoundedSemaphore(self.config.max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=self.config.max_concurrency, thread_name_prefix="s3-part")
+
+        extra = {'ContentType': content_type} if content_type else {}
+        self.upload_id = self.client.create_multipart_upload(Bucket=bucket, Key=key, **extra)['UploadId']
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        self.digest.update(data)
+        self.size += len(data)
+        while data:
+            room = self.part_size - len(self._buffer)
+            self._buffer += data[:room]
+            data = data[room:]
+            if len(self._buffer) < self.part_size:
+                break
+            part, self._buffer = self._buffer, bytearray()
+            if self.header is not None and self._first_part is None:
+                self._first_part = part
+            else:
+                self._submit(self._next_part, part)
+                self._next_part += 1
+
+    def _submit(self, part_number, data):
+        # Blocks the writer when max_concurrency parts are already in flight
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._upload_part, part_number, data))
+
+    def _upload_part(self, part_number, data):
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=data)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self._slots.release()
+
+    # Returns the object key once S3 has assembled the object
+    def complete(self):
+        try:
+            tail, self._buffer = self._buffer, bytearray()
+            if self.header is not None:
+                if self._first_part is None:
+                    self._first_part, tail = tail, b""
+                self._submit(1, self.header(self.size) + self._first_part)
+            if tail or not self._futures:
+                self._submit(self._next_part, tail)
+            parts = sorted((future.result() for future in self._futures), key=lambda part: part['PartNumber'])
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._pool.shutdown(wait=False)
+        return self.key
+
+    def abort(self):
+        self._pool.shutdown(wait=True)
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    @property
+    def sha256(self):
+        return self.digest.hexdigest()
+
+
+# Open uploads by id, for clients that send a recording over several
+# requests. Uploads left open longer than max_age are aborted on the next start().
+class UploadSessions:
+    def __init__(self, max_age=3600):
+        self.max_age = max_age
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def start(self, uploader_factory):
+        self.expire()
+        upload_id = str(uuid.uuid4())
+        uploader = uploader_factory(upload_id)
+        with self._lock:
+            self._uploads[upload_id] = (uploader, time.time())
+        return upload_id
+
+    def get(self, upload_id):
+        with self._lock:
+            item = self._uploads.get(upload_id)
+        return item[0] if item else None
+
+    def pop(self, upload_id):
+        with self._lock:
+            item = self._uploads.pop(upload_id, None)
+        return item[0] if item else None
+
+    def expire(self):
+        now = time.time()
+        with self._lock:
+            stale = [upload_id for upload_id, (_, started) in self._uploads.items() if now - started > self.max_age]
+            uploaders = [self._uploads.pop(upload_id)[0] for upload_id in stale]
+        for uploader in uploaders:
+            try:
+                uploader.abort()
+            except Exception:
+                pass
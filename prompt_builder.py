@@ -0,0 +1,120 @@
+import math
+import re
+
+# Approximate characters per token for English transcripts, by model family.
+# Matched as substrings so cross-region profiles ("us.anthropic...") work.
+# These only size requests; Bedrock's reported usage is what gets recorded.
+CHARS_PER_TOKEN = (
+    ("anthropic.", 3.5),
+    ("meta.llama", 3.8),
+    ("mistral.", 3.6),
+    ("amazon.titan", 4.2),
+    ("cohere.", 4.2),
+    ("ai21.", 4.2),
+)
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+# Input context window in tokens, most specific prefix first
+CONTEXT_TOKENS = (
+    ("anthropic.claude-3", 200000),
+    ("anthropic.claude-v2", 100000),
+    ("anthropic.claude-instant", 100000),
+    ("amazon.titan-text-premier", 32000),
+    ("amazon.titan-text-express", 8000),
+    ("amazon.titan-text-lite", 4000),
+    ("meta.llama3", 8000),
+    ("meta.llama2", 4096),
+    ("mistral.", 32000),
+)
+DEFAULT_CONTEXT_TOKENS = 8000
+
+FILLERS = re.compile(r"(?:,[ \t]*)?\b(?:uh-huh|u+m+|u+h+|e+r+m+|e+r|a+h+|h+m+|m+h*m+)\b,?", re.IGNORECASE)
+# Short function words speakers stumble on. "that" and "had" are left out,
+# since "that that" and "had had" are usually meant.
+STUTTER_WORDS = ("a", "an", "and", "at", "but", "for", "from", "he", "i", "i'm", "i've", "i'll", "if", "in", "it",
+                 "it's", "just", "like", "my", "of", "okay", "on", "or", "our", "she", "so", "the", "they",
+                 "they're", "to", "we", "we're", "well", "with", "yeah", "you", "you're", "your")
+# "the the", "I think, I think": up to three words repeated back to back,
+# starting with one of STUTTER_WORDS. Numbers are never collapsed, and other
+# repeats ("Walla Walla") are kept.
+REPEATS = re.compile(
+    r"\b((?:" + "|".join(sorted(map(re.escape, STUTTER_WORDS), key=len, reverse=True)) + r")\b"
+    r"(?:[ \t]+[^\W\d]+(?:'[^\W\d]+)?){0,2})(?:[ \t]*,?[ \t]+\1\b)+", re.IGNORECASE)
+SPACE_BEFORE_PUNCTUATION = re.compile(r"[ \t]+([,.!?;:])(?!\d)")
+REPEATED_COMMAS = re.compile(r",(?:[ \t]*,)+")
+SPEAKER_PREFIX = re.compile(r"^(\s*[^:\n]{1,40}:\s*)?[,.](?!\d)\s*")
+SPEAKER_LABEL = re.compile(r"[^:\n]{1,40}:")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _lookup(table, model_id, default):
+    for prefix, value in table:
+        if model_id and prefix in model_id:
+            return value
+    return default
+
+
+def estimate_tokens(text, model_id=None):
+    return math.ceil(len(text) / _lookup(CHARS_PER_TOKEN, model_id, DEFAULT_CHARS_PER_TOKEN)) + 1
+
+
+def context_tokens(model_id):
+    return _lookup(CONTEXT_TOKENS, model_id, DEFAULT_CONTEXT_TOKENS)
+
+
+# Drops fillers ("um", "uh", ...) and words or short phrases repeated back to
+# back, and collapses runs of spaces and blank lines. Line breaks are kept,
+# since speaker-tagged transcripts have one turn per line.
+def compact_transcript(text):
+    lines = []
+    for line in text.splitlines():
+        line = FILLERS.sub(" ", line)
+        line = REPEATS.sub(r"\1", line)
+        line = REPEATED_COMMAS.sub(",", SPACE_BEFORE_PUNCTUATION.sub(r"\1", line))
+        # Punctuation left dangling at the start of a turn by a removed filler
+        line = SPEAKER_PREFIX.sub(lambda match: match.group(1).rstrip() + " " if match.group(1) else "", line)
+        line = " ".join(line.split())
+        # A turn that was nothing but fillers leaves only its speaker label
+        if line and not SPEAKER_LABEL.fullmatch(line):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+# Sizes Bedrock requests for one model. The input budget is the context
+# window minus the tokens reserved for the answer and a safety margin, unless
+# max_input_tokens is given. prepare() compacts the transcript; fit() cuts
+# whatever still doesn't fit at a sentence boundary.
+class PromptBuilder:
+    def __init__(self, model_id, max_output_tokens=4096, max_input_tokens=None, margin=0.05, compact=True):
+        self.model_id = model_id
+        self.compact = compact
+        if max_input_tokens is None:
+            window = context_tokens(model_id)
+            max_input_tokens = int(window * (1 - margin)) - max_output_tokens
+        self.max_input_tokens = max(1, max_input_tokens)
+
+    def estimate(self, text):
+        return estimate_tokens(text, self.model_id)
+
+    def prepare(self, text):
+        return compact_transcript(text) if self.compact else text
+
+    # Tokens left for the transcript once the prompt is in the request
+    def budget(self, prompt=""):
+        return max(1, self.max_input_tokens - self.estimate(prompt))
+
+    def fit(self, prompt, text):
+        budget = self.budget(prompt)
+        if self.estimate(text) <= budget:
+            return text
+        return self.truncate(text, budget)
+
+    def truncate(self, text, max_tokens):
+        chars_per_token = _lookup(CHARS_PER_TOKEN, self.model_id, DEFAULT_CHARS_PER_TOKEN)
+        limit = int((max_tokens - 1) * chars_per_token)
+        cut = text[:limit]
+        sentences = SENTENCE_END.split(cut)
+        if len(sentences) > 1:
+            # Drop the sentence the limit fell into
+            cut = cut[:len(cut) - len(sentences[-1])].rstrip()
+        return cut
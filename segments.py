@@ -0,0 +1,65 @@
+import math
+import re
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from vad import frame_energy_db
+
+
+# Splits long audio into about segment_seconds pieces. Each cut is moved to
+# the quietest ~300 ms within search_seconds of its ideal position so words
+# aren't cut in half, and every segment reaches overlap_seconds past its cuts
+# so nothing is lost at the edges (stitch_transcripts removes the repeats).
+# The search never reaches more than a quarter segment either way and a cut
+# that lands under half a segment after the previous one falls back to its
+# ideal position, so segments stay between half and one and a half times
+# their nominal length. Returns [start, end) sample offsets.
+def plan_segments(samples, sample_rate, segment_seconds=600, overlap_seconds=2.0, search_seconds=30, frame_ms=30):
+    total = len(samples)
+    count = math.ceil(total / (segment_seconds * sample_rate))
+    if count <= 1:
+        return [(0, total)]
+
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    levels = frame_energy_db(samples, frame_len)
+    smoothing = max(1, 300 // frame_ms)
+    levels = np.convolve(levels, np.ones(smoothing) / smoothing, mode="same")
+    step = len(levels) // count
+    search = min(int(search_seconds * 1000 / frame_ms), step // 4)
+    min_frames = step // 2
+
+    cuts = [0]
+    for i in range(1, count):
+        ideal = i * len(levels) // count
+        low, high = max(ideal - search, 0), min(ideal + search + 1, len(levels))
+        cut = low + int(np.argmin(levels[low:high]))
+        cuts.append(cut if cut >= cuts[-1] + min_frames else ideal)
+    cuts = [cut * frame_len for cut in cuts] + [total]
+
+    overlap = int(overlap_seconds * sample_rate)
+    return [(max(start - overlap, 0), min(end + overlap, total)) for start, end in zip(cuts, cuts[1:])]
+
+
+def _normalize(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+# Joins the transcripts of consecutive overlapping segments. Where the end of
+# one and the start of the next transcribe the same audio, the longest common
+# run of words (ignoring case and punctuation) is kept once. The run has to
+# sit within `slack` words of the seam, so a phrase that merely repeats
+# further away isn't mistaken for the overlap.
+def stitch_transcripts(texts, window=40, min_match=3, slack=8):
+    words = []
+    for text in texts:
+        incoming = text.split()
+        if words and incoming:
+            tail, head = words[-window:], incoming[:window]
+            match = SequenceMatcher(None, [_normalize(w) for w in tail], [_normalize(w) for w in head],
+                                    autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+            if match.size >= min_match and match.a + match.size >= len(tail) - slack and match.b <= slack:
+                del words[len(words) - len(tail) + match.a:]
+                incoming = incoming[match.b:]
+        words.extend(incoming)
+    return " ".join(words)
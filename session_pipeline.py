@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+from transcript_result import tagged_transcript
+
+# uploaded -> transcribing -> transcribed -> summarizing -> summarized.
+# A failed transcription ends in "failed"; a failed summary goes back to
+# "transcribed" with `error` set so it can be retried.
+STAGES = ("uploaded", "transcribing", "transcribed", "summarizing", "summarized", "failed")
+RUNNING_STAGES = ("transcribing", "summarizing")
+
+
+# Progress and results for one input (an upload or a recording), kept in the
+# session so Streamlit reruns see what has already been done. Stages run on
+# the given executor; the script calls poll() on every rerun to pick up
+# finished work and reads `partial` to show the summary as it streams in.
+class PipelineRun:
+    def __init__(self, file_id):
+        self.file_id = file_id
+        self.stage = "uploaded"
+        self.transcript = None
+        self.segments = None
+        self.summary = None
+        self.summary_source = None
+        self.partial = ""
+        self.stats = {}
+        self.error = None
+        self.started_at = None
+        self._future = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.stage in RUNNING_STAGES
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at if self.started_at is not None else 0.0
+
+    # transcribe(audio) -> (transcript text, SegmentIndex or None). With
+    # speaker labels the transcript is kept as one "Speaker N: ..." line per
+    # turn, which is what gets shown, edited and summarized. Only starts from
+    # "uploaded".
+    def start_transcription(self, executor, transcribe, audio):
+        with self._lock:
+            if self.stage != "uploaded":
+                return False
+            self._start(executor, "transcribing", self._transcribe, transcribe, audio)
+            return True
+
+    # summarize_stream(text, stats) yields summary deltas. Runs again only if
+    # the text differs from what the current summary was made from (the
+    # transcript can be edited before summarizing).
+    def start_summary(self, executor, summarize_stream, text):
+        with self._lock:
+            if self.stage not in ("transcribed", "summarized"):
+                return False
+            if self.summary is not None and self.summary_source == text:
+                return False
+            self.partial = ""
+            self._start(executor, "summarizing", self._summarize, summarize_stream, text)
+            return True
+
+    def poll(self):
+        with self._lock:
+            if self._future is not None and self._future.done():
+                future, self._future = self._future, None
+                try:
+                    self.stage = future.result()
+                except Exception as e:
+                    self.error = str(e)
+                    self.stage = "transcribed" if self.transcript is not None else "failed"
+            return self.stage
+
+    # Back to "uploaded" after a failed transcription
+    def retry(self):
+        with self._lock:
+            if self.stage == "failed":
+                self.stage = "uploaded"
+                self.error = None
+
+    def _start(self, executor, stage, work, *args):
+        self.stage = stage
+        self.error = None
+        self.started_at = time.monotonic()
+        self._future = executor.submit(work, *args)
+
+    def _transcribe(self, transcribe, audio):
+        text, segments = transcribe(audio)
+        self.transcript, self.segments = tagged_transcript(text, segments), segments
+        return "transcribed"
+
+    def _summarize(self, summarize_stream, text):
+        stats = {}
+        for delta in summarize_stream(text, stats):
+            self.partial += delta
+        self.summary, self.summary_source, self.stats = self.partial, text, stats
+        return "summarized"
+
+
+# The run for file_id in this session, creating it if needed. Only the
+# max_runs most recently used runs are kept, and running ones are never dropped.
+def get_run(session_state, file_id, max_runs=5):
+    runs = session_state.setdefault("pipeline_runs", OrderedDict())
+    if file_id not in runs:
+        runs[file_id] = PipelineRun(file_id)
+    runs.move_to_end(file_id)
+    for old_id in [run_id for run_id, run in runs.items() if not run.running][:-max_runs]:
+        if old_id != file_id:
+            del runs[old_id]
+    return runs[file_id]
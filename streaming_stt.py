@@ -0,0 +1,260 @@
+import asyncio
+import queue
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from audio_io import pcm16_to_float, resample
+from transcription_backends import load_pipeline
+
+# One piece of transcript. Partial segments are revised by later segments with
+# the same start; a final segment is not revised again. Times are seconds from
+# the start of the stream.
+TranscriptSegment = namedtuple("TranscriptSegment", ["text", "start", "end", "is_partial"])
+
+
+# Streaming backends hand out one session per recording. A session accepts
+# raw 16-bit mono PCM via feed() while the recording is running and returns
+# whatever transcript segments became available; finish() flushes the rest.
+class StreamingBackend:
+    def open_session(self, sample_rate):
+        raise NotImplementedError
+
+
+class AWSStreamingBackend(StreamingBackend):
+    def __init__(self, region, language_code="en-US"):
+        self.region = region
+        self.language_code = language_code
+
+    def open_session(self, sample_rate):
+        return AWSStreamingSession(self.region, self.language_code, sample_rate)
+
+
+# Runs the amazon-transcribe asyncio client on a private event loop thread so
+# it can be driven from Streamlit's synchronous script or a worker thread.
+class AWSStreamingSession:
+    def __init__(self, region, language_code, sample_rate, finish_timeout=10.0):
+        from amazon_transcribe.client import TranscribeStreamingClient
+
+        self.client = TranscribeStreamingClient(region=region)
+        self.language_code = language_code
+        self.sample_rate = sample_rate
+        self.finish_timeout = finish_timeout
+        self.results = queue.Queue()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="transcribe-streaming", daemon=True)
+        self.thread.start()
+        self.stream = self._call(self._start())
+
+    def _call(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _start(self):
+        stream = await self.client.start_stream_transcription(
+            language_code=self.language_code,
+            media_sample_rate_hz=self.sample_rate,
+            media_encoding="pcm",
+        )
+        self.reader = asyncio.ensure_future(self._read(stream.output_stream))
+        return stream
+
+    async def _read(self, output_stream):
+        async for event in output_stream:
+            for result in event.transcript.results:
+                if result.alternatives:
+                    self.results.put(TranscriptSegment(
+                        result.alternatives[0].transcript, result.start_time, result.end_time, result.is_partial))
+
+    async def _finish(self):
+        await self.stream.input_stream.end_stream()
+        await self.reader
+
+    def _drain(self):
+        segments = []
+        while True:
+            try:
+                segments.append(self.results.get_nowait())
+            except queue.Empty:
+                return segments
+
+    def feed(self, pcm):
+        self._call(self.stream.input_stream.send_audio_event(audio_chunk=pcm))
+        return self._drain()
+
+    def finish(self):
+        try:
+            self._call(self._finish(), self.finish_timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        return self._drain()
+
+
+# Transformers ASR pipeline, loaded on first use and shared process-wide
+class TransformersRecognizer:
+    def __init__(self, model="openai/whisper-tiny.en", device=-1):
+        self.model = model
+        self.device = device
+        self._lock = threading.Lock()
+
+    def __call__(self, samples, sample_rate):
+        pipe = load_pipeline("automatic-speech-recognition", self.model, self.device)
+        with self._lock:
+            result = pipe({"raw": pcm16_to_float(samples), "sampling_rate": sample_rate})
+        return result["text"].strip()
+
+
+# Offline backend: buffers the current utterance and re-recognizes it every
+# partial_interval seconds. An utterance is finalized after endpoint_silence
+# seconds of low energy or once it reaches max_utterance seconds. Any
+# recognizer(samples_int16, sample_rate) -> text callable can be plugged in.
+class LocalStreamingBackend(StreamingBackend):
+    def __init__(self, recognizer=None, **session_options):
+        self.recognizer = recognizer or TransformersRecognizer()
+        self.session_options = session_options
+
+    def open_session(self, sample_rate):
+        return LocalStreamingSession(self.recognizer, sample_rate, **self.session_options)
+
+
+class LocalStreamingSession:
+    def __init__(self, recognizer, sample_rate, target_rate=16000, partial_interval=1.0,
+                 endpoint_silence=0.6, max_utterance=15.0, silence_threshold=500.0):
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.target_rate = target_rate
+        self.partial_samples = int(partial_interval * target_rate)
+        self.endpoint_samples = int(endpoint_silence * target_rate)
+        self.max_samples = int(max_utterance * target_rate)
+        self.silence_threshold = silence_threshold
+
+        self.chunks = []
+        self.buffered = 0
+        self.utterance_start = 0
+        self.trailing_silence = 0
+        self.has_speech = False
+        self.since_partial = 0
+
+    def feed(self, pcm):
+        samples = resample(np.frombuffer(pcm, dtype=np.int16), self.sample_rate, self.target_rate)
+        if len(samples) == 0:
+            return []
+        rms = np.sqrt(np.mean(samples.astype(np.float32) ** 2))
+        if rms < self.silence_threshold:
+            self.trailing_silence += len(samples)
+        else:
+            self.trailing_silence = 0
+            self.has_speech = True
+
+        self.chunks.append(samples)
+        self.buffered += len(samples)
+        self.since_partial += len(samples)
+
+        if not self.has_speech:
+            # Leading silence: keep a short tail so the first syllable isn't clipped
+            if self.buffered > self.endpoint_samples:
+                self._reset(keep=self.endpoint_samples)
+            return []
+        if self.trailing_silence >= self.endpoint_samples or self.buffered >= self.max_samples:
+            return [self._recognize(is_partial=False)]
+        if self.since_partial >= self.partial_samples:
+            self.since_partial = 0
+            return [self._recognize(is_partial=True)]
+        return []
+
+    def finish(self):
+        if self.has_speech:
+            return [self._recognize(is_partial=False)]
+        return []
+
+    def _recognize(self, is_partial):
+        audio = np.concatenate(self.chunks)
+        segment = TranscriptSegment(
+            self.recognizer(audio, self.target_rate),
+            self.utterance_start / self.target_rate,
+            (self.utterance_start + len(audio)) / self.target_rate,
+            is_partial,
+        )
+        if not is_partial:
+            self._reset()
+        return segment
+
+    def _reset(self, keep=0):
+        audio = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.int16)
+        tail = audio[len(audio) - keep:] if keep else audio[:0]
+        self.utterance_start += len(audio) - len(tail)
+        self.chunks = [tail] if len(tail) else []
+        self.buffered = len(tail)
+        self.trailing_silence = 0
+        self.has_speech = False
+        self.since_partial = 0
+
+
+# Moves recognition off the caller's thread: feed() only enqueues audio and
+# returns whatever segments the worker has produced so far. Used by capture
+# loops that must keep reading the device to avoid overflows.
+class ThreadedSession:
+    def __init__(self, session):
+        self.session = session
+        self.audio = queue.Queue()
+        self.results = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="streaming-stt", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                pcm = self.audio.get()
+                if pcm is None:
+                    segments = self.session.finish()
+                else:
+                    segments = self.session.feed(pcm)
+                for segment in segments:
+                    self.results.put(segment)
+                if pcm is None:
+                    return
+        except Exception as e:
+            self.error = e
+
+    def _drain(self):
+        if self.error is not None:
+            raise self.error
+        segments = []
+        while True:
+            try:
+                segments.append(self.results.get_nowait())
+            except queue.Empty:
+                return segments
+
+    def feed(self, pcm):
+        self.audio.put(pcm)
+        return self._drain()
+
+    def finish(self):
+        self.audio.put(None)
+        self.thread.join()
+        return self._drain()
+
+
+def get_streaming_backend(name, region=None, **options):
+    if name == "aws":
+        return AWSStreamingBackend(region, **options)
+    if name == "local":
+        return LocalStreamingBackend(**options)
+    raise ValueError(f"Unknown streaming backend: {name}")
+
+
+# Keeps the latest text per segment start so partials are replaced in place
+class LiveTranscript:
+    def __init__(self):
+        self.segments = {}
+
+    def update(self, segments):
+        for segment in segments:
+            self.segments[segment.start] = segment
+        return self.text()
+
+    def text(self):
+        return " ".join(s.text for _, s in sorted(self.segments.items()) if s.text)
@@ -0,0 +1,7 @@
+# The transcription and summarization pipeline behind every entry point.
+# Streamlit views live in stt_pipeline.streamlit_ui and the HTTP API in
+# stt_pipeline.api; neither is imported here.
+from stt_pipeline.config import Settings, from_mapping, load_settings
+from stt_pipeline.core import Pipeline
+
+__all__ = ["Pipeline", "Settings", "from_mapping", "load_settings"]
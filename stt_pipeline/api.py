@@ -0,0 +1,400 @@
+import asyncio
+import base64
+import hashlib
+import json
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from cache import audio_hash, upload_entry
+from errors import PipelineError, UploadError, reraise_as
+from jobs import JobQueue, QueueFull, ShuttingDown
+from metrics import PROMETHEUS_CONTENT_TYPE, registry as metrics
+from transcript_result import tagged_transcript
+
+SPOOL_MEMORY_LIMIT = 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+RECORDING_EXTENSIONS = {"audio/webm": "webm", "audio/ogg": "ogg", "audio/mp4": "mp4", "audio/wav": "wav"}
+
+
+class AudioRequest(BaseModel):
+    audio: str
+
+
+class SummaryRequest(BaseModel):
+    text: str
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def wants_events(http_request):
+    return "text/event-stream" in http_request.headers.get("accept", "")
+
+
+# Audio endpoints accept three body types:
+#   application/octet-stream  raw audio bytes
+#   multipart/form-data       an "audio" file field
+#   application/json          {"audio": "<base64>"} (older clients)
+# Binary bodies are copied chunk by chunk into a spool file that stays in
+# memory up to 1 MiB and moves to disk after that, hashing as it goes. The
+# result is (audio, digest): a rewound file object and its SHA-256, or raw
+# bytes and None for JSON. Empty audio is a ValueError.
+async def read_audio(http_request):
+    content_type = http_request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        audio = base64.b64decode(AudioRequest(**await http_request.json()).audio)
+        if not audio:
+            raise ValueError("The request has no audio")
+        return audio, None
+
+    digest = hashlib.sha256()
+    if content_type.startswith("multipart/form-data"):
+        form = await http_request.form()
+        upload = form.get("audio")
+        if upload is None or isinstance(upload, str):
+            raise ValueError("multipart body needs an 'audio' file field")
+        # The form parser already spooled the file; hash it in place
+        spool = upload.file
+        await asyncio.to_thread(lambda: [digest.update(chunk) for chunk in iter(lambda: spool.read(READ_CHUNK_SIZE), b"")])
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+        async for chunk in http_request.stream():
+            spool.write(chunk)
+            digest.update(chunk)
+    if spool.tell() == 0:
+        spool.close()
+        raise ValueError("The request has no audio")
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
+
+# Releases what read_audio returned; JSON bodies are plain bytes
+def close_audio(audio):
+    if hasattr(audio, "close"):
+        audio.close()
+
+
+# JSON fields for a transcript: the plain text and its timestamped segments
+def transcript_fields(transcript, segments):
+    return {"transcript": transcript, "segments": segments.records() if segments is not None else []}
+
+
+def bad_request(error):
+    return JSONResponse(status_code=400, content={"error": str(error)})
+
+
+# "error" keeps the message where clients already look; stage and code say what failed
+def error_fields(error):
+    return {"error": str(error), "stage": error.stage, "code": error.code}
+
+
+# Upload and transcription failures are upstream (S3, Transcribe, the model)
+def pipeline_error(error):
+    return JSONResponse(status_code=502, content=error_fields(error))
+
+
+def unknown_upload():
+    return JSONResponse(status_code=404, content={"error": "Unknown upload"})
+
+
+# "summary" events with each delta, then "done" with the timing stats, or "error"
+def summary_events(pipeline, text):
+    stats = {}
+    try:
+        for delta in pipeline.summarize_text_stream(text, stats):
+            yield sse_event("summary", {"delta": delta})
+    except PipelineError as e:
+        yield sse_event("error", error_fields(e))
+        return
+    yield sse_event("done", stats)
+
+
+def job_view(job):
+    return {key: job[key] for key in ("id", "status", "stage", "transcript", "result", "error") if key in job}
+
+
+# Worker-side pipeline for queued jobs
+def job_processor(pipeline):
+    def process_job(payload, report):
+        audio, digest = payload
+        try:
+            report("transcribing")
+            transcript, segments = pipeline.transcribe_bytes(audio, digest)
+            report("summarizing", transcript=transcript)
+            summary = pipeline.summarize_text(tagged_transcript(transcript, segments))
+            return dict(transcript_fields(transcript, segments), summary=summary)
+        finally:
+            close_audio(audio)
+
+    return process_job
+
+
+# The HTTP API over `pipeline`. The bounded job queue behind /jobs is sized
+# from JOB_WORKERS and JOB_QUEUE_SIZE, keeps its records in job_store (in
+# memory by default) and is on app.state.job_queue. Upload-while-recording
+# keeps live uploaders in this process, so servers with several worker
+# processes turn it off with incremental_uploads=False.
+def create_app(pipeline, job_store=None, incremental_uploads=True):
+    settings = pipeline.settings
+
+    # On shutdown (SIGTERM to a server worker) queued jobs get DRAIN_TIMEOUT
+    # seconds to start; running ones always finish
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await asyncio.to_thread(job_queue.shutdown, True, settings.drain_timeout)
+
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["https://stt-poc.streamlit.app/", "*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    job_queue = app.state.job_queue = JobQueue(job_processor(pipeline), workers=settings.job_workers,
+                                               max_queued=settings.job_queue_size, store=job_store,
+                                               discard=lambda payload: close_audio(payload[0]))
+    metrics.add_source("stt_job_queue", lambda: {"queued": job_queue.queued()}, "Jobs waiting for a worker")
+
+    # The transcript and its summary. A failed summary still returns the
+    # transcript, with summary null and the error fields set.
+    async def summary_response(transcript, segments):
+        fields = transcript_fields(transcript, segments)
+        try:
+            summary = await asyncio.to_thread(pipeline.summarize_text, tagged_transcript(transcript, segments))
+        except PipelineError as e:
+            return JSONResponse(content=dict(fields, summary=None, **error_fields(e)))
+        return JSONResponse(content=dict(fields, summary=summary))
+
+    # Clients that send "Accept: text/event-stream" get the transcript as soon as it
+    # is ready, then the summary as a stream of deltas and a final stats event.
+    # With summarize false only the transcript is returned.
+    async def transcript_response(http_request, transcript, segments, summarize):
+        if not summarize:
+            return JSONResponse(content=transcript_fields(transcript, segments))
+        if wants_events(http_request):
+            def events():
+                yield sse_event("transcript", transcript_fields(transcript, segments))
+                # Diarized transcripts are summarized as one line per speaker turn
+                yield from summary_events(pipeline, tagged_transcript(transcript, segments))
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return await summary_response(transcript, segments)
+
+    # Transcript and summary of the audio in the request body, see transcript_response
+    @app.post("/transcribe")
+    async def transcribe(http_request: Request, summarize: bool = True):
+        try:
+            audio, digest = await read_audio(http_request)
+        except ValueError as e:
+            return bad_request(e)
+
+        try:
+            transcript, segments = await pipeline.transcribe_bytes_async(audio, digest)
+        except PipelineError as e:
+            return pipeline_error(e)
+        finally:
+            close_audio(audio)
+        return await transcript_response(http_request, transcript, segments, summarize)
+
+    # Summary of a transcript the client already has, such as one edited in
+    # the UI; streamed like /transcribe for "Accept: text/event-stream"
+    @app.post("/summarize")
+    async def summarize_transcript(request: SummaryRequest, http_request: Request):
+        if wants_events(http_request):
+            return StreamingResponse(summary_events(pipeline, request.text), media_type="text/event-stream")
+        try:
+            summary = await asyncio.to_thread(pipeline.summarize_text, request.text)
+        except PipelineError as e:
+            return pipeline_error(e)
+        return JSONResponse(content={"summary": summary})
+
+    # Stores the audio in S3 under its content hash and returns the key, without
+    # transcribing. Already-stored audio is not uploaded again.
+    @app.post("/audio")
+    async def store_audio(http_request: Request):
+        try:
+            audio, digest = await read_audio(http_request)
+        except ValueError as e:
+            return bad_request(e)
+        try:
+            if digest is None:
+                digest = await asyncio.to_thread(audio_hash, audio)
+            entry = pipeline.transcript_cache.get(digest)
+            if entry is None:
+                entry = upload_entry(await asyncio.to_thread(pipeline.upload_audio, audio, digest))
+                pipeline.transcript_cache.remember_upload(digest, entry)
+        except PipelineError as e:
+            return pipeline_error(e)
+        finally:
+            close_audio(audio)
+        return JSONResponse(status_code=201, content={
+            "sha256": digest,
+            "s3_key": entry['s3_key'],
+            "silence_removed": entry.get('silence_removed', 0.0)
+        })
+
+    # Like /transcribe, for audio already stored through POST /audio
+    @app.post("/audio/{digest}/transcribe")
+    async def transcribe_stored(digest: str, http_request: Request, summarize: bool = True):
+        try:
+            transcript, segments = await asyncio.to_thread(pipeline.transcribe_stored, digest)
+        except PipelineError as e:
+            return pipeline_error(e)
+        return await transcript_response(http_request, transcript, segments, summarize)
+
+    # Upload-while-recording: the recorder opens an upload when it starts, PUTs
+    # each MediaRecorder chunk in order as it arrives and completes the upload on
+    # stop, so by then most of the audio is already in S3. Full parts go to S3 in
+    # the background as the chunks add up. Only used with the AWS backend; other
+    # backends answer 409 and the recorder falls back to POST /transcribe.
+    @app.post("/uploads")
+    async def start_upload(content_type: str = "audio/webm"):
+        if settings.transcription_backend != "aws":
+            return JSONResponse(status_code=409, content={"error": "Uploads are only used with the AWS backend"})
+        if not incremental_uploads:
+            return JSONResponse(status_code=409, content={"error": "Uploads need a single API worker"})
+        media_type = content_type.split(";")[0].strip()
+        extension = RECORDING_EXTENSIONS.get(media_type, "bin")
+
+        def open_uploader(upload_id):
+            return pipeline.open_uploader(f"audio/recording-{upload_id}.{extension}", content_type=media_type)
+
+        upload_id = await asyncio.to_thread(pipeline.upload_sessions.start, open_uploader)
+        return JSONResponse(status_code=201, content={"upload_id": upload_id})
+
+    @app.put("/uploads/{upload_id}")
+    async def append_upload(upload_id: str, http_request: Request):
+        uploader = pipeline.upload_sessions.get(upload_id)
+        if uploader is None:
+            return unknown_upload()
+        await asyncio.to_thread(uploader.write, await http_request.body())
+        return JSONResponse(content={"size": uploader.size})
+
+    @app.post("/uploads/{upload_id}/complete")
+    async def complete_upload(upload_id: str):
+        uploader = pipeline.upload_sessions.pop(upload_id)
+        if uploader is None:
+            return unknown_upload()
+        metrics.record_audio("upload", uploader.size)
+        try:
+            with metrics.span("upload"), reraise_as(UploadError):
+                file_name = await asyncio.to_thread(uploader.complete)
+            transcript, segments = await asyncio.to_thread(pipeline.transcribe_uploaded, uploader.sha256, file_name)
+        except PipelineError as e:
+            return pipeline_error(e)
+        return await summary_response(transcript, segments)
+
+    # Queue the audio and return a job ID immediately; 429 when the queue is
+    # full, 503 once this worker is shutting down
+    @app.post("/jobs")
+    async def create_job(http_request: Request):
+        try:
+            audio, digest = await read_audio(http_request)
+        except ValueError as e:
+            return bad_request(e)
+
+        try:
+            job_id = job_queue.submit((audio, digest))
+        except QueueFull as e:
+            close_audio(audio)
+            return JSONResponse(status_code=429, content={"error": str(e)}, headers={"Retry-After": "5"})
+        except ShuttingDown as e:
+            close_audio(audio)
+            return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = job_queue.get(job_id)
+        if job is None:
+            return JSONResponse(status_code=404, content={"error": "Unknown job"})
+        return JSONResponse(content=job_view(job))
+
+    # Server-sent events: one "progress" event per change, then "completed" or "failed"
+    @app.get("/jobs/{job_id}/events")
+    async def job_events(job_id: str):
+        if job_queue.get(job_id) is None:
+            return JSONResponse(status_code=404, content={"error": "Unknown job"})
+
+        async def events():
+            version = -1
+            while True:
+                job = job_queue.get(job_id)
+                if job is None:
+                    return
+                if job["version"] != version:
+                    version = job["version"]
+                    if job["status"] in ("completed", "failed"):
+                        yield sse_event(job["status"], job_view(job))
+                        return
+                    yield sse_event("progress", job_view(job))
+                await asyncio.sleep(0.5)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Live transcription: the browser sends raw 16-bit mono PCM frames as binary
+    # messages (sample rate in the query string) and a "stop" text message at the
+    # end; partial and final segments are pushed back as JSON while it records.
+    @app.websocket("/ws/transcribe")
+    async def transcribe_live(websocket: WebSocket):
+        await websocket.accept()
+        sample_rate = int(websocket.query_params.get("sample_rate", 16000))
+        try:
+            session = await asyncio.to_thread(pipeline.streaming_backend.open_session, sample_rate)
+        except Exception as e:
+            # e.g. STREAMING_BACKEND=aws without amazon-transcribe installed
+            await websocket.send_json({"error": f"Live transcription is unavailable: {e}", "code": type(e).__name__})
+            await websocket.close(code=1011)
+            return
+        finished = False
+        try:
+            while not finished:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    segments = await asyncio.to_thread(session.feed, message["bytes"])
+                elif message.get("text") == "stop":
+                    segments = await asyncio.to_thread(session.finish)
+                    finished = True
+                else:
+                    continue
+                for segment in segments:
+                    await websocket.send_json(segment._asdict())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if not finished:
+                await asyncio.to_thread(session.finish)
+        if finished:
+            await websocket.close()
+
+    # Prometheus scrape target: stage latencies, audio sizes, errors by code and
+    # the tracker, cache, queue and token gauges
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    return app
+
+
+# Runs the API with uvicorn on a daemon thread, next to the Streamlit script
+def serve_in_background(app, host="0.0.0.0", port=8000):
+    import uvicorn
+
+    thread = threading.Thread(target=uvicorn.run, args=(app,), kwargs={"host": host, "port": port}, daemon=True)
+    thread.start()
+    return thread
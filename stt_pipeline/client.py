@@ -0,0 +1,102 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from errors import PipelineError, SummarizationError, TranscriptionError, UploadError
+from transcript_result import Segment, SegmentIndex
+
+STAGE_ERRORS = {"upload": UploadError, "transcribe": TranscriptionError, "summarize": SummarizationError}
+
+
+# The API's error fields as the PipelineError for the stage that failed
+def api_error(fields):
+    error_class = STAGE_ERRORS.get(fields.get("stage"), PipelineError)
+    return error_class(fields.get("error") or "The API request failed.", code=fields.get("code"))
+
+
+def response_error(response):
+    try:
+        fields = response.json()
+    except ValueError:
+        fields = {}
+    if not isinstance(fields, dict):
+        fields = {}
+    fields.setdefault("error", f"The API answered {response.status_code}")
+    fields.setdefault("code", f"HTTP{response.status_code}")
+    return api_error(fields)
+
+
+# (transcript, SegmentIndex or None) from the API's transcript fields
+def transcript_result(fields):
+    segments = fields.get("segments")
+    return fields["transcript"], SegmentIndex.from_segments(Segment(**s) for s in segments) if segments else None
+
+
+# (event, data) for each server-sent event in a streamed response
+def read_events(response):
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and event is not None:
+            yield event, json.loads("\n".join(data)) if data else None
+            event, data = None, []
+
+
+# The pipeline API over HTTP, for a Streamlit UI that talks to a standalone
+# server (stt_pipeline.server) instead of running the pipeline itself. It has
+# what the Streamlit views use from Pipeline: transcribe_bytes,
+# transcribe_stored, summarize_text, summarize_text_stream and an executor
+# for background stages. Error responses are raised as the PipelineError for their stage.
+class APIClient:
+    def __init__(self, base_url, workers=8, timeout=(5, 900)):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-client")
+
+    def _post(self, path, **options):
+        try:
+            response = self.session.post(self.base_url + path, timeout=self.timeout, **options)
+        except requests.RequestException as e:
+            raise PipelineError(f"The API at {self.base_url} is unreachable: {e}", code=type(e).__name__) from e
+        if response.status_code >= 400:
+            with response:
+                raise response_error(response)
+        return response
+
+    # (transcript, SegmentIndex or None); the digest is computed by the server
+    def transcribe_bytes(self, audio, digest=None):
+        response = self._post("/transcribe", params={"summarize": "false"}, data=audio,
+                              headers={"content-type": "application/octet-stream"})
+        return transcript_result(response.json())
+
+    # Audio the browser recorder stored through POST /audio, by its SHA-256
+    def transcribe_stored(self, digest):
+        return transcript_result(self._post(f"/audio/{digest}/transcribe", params={"summarize": "false"}).json())
+
+    def summarize_text(self, text):
+        return self._post("/summarize", json={"text": text}).json()["summary"]
+
+    # Yields the summary as the server streams it; timing stats are copied into `stats` at the end
+    def summarize_text_stream(self, text, stats=None):
+        with self._post("/summarize", json={"text": text}, headers={"accept": "text/event-stream"},
+                        stream=True) as response:
+            for event, data in read_events(response):
+                if event == "summary":
+                    yield data["delta"]
+                elif event == "error":
+                    raise api_error(data)
+                elif event == "done" and stats is not None:
+                    stats.update(data)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,85 @@
+import os
+from collections import namedtuple
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
+
+
+def _optional(convert):
+    return lambda value: None if value in (None, "") else convert(value)
+
+
+# field: (secret or environment variable, conversion, default). Each entry
+# point reads the same names from .streamlit/secrets.toml, and the batch CLI
+# lets environment variables override them.
+SETTINGS = {
+    "aws_region": ("AWS_REGION", _optional(str), None),
+    "aws_access_key_id": ("AWS_ACCESS_KEY_ID", _optional(str), None),
+    "aws_secret_access_key": ("AWS_SECRET_ACCESS_KEY", _optional(str), None),
+    "bucket_name": ("AWS_S3_BUCKET_NAME", _optional(str), None),
+    "max_pool_connections": ("AWS_MAX_POOL_CONNECTIONS", int, 50),
+    "audio_codec": ("AUDIO_CODEC", str, "flac"),
+    "trim_silence": ("TRIM_SILENCE", _flag, True),
+    "max_speakers": ("MAX_SPEAKERS", int, 10),
+    "transcription_backend": ("TRANSCRIPTION_BACKEND", str, "aws"),
+    "local_asr_model": ("LOCAL_ASR_MODEL", str, "openai/whisper-base.en"),
+    "segment_seconds": ("SEGMENT_SECONDS", float, 0.0),
+    "segment_concurrency": ("SEGMENT_CONCURRENCY", int, 4),
+    "summarization_backend": ("SUMMARIZATION_BACKEND", str, "bedrock"),
+    "local_summary_model": ("LOCAL_SUMMARY_MODEL", str, "sshleifer/distilbart-cnn-12-6"),
+    "streaming_backend": ("STREAMING_BACKEND", str, "aws"),
+    "pipeline_workers": ("PIPELINE_WORKERS", int, 8),
+    "s3_part_size_mb": ("S3_PART_SIZE_MB", float, 8.0),
+    "s3_upload_concurrency": ("S3_UPLOAD_CONCURRENCY", int, 4),
+    "job_workers": ("JOB_WORKERS", int, 4),
+    "job_queue_size": ("JOB_QUEUE_SIZE", int, 32),
+    "api_port": ("API_PORT", int, 8000),
+    "api_base_url": ("API_BASE_URL", str, "https://stt-poc.streamlit.app"),
+    # Standalone server (stt_pipeline.server); API_WORKERS defaults to one per core
+    "api_host": ("API_HOST", str, "0.0.0.0"),
+    "api_workers": ("API_WORKERS", _optional(int), None),
+    "drain_timeout": ("DRAIN_TIMEOUT", float, 30.0),
+    # When set, app-tested.py calls the server here instead of starting the API itself
+    "api_url": ("API_URL", _optional(str), None),
+}
+
+# The Bedrock model and prompt differ per app and are set in code, not secrets
+MODEL_DEFAULTS = {
+    "bedrock_region": "us-east-1",
+    "model_id": "anthropic.claude-3-sonnet-20240229-v1:0",
+    "inference_config": {"maxTokens": 4096, "temperature": 0},
+    "additional_fields": {"top_k": 250},
+    "chunk_tokens": 8000,
+    "summary_prompt": "Understand context, key takeaways and summarize the sentences: ",
+}
+
+# Everything the pipeline reads from configuration, in one immutable object.
+# Build it with from_mapping (st.secrets, a parsed secrets.toml, os.environ)
+# or load_settings; _replace() gives a copy with some fields changed.
+Settings = namedtuple("Settings", list(SETTINGS) + list(MODEL_DEFAULTS),
+                      defaults=[default for _, _, default in SETTINGS.values()] + list(MODEL_DEFAULTS.values()))
+
+
+def from_mapping(mapping, **overrides):
+    values = {}
+    for field, (name, convert, _) in SETTINGS.items():
+        if name in mapping:
+            values[field] = convert(mapping[name])
+    values.update(overrides)
+    return Settings(**values)
+
+
+# .streamlit/secrets.toml, if it exists, overridden by environment variables
+# of the same names. For code that runs without Streamlit.
+def load_settings(path=".streamlit/secrets.toml", environ=os.environ, **overrides):
+    mapping = {}
+    if os.path.exists(path):
+        import tomllib
+
+        with open(path, "rb") as f:
+            mapping.update(tomllib.load(f))
+    mapping.update((name, environ[name]) for name, _, _ in SETTINGS.values() if name in environ)
+    return from_mapping(mapping, **overrides)
@@ -0,0 +1,319 @@
+import asyncio
+import threading
+import uuid
+from io import BytesIO
+
+from errors import SummarizationError, TranscriptionError, UploadError, reraise_as
+from job_tracker import job_timings
+from metrics import registry as metrics
+from transcript_result import speaker_settings, transcript_key
+
+# boto3, numpy and the transformers backends are imported where they are
+# first used, so importing this module (and every entry point) stays cheap;
+# `python benchmark.py --imports` checks that.
+
+
+# A part of the pipeline created on first use and then shared, like
+# st.cache_resource but per Pipeline. Creation runs under the pipeline's lock,
+# so threads that race for it get the same object.
+class component:
+    def __init__(self, create):
+        self.create = create
+        self.name = create.__name__
+
+    def __get__(self, pipeline, owner=None):
+        if pipeline is None:
+            return self
+        with pipeline._lock:
+            if self.name not in pipeline.__dict__:
+                pipeline.__dict__[self.name] = self.create(pipeline)
+            return pipeline.__dict__[self.name]
+
+
+# Upload -> Transcribe -> summarize, shared by the Streamlit apps, the API and
+# the batch CLI. Everything it needs comes from one Settings; the AWS
+# clients, job tracker, caches and backends are created on first use, and
+# each adds its stats to the metrics registry. Failures raise a
+# PipelineError for the stage that failed.
+class Pipeline:
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.RLock()
+
+    # Each client has its own connection pool, adaptive retries and timeouts;
+    # use clients.register() to swap in others, such as the fakes in fake_aws
+    @component
+    def clients(self):
+        from aws_clients import AWSClients
+
+        settings = self.settings
+        return AWSClients(
+            settings.aws_region,
+            aws_access_key_id=settings.aws_access_key_id,
+            aws_secret_access_key=settings.aws_secret_access_key,
+            service_regions={"bedrock-runtime": settings.bedrock_region} if settings.bedrock_region else None,
+            max_pool_connections=settings.max_pool_connections,
+        )
+
+    # One poller thread polls all outstanding Transcribe jobs
+    @component
+    def tracker(self):
+        from job_tracker import TranscriptionJobTracker
+
+        tracker = TranscriptionJobTracker(self.clients.transcribe)
+        metrics.add_source("stt_transcribe_tracker", lambda: dict(tracker.stats, pending=tracker.pending()),
+                           "Transcribe job tracker counters")
+        return tracker
+
+    # Transcripts keyed by audio hash, persisted across restarts. Changing a
+    # setting that affects the upload or the transcript starts a new namespace.
+    @component
+    def transcript_cache(self):
+        from cache import TranscriptCache, cache_path, settings_fingerprint
+
+        settings = self.settings
+        namespace = settings_fingerprint({
+            "transcription_backend": settings.transcription_backend,
+            "local_asr_model": settings.local_asr_model,
+            "segment_seconds": settings.segment_seconds,
+            "max_speakers": settings.max_speakers,
+            "trim_silence": settings.trim_silence,
+            "audio_codec": settings.audio_codec,
+        })
+        cache = TranscriptCache(path=cache_path("transcripts.sqlite"), namespace=namespace)
+        metrics.add_source("stt_transcript_cache", lambda: cache.stats, "Transcript cache lookups")
+        return cache
+
+    # Summaries keyed by prompt, transcript, model and inference settings
+    @component
+    def summary_cache(self):
+        from cache import SummaryCache, cache_path
+
+        cache = SummaryCache(path=cache_path("summaries.sqlite"))
+        metrics.add_source("stt_summary_cache", lambda: cache.stats, "Summary cache lookups")
+        return cache
+
+    # "bedrock" (map-reduce over converse) or "local" (transformers summarizer on CPU)
+    @component
+    def summarizer(self):
+        from summarization_backends import get_summarization_backend
+
+        settings = self.settings
+        bedrock_options = {
+            "bedrock_client": self.clients.bedrock,
+            "model_id": settings.model_id,
+            "inference_config": settings.inference_config,
+            "cache": self.summary_cache,
+            "chunk_tokens": settings.chunk_tokens,
+        }
+        if settings.additional_fields:
+            bedrock_options["additional_fields"] = settings.additional_fields
+        summarizer = get_summarization_backend(
+            settings.summarization_backend,
+            bedrock_options=bedrock_options,
+            local_options={"model": settings.local_summary_model, "cache": self.summary_cache},
+        )
+        metrics.add_source("stt_summary_usage", summarizer.usage.summary, "Summarization requests, tokens and latency")
+        return summarizer
+
+    # "aws" (S3 + Transcribe), "local" (transformers Whisper on CPU) or "auto"
+    # (local for short clips). SEGMENT_SECONDS > 0 splits long audio at
+    # silences into segments of about that length, transcribed
+    # SEGMENT_CONCURRENCY at a time.
+    @component
+    def transcription_backend(self):
+        from transcription_backends import get_transcription_backend
+
+        settings = self.settings
+        segment_options = None
+        if settings.segment_seconds > 0:
+            segment_options = {"segment_seconds": settings.segment_seconds,
+                               "max_concurrency": settings.segment_concurrency}
+        return get_transcription_backend(
+            settings.transcription_backend,
+            aws_options={"upload": self.upload_audio, "run_transcription": self.run_transcription,
+                         "run_transcription_async": self.run_transcription_async, "cache": self.transcript_cache},
+            local_options={"model": settings.local_asr_model},
+            segment_options=segment_options,
+        )
+
+    # Live transcription: "aws" (Transcribe Streaming) or "local"
+    @component
+    def streaming_backend(self):
+        from streaming_stt import get_streaming_backend
+
+        return get_streaming_backend(self.settings.streaming_backend, region=self.settings.aws_region)
+
+    # Background stages (see session_pipeline) run here
+    @component
+    def executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        return ThreadPoolExecutor(max_workers=self.settings.pipeline_workers, thread_name_prefix="pipeline")
+
+    # Part size and parallelism for uploads that run while recording
+    @component
+    def transfer_config(self):
+        from multipart_upload import transfer_config
+
+        return transfer_config(part_size_mb=self.settings.s3_part_size_mb,
+                               concurrency=self.settings.s3_upload_concurrency)
+
+    # Multipart uploads that are still receiving chunks, by upload id
+    @component
+    def upload_sessions(self):
+        from multipart_upload import UploadSessions
+
+        return UploadSessions()
+
+    @property
+    def bucket_name(self):
+        return self.settings.bucket_name
+
+    def upload_to_s3(self, audio_data, file_name):
+        with metrics.span("upload"), reraise_as(UploadError):
+            self.clients.s3.upload_fileobj(audio_data, self.bucket_name, file_name)
+
+    # Multipart upload to `key` that is written while the audio is still coming in
+    def open_uploader(self, key, **options):
+        from multipart_upload import IncrementalUploader
+
+        return IncrementalUploader(self.clients.s3, self.bucket_name, key, config=self.transfer_config, **options)
+
+    # Accepts raw bytes or a readable file object such as a spooled request body.
+    # WAV is downmixed to 16 kHz mono, stripped of silence unless TRIM_SILENCE is
+    # off and re-encoded with AUDIO_CODEC (flac, opus or wav); the key records
+    # the format and rate. Returns the S3 key, plus the trimming map if any.
+    def upload_audio(self, audio, digest):
+        from audio_io import audio_size, media_key, normalize_audio, wav_duration
+
+        metrics.record_audio("upload", audio_size(audio), wav_duration(audio))
+        with metrics.span("normalize"), reraise_as(UploadError):
+            normalized = normalize_audio(audio, codec=self.settings.audio_codec, trim=self.settings.trim_silence)
+        data = normalized.data
+        if isinstance(data, bytes):
+            data = BytesIO(data)
+        else:
+            data.seek(0)
+        file_name = media_key(f"audio/{digest}", normalized.media_format, normalized.sample_rate)
+        self.upload_to_s3(data, file_name)
+        if normalized.timestamps is None:
+            return file_name
+        metrics.observe("stt_silence_removed_seconds", normalized.seconds_removed, stage="upload")
+        return {'s3_key': file_name, 'speech_map': normalized.timestamps.to_dict(),
+                'silence_removed': normalized.seconds_removed}
+
+    def start_transcription(self, file_name):
+        from audio_io import media_settings
+
+        job_name = f"transcribe-job-{uuid.uuid4()}"
+        with metrics.span("job_start"), reraise_as(TranscriptionError):
+            self.clients.transcribe.start_transcription_job(
+                TranscriptionJobName=job_name,
+                Media={'MediaFileUri': f"s3://{self.bucket_name}/{file_name}"},
+                LanguageCode='en-US',
+                OutputBucketName=self.bucket_name,
+                OutputKey=transcript_key(job_name),
+                **media_settings(file_name),
+                **speaker_settings(self.settings.max_speakers)
+            )
+        return job_name
+
+    # (transcript, segments) from a finished job; also records how long
+    # Transcribe queued and ran it
+    def read_transcript(self, result):
+        from transcript_result import read_result
+
+        job = result['TranscriptionJob']
+        queued, running = job_timings(job)
+        metrics.record("transcribe_queue", queued)
+        metrics.record("transcribe_job", running)
+
+        if job['TranscriptionJobStatus'] != 'COMPLETED':
+            raise TranscriptionError(job.get('FailureReason') or "Transcription failed.", code="JobFailed")
+        # Written to our bucket, so it's read over the pooled S3 connections
+        with metrics.span("fetch"), reraise_as(TranscriptionError):
+            transcript = read_result(self.clients.s3, self.bucket_name, transcript_key(job['TranscriptionJobName']))
+        metrics.record_audio("fetch", seconds=transcript.duration)
+        return transcript.text, transcript.segment_index().to_dict()
+
+    # Returns (job_name, transcript, segments); raises TranscriptionError if the job fails
+    def run_transcription(self, file_name):
+        job_name = self.start_transcription(file_name)
+        with metrics.span("poll"), reraise_as(TranscriptionError):
+            result = self.tracker.track(job_name).result()
+        return (job_name,) + self.read_transcript(result)
+
+    # Awaits the tracker future so a request handler doesn't block the event loop while polling
+    async def run_transcription_async(self, file_name):
+        job_name = await asyncio.to_thread(self.start_transcription, file_name)
+        with metrics.span("poll"), reraise_as(TranscriptionError):
+            result = await self.tracker.track_async(job_name)
+        return (job_name,) + await asyncio.to_thread(self.read_transcript, result)
+
+    # (transcript, segments) for raw audio bytes or a file object with the
+    # configured backend (AWS results are cached by audio hash)
+    def transcribe_bytes(self, audio, digest=None):
+        with metrics.span("transcribe"), reraise_as(TranscriptionError):
+            return self.transcription_backend.transcribe_segments(audio, digest)
+
+    async def transcribe_bytes_async(self, audio, digest=None):
+        with metrics.span("transcribe"), reraise_as(TranscriptionError):
+            return await self.transcription_backend.transcribe_segments_async(audio, digest)
+
+    # (transcript, segments) for audio already in S3 at file_name, cached under its digest
+    def transcribe_uploaded(self, digest, file_name):
+        from transcription_backends import entry_transcript
+
+        with metrics.span("transcribe"), reraise_as(TranscriptionError):
+            return entry_transcript(self.transcript_cache.get_or_transcribe_stored(digest, file_name,
+                                                                                   self.run_transcription))
+
+    # S3 key of audio stored by upload_audio, or None: "audio/<sha256>", or
+    # "audio/<sha256>.<ext>" when the media format is known (audio_io.media_key)
+    def find_stored(self, digest):
+        stem = f"audio/{digest}"
+        response = self.clients.s3.list_objects_v2(Bucket=self.bucket_name, Prefix=stem, MaxKeys=10)
+        for item in response.get('Contents') or ():
+            if item['Key'] == stem or item['Key'].startswith(stem + "."):
+                return item['Key']
+        return None
+
+    # Audio the recorder already stored through the API, by its SHA-256
+    def transcribe_stored(self, digest):
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise TranscriptionError("Invalid audio key.", code="InvalidAudioKey")
+        from transcription_backends import entry_transcript
+
+        with metrics.span("transcribe"), reraise_as(TranscriptionError):
+            cached = self.transcript_cache.get(digest)
+            file_name = cached['s3_key'] if cached else self.find_stored(digest)
+            if file_name is None:
+                raise TranscriptionError("Audio not found.", code="AudioNotFound")
+            return entry_transcript(self.transcript_cache.get_or_transcribe_stored(digest, file_name,
+                                                                                   self.run_transcription))
+
+    def summarize_text(self, text):
+        with metrics.span("summarize"), reraise_as(SummarizationError):
+            return self.summarizer.summarize(text, self.settings.summary_prompt)
+
+    # Yields the summary as it is generated; timing stats are copied into `stats` at the end
+    def summarize_text_stream(self, text, stats=None):
+        with metrics.span("summarize"), reraise_as(SummarizationError):
+            stream = self.summarizer.summarize_stream(text, self.settings.summary_prompt)
+            yield from stream
+            if stats is not None:
+                stats.update(stream.stats())
+
+    # Stops the poller and worker threads of the parts created so far
+    def close(self):
+        with self._lock:
+            created = dict(self.__dict__)
+        if "tracker" in created:
+            created["tracker"].shutdown()
+        if "executor" in created:
+            created["executor"].shutdown(wait=False)
+        if "summarizer" in created:
+            created["summarizer"].close()
+        if "transcription_backend" in created:
+            created["transcription_backend"].close()
@@ -0,0 +1,68 @@
+# Standalone API server: the routes from stt_pipeline.api in several uvicorn
+# worker processes, so request handling scales with cores instead of sharing
+# the Streamlit script's process and GIL.
+#
+#   python -m stt_pipeline.server --workers 4 --port 8000
+#   gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b :8000 "stt_pipeline.server:create_server_app()"
+#
+# Settings come from .streamlit/secrets.toml and the environment (see
+# config.load_settings); STT_SECRETS points at another secrets file. The
+# workers share the transcript and summary caches and the job store through
+# SQLite files in STT_CACHE_DIR, so a job queued by one worker can be polled
+# through any other. On SIGTERM or SIGINT each worker stops accepting
+# connections, finishes its in-flight requests and gives queued jobs
+# DRAIN_TIMEOUT seconds to start before it exits.
+import argparse
+import os
+
+from stt_pipeline.config import load_settings
+
+# CLI options that override the matching setting in every worker process
+OVERRIDES = {"host": "API_HOST", "port": "API_PORT", "workers": "API_WORKERS", "drain_timeout": "DRAIN_TIMEOUT"}
+
+
+def server_settings():
+    return load_settings(os.getenv("STT_SECRETS", ".streamlit/secrets.toml"))
+
+
+def worker_count(settings):
+    return settings.api_workers or os.cpu_count() or 1
+
+
+# App factory run once in each worker process
+def create_server_app():
+    from cache import cache_path
+    from jobs import SQLiteJobStore
+    from stt_pipeline.api import create_app
+    from stt_pipeline.core import Pipeline
+
+    settings = server_settings()
+    return create_app(Pipeline(settings), job_store=SQLiteJobStore(cache_path("jobs.sqlite")),
+                      incremental_uploads=worker_count(settings) == 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the transcription and summarization API.")
+    parser.add_argument("--host", help="defaults to API_HOST (0.0.0.0)")
+    parser.add_argument("--port", type=int, help="defaults to API_PORT (8000)")
+    parser.add_argument("--workers", type=int, help="worker processes; defaults to API_WORKERS or one per core")
+    parser.add_argument("--drain-timeout", type=float,
+                        help="seconds queued jobs get to start on shutdown; defaults to DRAIN_TIMEOUT (30)")
+    args = parser.parse_args(argv)
+
+    # Workers load their settings themselves, so overrides go through the environment
+    for option, name in OVERRIDES.items():
+        value = getattr(args, option)
+        if value is not None:
+            os.environ[name] = str(value)
+    settings = server_settings()
+
+    import uvicorn
+
+    uvicorn.run("stt_pipeline.server:create_server_app", factory=True, host=settings.api_host,
+                port=settings.api_port, workers=worker_count(settings),
+                timeout_graceful_shutdown=int(settings.drain_timeout))
+
+
+if __name__ == "__main__":
+    main()
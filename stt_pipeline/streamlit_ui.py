@@ -0,0 +1,96 @@
+import time
+
+import streamlit as st
+
+from chunked_summary import describe_stats
+from stt_pipeline.config import from_mapping
+from transcript_result import segment_label
+
+
+# Settings from .streamlit/secrets.toml; keywords set the per-app fields
+# such as model_id and summary_prompt
+def streamlit_settings(**overrides):
+    return from_mapping(st.secrets, **overrides)
+
+
+# Timestamps and speakers under the transcript; the picked segment is where
+# the audio player starts (see seek_time)
+def show_segments(run):
+    with st.expander(f"Segments ({len(run.segments)})"):
+        st.selectbox("Play from", range(len(run.segments)), index=start_segment(run) or 0,
+                     format_func=lambda i: segment_label(run.segments[i]), key=f"segment-{run.file_id}")
+        st.dataframe(run.segments.records())
+
+
+# Seconds from ?t= in the URL, for links to a moment in the recording
+def linked_time():
+    try:
+        return float(st.query_params.get("t", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+# The segment picked under the transcript, else the one playing at the linked
+# time; None when there is neither
+def start_segment(run):
+    if run.segments is None:
+        return None
+    index = st.session_state.get(f"segment-{run.file_id}")
+    if index is None:
+        seconds = linked_time()
+        index = run.segments.at(seconds) if seconds is not None else None
+    return index if index is not None and index < len(run.segments) else None
+
+
+def seek_time(run):
+    index = start_segment(run)
+    return int(run.segments.starts[index]) if index is not None else 0
+
+
+# Transcribes once per input, then shows the transcript, the summary button and
+# the summary as it streams in. Returns True while a stage is still running.
+def show_pipeline(pipeline, run, transcribe, audio):
+    run.start_transcription(pipeline.executor, transcribe, audio)
+    run.poll()
+    if run.stage == "transcribing":
+        st.info(f"Transcribing audio... ({run.elapsed:.0f}s)")
+        return True
+    if run.stage == "failed":
+        st.error(f"Transcription failed: {run.error}")
+        if st.button("Retry", key=f"retry-{run.file_id}"):
+            run.retry()
+            st.rerun()
+        return False
+    if not run.transcript:
+        st.error("No transcript available.")
+        return False
+
+    st.subheader("Transcript")
+    transcript_area = st.text_area("Transcript", run.transcript, height=300, key=f"transcript-{run.file_id}")
+    if run.segments is not None and len(run.segments):
+        show_segments(run)
+    if st.button("Summarize Transcript", key=f"summarize-{run.file_id}"):
+        run.start_summary(pipeline.executor, pipeline.summarize_text_stream, transcript_area)
+        run.poll()
+
+    if run.stage == "summarizing":
+        st.subheader("Summary")
+        st.write(run.partial or "Summarizing...")
+        return True
+    if run.error:
+        st.error(f"Summarization failed: {run.error}")
+    if run.summary is not None:
+        st.subheader("Summary")
+        st.write(run.summary)
+        if run.stats:
+            st.caption(describe_stats(run.stats))
+        st.download_button("Download Summary", run.summary, file_name="summary.txt", mime="text/plain",
+                           key=f"download-{run.file_id}")
+    return False
+
+
+# Polls background stages by rerunning the script until they finish
+def rerun_while(running, interval=0.5):
+    if running:
+        time.sleep(interval)
+        st.rerun()
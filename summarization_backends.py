@@ -0,0 +1,54 @@
+import time
+
+from batching import BatchWorker
+from chunked_summary import ChunkedSummarizer, SummaryStream
+from transcription_backends import load_pipeline
+
+# Summarization backends share ChunkedSummarizer's interface:
+# summarize(text, prompt) -> str and summarize_stream(text, prompt) -> SummaryStream.
+BedrockSummarizer = ChunkedSummarizer
+
+
+# Offline summarization with a transformers summarization pipeline on CPU.
+# Encoder-decoder summarizers only read ~1024 tokens, so transcripts go through
+# the same map-reduce as Bedrock with a small chunk budget; concurrent chunk
+# and session requests are batched into one pipeline call by a BatchWorker.
+# These models are not instruction-tuned, so the prompt only feeds the cache key.
+class LocalSummarizer(ChunkedSummarizer):
+    def __init__(self, model="sshleifer/distilbart-cnn-12-6", device=-1, cache=None, chunk_tokens=700,
+                 max_length=200, min_length=30, batch_size=8, max_wait=0.05):
+        super().__init__(
+            None,
+            model_id=model,
+            inference_config={"max_length": max_length, "min_length": min_length},
+            cache=cache,
+            chunk_tokens=chunk_tokens,
+            max_workers=batch_size,
+        )
+        self.device = device
+        self.batch_size = batch_size
+        self.worker = BatchWorker(self._summarize_batch, max_batch_size=batch_size, max_wait=max_wait,
+                                  name="local-summarizer")
+
+    def _generate(self, prompt, text):
+        return self.worker.submit(text).result()
+
+    def _summarize_batch(self, texts):
+        pipe = load_pipeline("summarization", self.model_id, self.device)
+        results = pipe(texts, batch_size=self.batch_size, truncation=True, **self.inference_config)
+        return [result["summary_text"].strip() for result in results]
+
+    # The pipeline has no token stream; the finished summary arrives as one delta
+    def summarize_stream(self, text, prompt):
+        started = time.monotonic()
+        summary = self.summarize(text, prompt)
+        return SummaryStream([{"contentBlockDelta": {"delta": {"text": summary}}}], started)
+
+
+# name is "bedrock" or "local"; the options go to the matching class
+def get_summarization_backend(name, bedrock_options=None, local_options=None):
+    if name == "bedrock":
+        return BedrockSummarizer(**(bedrock_options or {}))
+    if name == "local":
+        return LocalSummarizer(**(local_options or {}))
+    raise ValueError(f"Unknown summarization backend: {name}")
@@ -0,0 +1,281 @@
+import json
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+# A stretch of the transcript; speaker is the Transcribe label (e.g. "spk_0")
+# or None without diarization
+Segment = namedtuple("Segment", ["start", "end", "text", "speaker"])
+
+SENTENCE_END = frozenset(".?!")
+NO_SPEAKER = -1
+
+
+# Where a job's output JSON is written in our bucket (OutputKey)
+def transcript_key(job_name, prefix="transcripts/"):
+    return f"{prefix}{job_name}.json"
+
+
+# start_transcription_job arguments for diarization; off below 2 speakers
+def speaker_settings(max_speakers):
+    if max_speakers < 2:
+        return {}
+    return {'Settings': {'ShowSpeakerLabels': True, 'MaxSpeakerLabels': min(int(max_speakers), 30)}}
+
+
+# "spk_0" -> "Speaker 1"; other labels are shown as they are
+def speaker_name(label):
+    if label and label.startswith("spk_") and label[4:].isdigit():
+        return f"Speaker {int(label[4:]) + 1}"
+    return label
+
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+# "[01:23] Speaker 1: text" for pickers and lists
+def segment_label(segment):
+    speaker = f"{speaker_name(segment.speaker)}: " if segment.speaker else ""
+    return f"[{format_timestamp(segment.start)}] {speaker}{segment.text}"
+
+
+# The transcript to show and summarize: one "Speaker N: ..." line per turn
+# when the segments carry speaker labels, otherwise the plain text
+def tagged_transcript(text, segments):
+    if segments is not None and segments.has_speakers:
+        return segments.tagged_text()
+    return text
+
+
+def read_result(s3_client, bucket, key):
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    return TranscriptResult.from_json(json.loads(body))
+
+
+# Compact form of a Transcribe result. Instead of one dict per item, tokens
+# are kept as parallel arrays: an index into a shared vocabulary, a
+# punctuation flag, start/end seconds and a speaker index. Punctuation takes
+# the end time and speaker of the word before it. The text and segments are
+# built from the arrays on demand.
+class TranscriptResult:
+    __slots__ = ("vocabulary", "token_ids", "is_punctuation", "starts", "ends", "speakers", "speaker_labels",
+                 "_text")
+
+    def __init__(self, vocabulary, token_ids, is_punctuation, starts, ends, speakers, speaker_labels=(),
+                 text=None):
+        self.vocabulary = vocabulary
+        self.token_ids = token_ids
+        self.is_punctuation = is_punctuation
+        self.starts = starts
+        self.ends = ends
+        self.speakers = speakers
+        self.speaker_labels = list(speaker_labels)
+        self._text = text
+
+    @classmethod
+    def from_json(cls, data):
+        results = data["results"]
+        items = results.get("items") or ()
+        vocabulary, token_index, labels = [], {}, {}
+        token_ids, is_punctuation = array("I"), array("b")
+        starts, ends, speakers = array("d"), array("d"), array("h")
+
+        # Older outputs only list speakers under speaker_labels.segments
+        speaker_at = {}
+        if items and "speaker_label" not in items[0]:
+            for segment in (results.get("speaker_labels") or {}).get("segments", ()):
+                for item in segment.get("items", ()):
+                    speaker_at[item["start_time"]] = item["speaker_label"]
+
+        for item in items:
+            content = item["alternatives"][0]["content"]
+            if content not in token_index:
+                token_index[content] = len(vocabulary)
+                vocabulary.append(content)
+            token_ids.append(token_index[content])
+            punctuation = item["type"] == "punctuation"
+            is_punctuation.append(punctuation)
+            if punctuation:
+                end = ends[-1] if ends else 0.0
+                starts.append(end)
+                ends.append(end)
+                speakers.append(speakers[-1] if speakers else NO_SPEAKER)
+            else:
+                starts.append(float(item["start_time"]))
+                ends.append(float(item["end_time"]))
+                label = item.get("speaker_label") or speaker_at.get(item["start_time"])
+                speakers.append(labels.setdefault(label, len(labels)) if label else NO_SPEAKER)
+
+        # The transcript string is only kept when there are no items to rebuild it from
+        transcripts = results.get("transcripts") or [{}]
+        text = None if items else transcripts[0].get("transcript", "")
+        return cls(vocabulary, token_ids, is_punctuation, starts, ends, speakers, labels, text)
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._join(0, len(self))
+        return self._text
+
+    @property
+    def duration(self):
+        return self.ends[-1] if len(self) else 0.0
+
+    def segment_index(self, max_gap=1.5):
+        return SegmentIndex.from_segments(self.segments(max_gap))
+
+    # Sentences, also split at pauses longer than max_gap seconds and where the speaker changes
+    def segments(self, max_gap=1.5):
+        def boundary(i, previous):
+            return (self.is_punctuation[previous] and self.vocabulary[self.token_ids[previous]] in SENTENCE_END
+                    or self.starts[i] - self.ends[previous] > max_gap
+                    or self.speakers[i] != self.speakers[previous])
+        return self._runs(boundary)
+
+    def _runs(self, boundary):
+        start = 0
+        for i in range(1, len(self) + 1):
+            if i == len(self) or not self.is_punctuation[i] and boundary(i, i - 1):
+                if start < i:
+                    yield Segment(self.starts[start], self.ends[i - 1], self._join(start, i), self._speaker(start))
+                start = i
+
+    def _join(self, start, stop):
+        parts = []
+        for i in range(start, stop):
+            if parts and not self.is_punctuation[i]:
+                parts.append(" ")
+            parts.append(self.vocabulary[self.token_ids[i]])
+        return "".join(parts)
+
+    def _speaker(self, i):
+        index = self.speakers[i]
+        return self.speaker_labels[index] if index != NO_SPEAKER else None
+
+
+# Timestamped segments (sentences or turns) kept as parallel arrays: start and
+# end seconds, a speaker index and offsets into one string holding all the
+# segment texts. Segments are in time order, so at() is a bisect over starts.
+class SegmentIndex:
+    __slots__ = ("starts", "ends", "speakers", "speaker_labels", "offsets", "texts")
+
+    def __init__(self, starts, ends, speakers, speaker_labels, offsets, texts):
+        self.starts = starts
+        self.ends = ends
+        self.speakers = speakers
+        self.speaker_labels = list(speaker_labels)
+        self.offsets = offsets
+        self.texts = texts
+
+    @classmethod
+    def from_segments(cls, segments):
+        starts, ends, speakers, offsets = array("d"), array("d"), array("h"), array("I", [0])
+        labels, texts, length = {}, [], 0
+        for segment in segments:
+            starts.append(segment.start)
+            ends.append(segment.end)
+            speakers.append(labels.setdefault(segment.speaker, len(labels)) if segment.speaker else NO_SPEAKER)
+            texts.append(segment.text)
+            length += len(segment.text)
+            offsets.append(length)
+        return cls(starts, ends, speakers, labels, offsets, "".join(texts))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError("segment index out of range")
+        i %= len(self)
+        speaker = self.speakers[i]
+        return Segment(self.starts[i], self.ends[i], self.texts[self.offsets[i]:self.offsets[i + 1]],
+                       self.speaker_labels[speaker] if speaker != NO_SPEAKER else None)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def has_speakers(self):
+        return bool(self.speaker_labels)
+
+    # Index of the segment playing at `seconds`: the last one starting at or
+    # before it, so pauses belong to the passage before them. None before the first.
+    def at(self, seconds):
+        i = bisect_right(self.starts, seconds) - 1
+        return i if i >= 0 else None
+
+    # One line per speaker turn ("Speaker 1: ..."), merging consecutive
+    # segments of the same speaker; the plain text without diarization
+    def tagged_text(self):
+        if not self.has_speakers:
+            return " ".join(segment.text for segment in self)
+        lines, speaker = [], object()
+        for segment in self:
+            if segment.speaker == speaker:
+                lines[-1] += " " + segment.text
+            else:
+                speaker = segment.speaker
+                lines.append(f"{speaker_name(speaker) or 'Unknown'}: {segment.text}")
+        return "\n".join(lines)
+
+    # Times moved onto another timeline: mapper.to_original() takes an array
+    # of seconds (e.g. vad.TimestampMap, to undo silence trimming)
+    def to_original(self, mapper):
+        starts = array("d", mapper.to_original(self.starts))
+        ends = array("d", mapper.to_original(self.ends))
+        return SegmentIndex(starts, ends, self.speakers, self.speaker_labels, self.offsets, self.texts)
+
+    # Column-wise and JSON-serialisable, for the transcript cache
+    def to_dict(self):
+        return {"starts": self.starts.tolist(), "ends": self.ends.tolist(), "speakers": self.speakers.tolist(),
+                "speaker_labels": self.speaker_labels, "offsets": self.offsets.tolist(), "texts": self.texts}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(array("d", data["starts"]), array("d", data["ends"]), array("h", data["speakers"]),
+                   data["speaker_labels"], array("I", data["offsets"]), data["texts"])
+
+    # One dict per segment, for API responses
+    def records(self):
+        return [{"start": round(segment.start, 3), "end": round(segment.end, 3), "speaker": segment.speaker,
+                 "text": segment.text} for segment in self]
+
+    # Indexes of consecutive pieces of one recording, each with the offset in
+    # seconds where its audio starts. Where pieces overlap, segments that
+    # start before the previous piece's last segment ended are dropped.
+    @classmethod
+    def join(cls, parts):
+        def segments():
+            last_end = float("-inf")
+            for offset, index in parts:
+                for segment in index:
+                    if segment.start + offset >= last_end:
+                        yield segment._replace(start=segment.start + offset, end=segment.end + offset)
+                last_end = max(last_end, index.ends[-1] + offset) if len(index) else last_end
+        return cls.from_segments(segments())
+
+
+if __name__ == "__main__":
+    # Offline check of SegmentIndex.at(): python transcript_result.py
+    index = SegmentIndex.from_segments([
+        Segment(1.0, 2.0, "One.", "spk_0"),
+        Segment(2.0, 3.5, "Two.", "spk_1"),  # starts where the first ends
+        Segment(5.0, 6.0, "Three.", "spk_0"),  # after a 1.5 s pause
+    ])
+    cases = [
+        (0.0, None), (0.999, None),  # before the first segment
+        (1.0, 0), (1.5, 0),  # at and inside the first
+        (2.0, 1),  # a shared boundary belongs to the segment starting there
+        (3.5, 1), (4.0, 1), (4.999, 1),  # the exact end, and the pause after it
+        (5.0, 2), (6.0, 2), (60.0, 2),  # the last segment, its end and beyond
+    ]
+    for seconds, expected in cases:
+        assert index.at(seconds) == expected, (seconds, index.at(seconds), expected)
+    assert SegmentIndex.from_segments([]).at(1.0) is None
+    print(f"SegmentIndex.at ok ({len(cases) + 1} cases)")
@@ -0,0 +1,266 @@
+import asyncio
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_io import decode_audio, decode_wav, encode_audio, is_wav, pcm16_to_float, read_all, resample, wav_duration
+from batching import BatchWorker
+from cache import audio_hash, upload_entry
+from segments import plan_segments, stitch_transcripts
+from transcript_result import Segment, SegmentIndex
+from vad import TimestampMap, trim_silence
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+# Transformers pipelines are loaded once per process and shared
+def load_pipeline(task, model, device=-1):
+    key = (task, model, device)
+    with _pipelines_lock:
+        if key not in _pipelines:
+            from transformers import pipeline
+
+            _pipelines[key] = pipeline(task, model=model, device=device)
+        return _pipelines[key]
+
+
+# A transcription backend turns audio (bytes or a readable file object) into
+# transcript text and raises when it can't. `digest` is the audio's SHA-256
+# when the caller already has it. transcribe_segments also returns a
+# SegmentIndex of timestamped (and, with diarization, speaker-labelled)
+# segments, or None when the backend has no timings. The async variants are
+# for event-loop callers.
+class TranscriptionBackend:
+    def transcribe(self, audio, digest=None):
+        return self.transcribe_segments(audio, digest)[0]
+
+    def transcribe_segments(self, audio, digest=None):
+        raise NotImplementedError
+
+    async def transcribe_async(self, audio, digest=None):
+        return (await self.transcribe_segments_async(audio, digest))[0]
+
+    async def transcribe_segments_async(self, audio, digest=None):
+        return await asyncio.to_thread(self.transcribe_segments, audio, digest)
+
+    # Releases threads the backend started; nothing by default
+    def close(self):
+        pass
+
+
+# (text, SegmentIndex or None) from a transcript cache entry. Segment times
+# are moved back onto the original recording when silence was trimmed.
+def entry_transcript(entry):
+    segments = entry.get('segments')
+    if segments is None:
+        return entry['transcript'], None
+    segments = SegmentIndex.from_dict(segments)
+    if entry.get('speech_map'):
+        segments = segments.to_original(TimestampMap.from_dict(entry['speech_map']))
+    return entry['transcript'], segments
+
+
+# The batch Transcribe path: upload(audio, digest) puts the audio in S3 and
+# returns its key, and run_transcription(file_name) returns
+# (job_name, transcript, segments) with segments a SegmentIndex.to_dict() or
+# None. Results go through the transcript cache when one is given.
+class AWSTranscriptionBackend(TranscriptionBackend):
+    def __init__(self, upload, run_transcription, run_transcription_async=None, cache=None):
+        self.upload = upload
+        self.run_transcription = run_transcription
+        self.run_transcription_async = run_transcription_async
+        self.cache = cache
+
+    def transcribe_segments(self, audio, digest=None):
+        if self.cache is not None:
+            return entry_transcript(self.cache.get_or_transcribe(audio, self.upload, self.run_transcription, digest))
+        entry = upload_entry(self.upload(audio, digest or audio_hash(audio)))
+        _, transcript, segments = self.run_transcription(entry['s3_key'])
+        return entry_transcript(dict(entry, transcript=transcript, segments=segments))
+
+    async def transcribe_segments_async(self, audio, digest=None):
+        if self.run_transcription_async is None:
+            return await super().transcribe_segments_async(audio, digest)
+        if self.cache is not None:
+            return entry_transcript(await self.cache.get_or_transcribe_async(
+                audio, self.upload, self.run_transcription_async, digest))
+        digest = digest or await asyncio.to_thread(audio_hash, audio)
+        entry = upload_entry(await asyncio.to_thread(self.upload, audio, digest))
+        _, transcript, segments = await self.run_transcription_async(entry['s3_key'])
+        return entry_transcript(dict(entry, transcript=transcript, segments=segments))
+
+
+# Offline transcription with a transformers ASR pipeline on CPU. Long audio is
+# cut into chunk_length_s windows that overlap by stride_length_s on each side
+# and stitched by the pipeline; requests that arrive together are run as one
+# batch so concurrent sessions share the model instead of queueing on it.
+# Silence is cut out of WAV input first unless trim_silence is off.
+# return_timestamps is passed to the pipeline for segment timings: True for
+# Whisper models, "word" for CTC models, False to skip them.
+class LocalTranscriptionBackend(TranscriptionBackend):
+    def __init__(self, model="openai/whisper-base.en", device=-1, chunk_length_s=30, stride_length_s=5,
+                 batch_size=8, max_wait=0.05, sample_rate=16000, trim_silence=True, return_timestamps=True):
+        self.model = model
+        self.device = device
+        self.chunk_length_s = chunk_length_s
+        self.stride_length_s = stride_length_s
+        self.batch_size = batch_size
+        self.sample_rate = sample_rate
+        self.trim_silence = trim_silence
+        self.return_timestamps = return_timestamps
+        self.worker = BatchWorker(self._transcribe_batch, max_batch_size=batch_size, max_wait=max_wait,
+                                  name="local-asr")
+
+    def transcribe_segments(self, audio, digest=None):
+        inputs, timestamps = self._prepare(read_all(audio))
+        text, chunks = self.worker.submit(inputs).result()
+        if not chunks:
+            return text, None
+        segments = SegmentIndex.from_segments(Segment(start, end, chunk_text, None) for start, end, chunk_text in chunks)
+        return text, segments.to_original(timestamps) if timestamps is not None else segments
+
+    # Pipeline input and the map back to the original timeline when silence was cut
+    def _prepare(self, audio_data):
+        if not is_wav(audio_data):
+            # Other containers are decoded by the pipeline itself (needs ffmpeg)
+            return audio_data, None
+        samples, rate = decode_wav(audio_data)
+        samples = resample(samples, rate, self.sample_rate)
+        timestamps = None
+        if self.trim_silence:
+            samples, timestamps, _ = trim_silence(samples, self.sample_rate)
+        return {"raw": pcm16_to_float(samples), "sampling_rate": self.sample_rate}, timestamps
+
+    def _transcribe_batch(self, inputs):
+        pipe = load_pipeline("automatic-speech-recognition", self.model, self.device)
+        options = {"return_timestamps": self.return_timestamps} if self.return_timestamps else {}
+        results = pipe(
+            inputs,
+            batch_size=self.batch_size,
+            chunk_length_s=self.chunk_length_s,
+            stride_length_s=self.stride_length_s,
+            **options,
+        )
+        return [(result["text"].strip(), _chunk_timings(result.get("chunks") or ())) for result in results]
+
+
+# (start, end, text) from pipeline chunks; an open end (the last chunk) is
+# closed at its start
+def _chunk_timings(chunks):
+    timings = []
+    for chunk in chunks:
+        start, end = chunk["timestamp"]
+        start = start or 0.0
+        if chunk["text"].strip():
+            timings.append((start, end if end is not None else start, chunk["text"].strip()))
+    return timings
+
+
+# Sends short clips to the local model and everything else to AWS
+class RoutingTranscriptionBackend(TranscriptionBackend):
+    def __init__(self, local, remote, max_local_seconds=60):
+        self.local = local
+        self.remote = remote
+        self.max_local_seconds = max_local_seconds
+
+    def _pick(self, audio):
+        duration = wav_duration(audio)
+        if duration is not None and duration <= self.max_local_seconds:
+            return self.local
+        return self.remote
+
+    def transcribe_segments(self, audio, digest=None):
+        return self._pick(audio).transcribe_segments(audio, digest)
+
+    async def transcribe_segments_async(self, audio, digest=None):
+        return await self._pick(audio).transcribe_segments_async(audio, digest)
+
+    def close(self):
+        self.local.close()
+        self.remote.close()
+
+
+# Splits audio longer than min_seconds (1.5 segments by default) at quiet
+# points into overlapping segments, transcribes up to max_concurrency of them
+# at once with the wrapped backend and stitches the results, so a long file
+# takes about as long as its slowest segment. Audio that can't be decoded
+# here goes to the wrapped backend whole. Speaker labels come from separate
+# jobs, so "spk_0" in one segment isn't necessarily "spk_0" in the next.
+class SegmentedTranscriptionBackend(TranscriptionBackend):
+    def __init__(self, backend, segment_seconds=600, overlap_seconds=2.0, max_concurrency=4, min_seconds=None):
+        self.backend = backend
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        self.max_concurrency = max_concurrency
+        self.min_seconds = min_seconds or 1.5 * segment_seconds
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="segment")
+
+    # (start in seconds, WAV bytes) for each segment, with the bytes encoded
+    # lazily so only the segments in flight are held in memory; None when the
+    # audio isn't split
+    def _split(self, audio):
+        duration = wav_duration(audio)
+        if duration is not None and duration < self.min_seconds:
+            return None
+        try:
+            samples, rate = decode_audio(read_all(audio))
+        except (ValueError, ImportError, wave.Error, EOFError):
+            return None
+        if len(samples) < self.min_seconds * rate:
+            return None
+        plan = plan_segments(samples, rate, self.segment_seconds, self.overlap_seconds)
+        return [(start / rate, lambda start=start, end=end: encode_audio(samples[start:end], rate, "wav")[0])
+                for start, end in plan]
+
+    def transcribe_segments(self, audio, digest=None):
+        segments = self._split(audio)
+        if segments is None:
+            return self.backend.transcribe_segments(audio, digest)
+        results = self.pool.map(lambda segment: self.backend.transcribe_segments(segment[1]()), segments)
+        return self._stitch(segments, list(results))
+
+    async def transcribe_segments_async(self, audio, digest=None):
+        segments = await asyncio.to_thread(self._split, audio)
+        if segments is None:
+            return await self.backend.transcribe_segments_async(audio, digest)
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def transcribe_segment(segment):
+            async with limit:
+                return await self.backend.transcribe_segments_async(await asyncio.to_thread(segment[1]))
+
+        return self._stitch(segments, await asyncio.gather(*map(transcribe_segment, segments)))
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.backend.close()
+
+    def _stitch(self, segments, results):
+        text = stitch_transcripts([segment_text for segment_text, _ in results])
+        if any(index is None for _, index in results):
+            return text, None
+        return text, SegmentIndex.join([(start, index) for (start, _), (_, index) in zip(segments, results)])
+
+
+# name is "aws", "local" or "auto" (local for short WAV clips, AWS otherwise).
+# aws_options are passed to AWSTranscriptionBackend, local_options to
+# LocalTranscriptionBackend. With segment_options the backend is wrapped in
+# SegmentedTranscriptionBackend.
+def get_transcription_backend(name, aws_options=None, local_options=None, max_local_seconds=60,
+                              segment_options=None):
+    if name == "aws":
+        backend = AWSTranscriptionBackend(**(aws_options or {}))
+    elif name == "local":
+        backend = LocalTranscriptionBackend(**(local_options or {}))
+    elif name == "auto":
+        backend = RoutingTranscriptionBackend(
+            LocalTranscriptionBackend(**(local_options or {})),
+            AWSTranscriptionBackend(**(aws_options or {})),
+            max_local_seconds=max_local_seconds,
+        )
+    else:
+        raise ValueError(f"Unknown transcription backend: {name}")
+    if segment_options:
+        return SegmentedTranscriptionBackend(backend, **segment_options)
+    return backend
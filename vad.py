@@ -0,0 +1,148 @@
+from collections import deque, namedtuple
+
+import numpy as np
+
+# Trimmed int16 samples, the map back to the original timeline and how much
+# audio was cut
+TrimmedAudio = namedtuple("TrimmedAudio", ["samples", "timestamps", "seconds_removed"])
+
+# Frames are converted to float in blocks of this many to bound memory
+BLOCK_FRAMES = 8192
+
+
+# Mean energy of each frame_len-sample frame in dBFS. A trailing partial
+# frame is ignored.
+def frame_energy_db(samples, frame_len):
+    count = len(samples) // frame_len
+    frames = samples[:count * frame_len].reshape(count, frame_len)
+    energy = np.empty(count, dtype=np.float32)
+    for start in range(0, count, BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES].astype(np.float32)
+        energy[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+    return 10 * np.log10(energy / (frame_len * 32768.0 ** 2) + 1e-10)
+
+
+# Energy-based voice activity detection over whole recordings. Frames louder
+# than the noise floor (10th percentile) plus margin_db count as speech; the
+# threshold is clamped to [min_db, max_db] so near-silent and wall-to-wall
+# speech recordings behave. Speech is padded by `padding` seconds on both
+# sides and gaps shorter than min_silence are kept. Returns an (n, 2) array of
+# [start, end) sample offsets.
+def detect_speech(samples, sample_rate, frame_ms=30, margin_db=12.0, min_db=-60.0, max_db=-35.0,
+                  min_silence=0.5, padding=0.2):
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    if len(samples) < frame_len:
+        return np.array([[0, len(samples)]], dtype=np.int64)
+    levels = frame_energy_db(samples, frame_len)
+    threshold = np.clip(np.percentile(levels, 10) + margin_db, min_db, max_db)
+    speech = levels > threshold
+
+    pad = int(round(padding * 1000 / frame_ms))
+    if pad:
+        speech = np.convolve(speech, np.ones(2 * pad + 1, dtype=np.int32), mode="same") > 0
+
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # Merge regions separated by less than min_silence
+    keep = starts[1:] - ends[:-1] >= int(round(min_silence * 1000 / frame_ms))
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+
+    regions = np.stack((starts, ends), axis=1).astype(np.int64) * frame_len
+    if ends[-1] == len(speech):
+        # The partial frame at the end follows the last full one
+        regions[-1, 1] = len(samples)
+    return regions
+
+
+# Drops the silence between speech regions. Audio without any detected
+# speech is returned unchanged, since an empty upload would only fail later.
+def trim_silence(samples, sample_rate, **options):
+    regions = detect_speech(samples, sample_rate, **options)
+    if len(regions) == 0:
+        regions = np.array([[0, len(samples)]], dtype=np.int64)
+    trimmed = np.concatenate([samples[start:end] for start, end in regions])
+    removed = (len(samples) - len(trimmed)) / sample_rate
+    return TrimmedAudio(trimmed, TimestampMap(regions, sample_rate), removed)
+
+
+# Maps times in trimmed audio back to the original recording. `regions` are
+# the [start, end) sample offsets of the original that were kept, in order.
+class TimestampMap:
+    def __init__(self, regions, sample_rate):
+        self.regions = np.asarray(regions, dtype=np.int64).reshape(-1, 2)
+        self.sample_rate = sample_rate
+        lengths = self.regions[:, 1] - self.regions[:, 0]
+        self.trimmed_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+
+    # Seconds in the trimmed audio (scalar or array) -> seconds in the original
+    def to_original(self, seconds):
+        if len(self.regions) == 0:
+            return seconds
+        position = np.asarray(seconds, dtype=np.float64) * self.sample_rate
+        index = np.clip(np.searchsorted(self.trimmed_starts, position, side="right") - 1, 0, len(self.regions) - 1)
+        original = (self.regions[index, 0] + position - self.trimmed_starts[index]) / self.sample_rate
+        return float(original) if original.ndim == 0 else original
+
+    def to_dict(self):
+        return {"sample_rate": self.sample_rate, "regions": self.regions.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["regions"], data["sample_rate"])
+
+
+# Frame-by-frame version of trim_silence for audio that is still being
+# captured, where the noise floor isn't known yet: frames above threshold_db
+# open the gate, which stays open for min_silence seconds after the last one.
+# `padding` seconds before speech are kept from a small pre-roll buffer.
+class SilenceGate:
+    def __init__(self, sample_rate, threshold_db=-45.0, frame_ms=30, min_silence=0.5, padding=0.2):
+        self.sample_rate = sample_rate
+        self.threshold_db = threshold_db
+        self.frame_len = max(1, int(sample_rate * frame_ms / 1000))
+        self.hangover = int(round(min_silence * 1000 / frame_ms))
+        self.preroll = deque(maxlen=int(round(padding * 1000 / frame_ms)))
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.position = 0
+        self.quiet_frames = self.hangover + 1
+        self.regions = []
+
+    # int16 samples in, the int16 samples to keep out
+    def process(self, samples):
+        samples = np.concatenate((self.pending, samples))
+        count = len(samples) // self.frame_len
+        self.pending = samples[count * self.frame_len:]
+        frames = samples[:count * self.frame_len].reshape(count, self.frame_len)
+        kept = []
+        for frame, level in zip(frames, frame_energy_db(samples, self.frame_len)):
+            self.quiet_frames = 0 if level > self.threshold_db else self.quiet_frames + 1
+            if self.quiet_frames <= self.hangover:
+                if self.preroll:
+                    kept.extend(self.preroll)
+                    self._keep(self.position - len(self.preroll) * self.frame_len, len(self.preroll) * self.frame_len)
+                    self.preroll.clear()
+                kept.append(frame)
+                self._keep(self.position, self.frame_len)
+            else:
+                self.preroll.append(frame)
+            self.position += self.frame_len
+        return np.concatenate(kept) if kept else np.zeros(0, dtype=np.int16)
+
+    def _keep(self, start, length):
+        if self.regions and self.regions[-1][1] == start:
+            self.regions[-1][1] = start + length
+        else:
+            self.regions.append([start, start + length])
+
+    @property
+    def seconds_removed(self):
+        kept = sum(end - start for start, end in self.regions)
+        return (self.position - kept) / self.sample_rate
+
+    def timestamps(self):
+        return TimestampMap(self.regions, self.sample_rate)